@@ -0,0 +1,250 @@
+"""
+Minimal writer of uncompressed ZISRAW (CZI) files for tests.
+
+Only the segments read by czifile are written: file header, subblocks,
+subblock directory and metadata. Image data is tiled into mosaic subblocks and
+optional pyramid levels are stored as downsampled subblocks, like ZEN does
+for large slide scans. Tiles are sliced from the image one at a time and
+written as they are made, so lazy array-likes larger than memory can be
+written.
+"""
+import struct
+import uuid
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+CZI_PIXEL_TYPES = {
+    (np.dtype(np.uint8), 1): 0,
+    (np.dtype(np.uint16), 1): 1,
+    (np.dtype(np.float32), 1): 2,
+    (np.dtype(np.uint8), 3): 3,
+    (np.dtype(np.uint16), 3): 4,
+}
+
+SEGMENT_ALIGNMENT = 32
+
+
+def _segment(sid: bytes, data: bytes, allocated_size: Optional[int] = None) -> bytes:
+    used_size = len(data)
+    if allocated_size is None:
+        allocated_size = -(-used_size // SEGMENT_ALIGNMENT) * SEGMENT_ALIGNMENT
+    header = struct.pack("<16sqq", sid.ljust(16, b"\0"), allocated_size, used_size)
+    return header + data + b"\0" * (allocated_size - used_size)
+
+
+def _directory_entry(
+    pixel_type: int,
+    file_position: int,
+    pyramid_type: int,
+    dims: Sequence[Tuple[str, int, int, int]],
+) -> bytes:
+    # dims are given in C order (slowest first), CZI stores them X first
+    entry = struct.pack(
+        "<2siqiiBB4si",
+        b"DV",
+        pixel_type,
+        file_position,
+        0,
+        0,
+        pyramid_type,
+        0,
+        b"\0" * 4,
+        len(dims),
+    )
+    for dim, start, size, stored_size in reversed(dims):
+        entry += struct.pack(
+            "<4siifi", dim.encode().ljust(4, b"\0"), start, size, 0.0, stored_size
+        )
+    return entry
+
+
+def _metadata_xml(
+    pixel_spacing: float, channel_names: List[str], rgb: bool, n_scenes: int
+) -> str:
+    channels = "".join(
+        f'<Channel Id="Channel:{idx}" Name="{name}"><ShortName>{name}</ShortName>'
+        f"<Color>#FFFFFFFF</Color></Channel>"
+        for idx, name in enumerate(channel_names)
+    )
+    pixel_type = "Bgr24" if rgb else "Gray"
+    spacing_m = pixel_spacing / 1000000
+    return (
+        "<ImageDocument><Metadata>"
+        "<Information><Image>"
+        f"<PixelType>{pixel_type}</PixelType><SizeS>{n_scenes}</SizeS>"
+        "</Image></Information>"
+        "<Scaling><Items>"
+        f'<Distance Id="X"><Value>{spacing_m}</Value></Distance>'
+        f'<Distance Id="Y"><Value>{spacing_m}</Value></Distance>'
+        "</Items></Scaling>"
+        f"<DisplaySetting><Channels>{channels}</Channels></DisplaySetting>"
+        "</Metadata></ImageDocument>"
+    )
+
+
+def _tile_subblocks(
+    image: Any,
+    scene_idx: int,
+    scene_origin: Tuple[int, int],
+    tile_size: int,
+    ds_factor: int,
+    rgb: bool,
+):
+    """Yield (dims, tile data) of all tiles of one scene at one pyramid level"""
+    if rgb:
+        full_y, full_x = image.shape[:2]
+        n_ch = 1
+    else:
+        full_y, full_x = image.shape[1:]
+        n_ch = image.shape[0]
+
+    level_y, level_x = -(-full_y // ds_factor), -(-full_x // ds_factor)
+    for ch_idx in range(n_ch):
+        for y in range(0, level_y, tile_size):
+            for x in range(0, level_x, tile_size):
+                # tiles are strided from the base image, one at a time
+                tile_yx = (
+                    slice(y * ds_factor, (y + tile_size) * ds_factor, ds_factor),
+                    slice(x * ds_factor, (x + tile_size) * ds_factor, ds_factor),
+                )
+                if rgb:
+                    tile = np.asarray(image[tile_yx])
+                    stored_y, stored_x = tile.shape[:2]
+                else:
+                    tile = np.asarray(image[(ch_idx,) + tile_yx])
+                    stored_y, stored_x = tile.shape
+
+                start_y = y * ds_factor
+                start_x = x * ds_factor
+                size_y = min(stored_y * ds_factor, full_y - start_y)
+                size_x = min(stored_x * ds_factor, full_x - start_x)
+                dims = [
+                    ("B", 0, 1, 1),
+                    ("S", scene_idx, 1, 1),
+                    ("C", ch_idx, 1, 1),
+                    ("Y", scene_origin[0] + start_y, size_y, stored_y),
+                    ("X", scene_origin[1] + start_x, size_x, stored_x),
+                ]
+                yield dims, tile
+
+
+def write_czi(
+    output_fp: Union[str, Path],
+    image: Union[np.ndarray, List[np.ndarray], Any],
+    pixel_spacing: float = 0.65,
+    channel_names: Optional[List[str]] = None,
+    tile_size: int = 256,
+    pyramid_factors: Sequence[int] = (),
+    scene_origins: Optional[List[Tuple[int, int]]] = None,
+) -> Path:
+    """
+    Write an uncompressed, tiled CZI file readable by czifile.
+
+    Parameters
+    ----------
+    output_fp: str or Path
+        file path of the CZI
+    image: np.ndarray or list of np.ndarray
+        image data as (C, Y, X) for multi-channel data or (Y, X, 3) RGB data,
+        a list of arrays is written as one scene per array. Any array-like
+        with `shape`, `dtype` and strided slicing can be given.
+    pixel_spacing: float
+        pixel spacing in microns
+    channel_names: list of str
+        name of each channel, defaults to C01, C02, ...
+    tile_size: int
+        stored size of the mosaic tiles in pixels
+    pyramid_factors: sequence of int
+        downsampling factors of the stored pyramid levels, e.g. (2, 4),
+        pyramid tiles are taken by striding the base image
+    scene_origins: list of tuple of int
+        (y, x) origin of each scene in the global coordinate system,
+        scenes are placed side by side along x by default
+
+    Returns
+    -------
+    output_fp: Path
+        file path of the CZI
+    """
+    scenes = image if isinstance(image, list) else [image]
+    rgb = scenes[0].ndim == 3 and scenes[0].shape[-1] == 3
+    n_ch = 1 if rgb else scenes[0].shape[0]
+    pixel_type = CZI_PIXEL_TYPES[(np.dtype(scenes[0].dtype), 3 if rgb else 1)]
+
+    if channel_names is None:
+        channel_names = (
+            ["C01 - RGB"] if rgb else [f"C{idx + 1:02d}" for idx in range(n_ch)]
+        )
+
+    if scene_origins is None:
+        scene_origins = []
+        x_origin = 0
+        for scene in scenes:
+            scene_origins.append((0, x_origin))
+            x_origin += scene.shape[1] if rgb else scene.shape[2]
+
+    def subblocks():
+        for factor in [1, *pyramid_factors]:
+            for scene_idx, (scene, origin) in enumerate(zip(scenes, scene_origins)):
+                for dims, tile in _tile_subblocks(
+                    scene, scene_idx, origin, tile_size, factor, rgb
+                ):
+                    yield dims, tile, 0 if factor == 1 else 2
+
+    file_header_size = 512 + 32
+    output_fp = Path(output_fp)
+    with open(output_fp, "wb") as f:
+        # the header, which locates the directory and metadata, is written last
+        f.write(b"\0" * file_header_size)
+        position = file_header_size
+        directory = []
+        for mosaic_idx, (dims, tile, pyramid_type) in enumerate(subblocks()):
+            # only base tiles get a mosaic index so czifile's mosaic filtering
+            # leaves the pyramid subblocks out of the base image
+            if pyramid_type == 0:
+                dims = [*dims, ("M", mosaic_idx, 1, 1)]
+            entry = _directory_entry(pixel_type, position, pyramid_type, dims)
+            tile_bytes = np.ascontiguousarray(
+                tile[..., ::-1] if rgb else tile
+            ).tobytes()
+            subblock = struct.pack("<iiq", 0, 0, len(tile_bytes)) + entry
+            # pixel data starts after at least 240 bytes of directory entry
+            subblock += b"\0" * max(240 - len(entry), 0) + tile_bytes
+            segment = _segment(b"ZISRAWSUBBLOCK", subblock)
+            f.write(segment)
+            directory.append(entry)
+            position += len(segment)
+
+        directory_position = position
+        directory_data = struct.pack("<i", len(directory)) + b"\0" * 124
+        directory_data += b"".join(directory)
+        segment = _segment(b"ZISRAWDIRECTORY", directory_data)
+        f.write(segment)
+        position += len(segment)
+
+        metadata_position = position
+        xml = _metadata_xml(pixel_spacing, channel_names, rgb, len(scenes)).encode()
+        metadata = struct.pack("<ii", len(xml), 0) + b"\0" * 248 + xml
+        f.write(_segment(b"ZISRAWMETADATA", metadata))
+
+        file_guid = uuid.uuid4().bytes
+        header = struct.pack(
+            "<iiii16s16siqqiq",
+            1,
+            0,
+            0,
+            0,
+            file_guid,
+            file_guid,
+            0,
+            directory_position,
+            metadata_position,
+            0,
+            0,
+        )
+        f.seek(0)
+        f.write(_segment(b"ZISRAWFILE", header, allocated_size=512))
+
+    return output_fp
@@ -0,0 +1,502 @@
+"""
+Deterministic synthetic slides for tests at realistic scale.
+
+A SyntheticSlide computes its pixels from their coordinates, so any region of
+a slide of any size is made on request and pyramid levels are exactly the
+base image strided by their downsampling factor. The writers store slides as
+tiled, pyramidal OME-TIFF, mosaic CZI with pyramid subblocks or OME-Zarr one
+tile at a time, and matching GeoJSON shape sets, without holding the slide in
+memory.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import zarr
+from tifffile import TiffWriter
+
+from napari_wsireg._tests.fixtures.czi_writer import write_czi
+
+SYNTHETIC_FORMATS = ["ome.tiff", "czi", "ome.zarr"]
+
+# QuPath classes of synthetic annotations, with their packed RGB colors
+SYNTHETIC_CLASSES = [("Tumor", -3670016), ("Stroma", -6895466), ("Immune", -9408287)]
+
+
+def _hash_noise(
+    c: int, yy: np.ndarray, xx: np.ndarray, seed: int, n_bits: int = 6
+) -> np.ndarray:
+    """Per pixel noise of `n_bits`, a hash of the pixel coordinates"""
+    h = (yy.astype(np.uint64) * np.uint64(0x9E3779B1)) ^ (
+        xx.astype(np.uint64) * np.uint64(0x85EBCA77)
+    )
+    h ^= np.uint64(((c + 1) * 0xC2B2AE3D) ^ (seed * 0x27D4EB2F))
+    h ^= h >> np.uint64(15)
+    h *= np.uint64(0x2C1B3C6D)
+    h ^= h >> np.uint64(12)
+    return (h & np.uint64(2**n_bits - 1)).astype(np.float32)
+
+
+class SyntheticSlide:
+    """
+    Array-like synthetic slide, pixels are computed when indexed
+
+    Each channel is a smooth pattern of a few periods across the slide, with
+    a phase of its own, plus noise hashed from the pixel coordinates, which
+    keeps compression and decoding realistic.
+
+    Parameters
+    ----------
+    size: tuple of int
+        (y, x) size in pixels
+    n_channels: int
+        number of channels, ignored for RGB slides
+    dtype: np.dtype
+        pixel type, values span the uint8 range scaled to the type
+    rgb: bool
+        whether the slide is an interleaved RGB image of shape (Y, X, 3),
+        otherwise its shape is (C, Y, X)
+    seed: int
+        seed of the noise
+    """
+
+    def __init__(
+        self,
+        size: Tuple[int, int],
+        n_channels: int = 1,
+        dtype: Any = np.uint8,
+        rgb: bool = False,
+        seed: int = 0,
+    ):
+        self.size = tuple(int(s) for s in size)
+        self.rgb = rgb
+        self.n_channels = 3 if rgb else n_channels
+        self.dtype = np.dtype(dtype)
+        self.seed = seed
+        self.shape = (*self.size, 3) if rgb else (self.n_channels, *self.size)
+        self.ndim = len(self.shape)
+
+    def _channel(self, c: int, ys: range, xs: range) -> np.ndarray:
+        yy = np.asarray(ys, dtype=np.int64)[:, None]
+        xx = np.asarray(xs, dtype=np.int64)[None, :]
+        phase = 2 * np.pi * c / max(self.n_channels, 1)
+        pattern = np.sin(2 * np.pi * 3 * yy / self.size[0] + phase) * np.cos(
+            2 * np.pi * 3 * xx / self.size[1] + phase
+        )
+        value = 96 + 95 * pattern.astype(np.float32)
+        value = value + _hash_noise(c, yy, xx, self.seed)
+        value = np.floor(value)
+
+        if self.dtype.kind == "f":
+            return (value / 255).astype(self.dtype)
+        return (value * (np.iinfo(self.dtype).max // 255)).astype(self.dtype)
+
+    def __getitem__(self, key) -> np.ndarray:
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        ranges = []
+        for k, size in zip(key, self.shape):
+            if isinstance(k, slice):
+                ranges.append(range(*k.indices(size)))
+            else:
+                k = int(k) + size if int(k) < 0 else int(k)
+                ranges.append(k)
+
+        if self.rgb:
+            ys, xs, cs = ranges
+        else:
+            cs, ys, xs = ranges
+        channels = [cs] if isinstance(cs, int) else list(cs)
+        ys_range = range(ys, ys + 1) if isinstance(ys, int) else ys
+        xs_range = range(xs, xs + 1) if isinstance(xs, int) else xs
+        planes = np.stack([self._channel(c, ys_range, xs_range) for c in channels])
+        if self.rgb:
+            planes = np.moveaxis(planes, 0, -1)
+            index = (
+                0 if isinstance(ys, int) else slice(None),
+                0 if isinstance(xs, int) else slice(None),
+                0 if isinstance(cs, int) else slice(None),
+            )
+        else:
+            index = (
+                0 if isinstance(cs, int) else slice(None),
+                0 if isinstance(ys, int) else slice(None),
+                0 if isinstance(xs, int) else slice(None),
+            )
+        return planes[index]
+
+    def __array__(self, dtype=None) -> np.ndarray:
+        image = self[:]
+        return image if dtype is None else image.astype(dtype)
+
+    def level(self, ds_factor: int) -> np.ndarray:
+        """Pyramid level of a downsampling factor, as stored by the writers"""
+        yx = (slice(None, None, ds_factor),) * 2
+        return self[yx + (slice(None),)] if self.rgb else self[(slice(None),) + yx]
+
+    @property
+    def channel_names(self) -> List[str]:
+        if self.rgb:
+            return ["C01 - RGB"]
+        return [f"C{idx + 1:02d}" for idx in range(self.n_channels)]
+
+
+def _level_factors(n_levels: int) -> List[int]:
+    return [2**idx for idx in range(n_levels)]
+
+
+def write_synthetic_ome_tiff(
+    output_fp: Union[str, Path],
+    slide: SyntheticSlide,
+    tile_size: int = 512,
+    compression: Optional[str] = None,
+    n_levels: int = 1,
+    pixel_spacing: float = 0.65,
+) -> Path:
+    """
+    Write a slide as a tiled OME-TIFF, sub-resolutions are stored as SubIFDs
+
+    Parameters
+    ----------
+    output_fp: str or Path
+        file path
+    slide: SyntheticSlide
+        slide to write
+    tile_size: int
+        tile size in pixels
+    compression: str
+        tifffile compression, e.g. "zlib" or "jpeg", None for uncompressed
+    n_levels: int
+        number of pyramid levels, each level halves the previous one
+    pixel_spacing: float
+        pixel spacing in microns of the base level
+
+    Returns
+    -------
+    output_fp: Path
+        file path
+    """
+    output_fp = Path(output_fp)
+    metadata = {
+        "axes": "YXS" if slide.rgb else "CYX",
+        "PhysicalSizeX": pixel_spacing,
+        "PhysicalSizeY": pixel_spacing,
+        "Channel": {"Name": slide.channel_names},
+    }
+
+    def tiles(ds_factor: int):
+        level_y, level_x = (-(-s // ds_factor) for s in slide.size)
+        for c in [None] if slide.rgb else range(slide.n_channels):
+            for y in range(0, level_y, tile_size):
+                for x in range(0, level_x, tile_size):
+                    yx = (
+                        slice(y * ds_factor, (y + tile_size) * ds_factor, ds_factor),
+                        slice(x * ds_factor, (x + tile_size) * ds_factor, ds_factor),
+                    )
+                    tile = slide[yx] if slide.rgb else slide[(c,) + yx]
+                    # edge tiles are padded to the tile size
+                    pad = [
+                        (0, tile_size - tile.shape[0]),
+                        (0, tile_size - tile.shape[1]),
+                    ]
+                    yield np.pad(tile, pad + [(0, 0)] * (tile.ndim - 2))
+
+    with TiffWriter(output_fp, bigtiff=True, ome=True) as tif:
+        for level_idx, ds_factor in enumerate(_level_factors(n_levels)):
+            level_yx = tuple(-(-s // ds_factor) for s in slide.size)
+            shape = (*level_yx, 3) if slide.rgb else (slide.n_channels, *level_yx)
+            options: Dict[str, Any] = dict(
+                shape=shape,
+                dtype=slide.dtype,
+                tile=(tile_size, tile_size),
+                compression=compression,
+                photometric="rgb" if slide.rgb else "minisblack",
+            )
+            if level_idx == 0:
+                tif.write(
+                    tiles(ds_factor),
+                    subifds=n_levels - 1,
+                    metadata=metadata,
+                    resolution=(1e4 / pixel_spacing, 1e4 / pixel_spacing),
+                    resolutionunit="CENTIMETER",
+                    **options,
+                )
+            else:
+                tif.write(tiles(ds_factor), subfiletype=1, metadata=None, **options)
+    return output_fp
+
+
+def write_synthetic_czi(
+    output_fp: Union[str, Path],
+    slide: SyntheticSlide,
+    tile_size: int = 512,
+    n_levels: int = 1,
+    pixel_spacing: float = 0.65,
+) -> Path:
+    """
+    Write a slide as a mosaic CZI, sub-resolutions are stored as pyramid
+    subblocks. CZI files are written uncompressed and support uint8, uint16
+    and float32 channels and uint8 and uint16 RGB.
+    """
+    return write_czi(
+        output_fp,
+        slide,
+        pixel_spacing=pixel_spacing,
+        channel_names=slide.channel_names,
+        tile_size=tile_size,
+        pyramid_factors=_level_factors(n_levels)[1:],
+    )
+
+
+def write_synthetic_ngff(
+    output_fp: Union[str, Path],
+    slide: SyntheticSlide,
+    tile_size: int = 512,
+    compression: Optional[str] = None,
+    n_levels: int = 1,
+    pixel_spacing: float = 0.65,
+) -> Path:
+    """
+    Write a slide as OME-Zarr (NGFF 0.4) with (t, c, z, y, x) axes, RGB
+    slides are written as three channels with red, green and blue colors.
+    `compression` is "zlib", "blosc" or None for uncompressed chunks.
+    """
+    import numcodecs
+
+    compressors = {
+        None: None,
+        "zlib": numcodecs.Zlib(),
+        "blosc": numcodecs.Blosc(),
+    }
+    output_fp = Path(output_fp)
+    root = zarr.open_group(str(output_fp), mode="w")
+    datasets = []
+    for level_idx, ds_factor in enumerate(_level_factors(n_levels)):
+        level_yx = tuple(-(-s // ds_factor) for s in slide.size)
+        array = root.create_dataset(
+            str(level_idx),
+            shape=(1, slide.n_channels, 1, *level_yx),
+            chunks=(1, 1, 1, tile_size, tile_size),
+            dtype=slide.dtype,
+            compressor=compressors[compression],
+        )
+        for c in range(slide.n_channels):
+            for y in range(0, level_yx[0], tile_size):
+                for x in range(0, level_yx[1], tile_size):
+                    yx = (
+                        slice(y * ds_factor, (y + tile_size) * ds_factor, ds_factor),
+                        slice(x * ds_factor, (x + tile_size) * ds_factor, ds_factor),
+                    )
+                    tile = slide[yx + (c,)] if slide.rgb else slide[(c,) + yx]
+                    array[0, c, 0, y : y + tile.shape[0], x : x + tile.shape[1]] = tile
+        scale = pixel_spacing * ds_factor
+        datasets.append(
+            {
+                "path": str(level_idx),
+                "coordinateTransformations": [
+                    {"type": "scale", "scale": [1, 1, 1, scale, scale]}
+                ],
+            }
+        )
+
+    root.attrs["multiscales"] = [
+        {
+            "version": "0.4",
+            "axes": [
+                {"name": "t", "type": "time"},
+                {"name": "c", "type": "channel"},
+                {"name": "z", "type": "space"},
+                {"name": "y", "type": "space", "unit": "micrometer"},
+                {"name": "x", "type": "space", "unit": "micrometer"},
+            ],
+            "datasets": datasets,
+        }
+    ]
+    colors = ["FF0000", "00FF00", "0000FF"] if slide.rgb else None
+    root.attrs["omero"] = {
+        "channels": [
+            {"label": name, "color": colors[idx] if colors else "FFFFFF"}
+            for idx, name in enumerate(
+                ["R", "G", "B"] if slide.rgb else slide.channel_names
+            )
+        ]
+    }
+    return output_fp
+
+
+def write_synthetic_slide(
+    output_fp: Union[str, Path],
+    size: Tuple[int, int] = (2048, 2048),
+    n_channels: int = 3,
+    dtype: Any = np.uint8,
+    rgb: bool = False,
+    file_format: str = "ome.tiff",
+    tile_size: int = 512,
+    compression: Optional[str] = None,
+    n_levels: int = 1,
+    pixel_spacing: float = 0.65,
+    seed: int = 0,
+) -> Tuple[Path, SyntheticSlide]:
+    """
+    Write a deterministic synthetic slide
+
+    Parameters
+    ----------
+    output_fp: str or Path
+        file path, a directory for OME-Zarr
+    size: tuple of int
+        (y, x) size of the base level in pixels
+    n_channels: int
+        number of channels, ignored for RGB slides
+    dtype: np.dtype
+        pixel type
+    rgb: bool
+        whether to write an interleaved RGB slide
+    file_format: str
+        one of "ome.tiff", "czi" or "ome.zarr"
+    tile_size: int
+        tile, mosaic tile or chunk size in pixels
+    compression: str
+        compression of OME-TIFF or OME-Zarr tiles, CZI is uncompressed
+    n_levels: int
+        number of pyramid levels, each level halves the previous one
+    pixel_spacing: float
+        pixel spacing in microns of the base level
+    seed: int
+        seed of the pixel noise
+
+    Returns
+    -------
+    output_fp: Path
+        file path
+    slide: SyntheticSlide
+        the written slide, to compare read data to
+    """
+    slide = SyntheticSlide(size, n_channels=n_channels, dtype=dtype, rgb=rgb, seed=seed)
+    if file_format == "ome.tiff":
+        output_fp = write_synthetic_ome_tiff(
+            output_fp, slide, tile_size, compression, n_levels, pixel_spacing
+        )
+    elif file_format == "czi":
+        output_fp = write_synthetic_czi(
+            output_fp, slide, tile_size, n_levels, pixel_spacing
+        )
+    elif file_format == "ome.zarr":
+        output_fp = write_synthetic_ngff(
+            output_fp, slide, tile_size, compression, n_levels, pixel_spacing
+        )
+    else:
+        raise ValueError(
+            f"unknown format {file_format}, expected one of {SYNTHETIC_FORMATS}"
+        )
+    return output_fp, slide
+
+
+def synthetic_polygons(
+    size: Tuple[int, int],
+    n_shapes: int = 10,
+    n_vertices: int = 64,
+    seed: int = 0,
+) -> List[np.ndarray]:
+    """
+    Deterministic irregular polygons within a slide, as (n_vertices, 2) arrays
+    of (x, y) coordinates in pixels
+    """
+    rng = np.random.default_rng(seed)
+    polygons = []
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    for _ in range(n_shapes):
+        radius = rng.uniform(0.02, 0.1) * min(size)
+        center_y = rng.uniform(radius, size[0] - radius)
+        center_x = rng.uniform(radius, size[1] - radius)
+        radii = radius * rng.uniform(0.6, 1.0, n_vertices)
+        polygon = np.stack(
+            [center_x + radii * np.cos(angles), center_y + radii * np.sin(angles)],
+            axis=1,
+        )
+        polygons.append(np.round(polygon).astype(np.int64))
+    return polygons
+
+
+def write_synthetic_geojson(
+    output_fp: Union[str, Path],
+    size: Tuple[int, int],
+    n_shapes: int = 10,
+    n_vertices: int = 64,
+    seed: int = 0,
+) -> Path:
+    """
+    Write polygons within a slide as QuPath annotations in GeoJSON
+
+    Parameters
+    ----------
+    output_fp: str or Path
+        file path
+    size: tuple of int
+        (y, x) size of the slide in pixels
+    n_shapes: int
+        number of polygons
+    n_vertices: int
+        number of vertices of each polygon
+    seed: int
+        seed of the polygon shapes and positions
+
+    Returns
+    -------
+    output_fp: Path
+        file path
+    """
+    features = []
+    for idx, polygon in enumerate(synthetic_polygons(size, n_shapes, n_vertices, seed)):
+        class_name, color = SYNTHETIC_CLASSES[idx % len(SYNTHETIC_CLASSES)]
+        ring = polygon.tolist() + [polygon[0].tolist()]
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+                "properties": {
+                    "object_type": "annotation",
+                    "classification": {"name": class_name, "colorRGB": color},
+                    "isLocked": False,
+                },
+            }
+        )
+    output_fp = Path(output_fp)
+    output_fp.write_text(json.dumps(features))
+    return output_fp
+
+
+def synthetic_slide_set(
+    output_dir: Union[str, Path],
+    size: Tuple[int, int] = (2048, 2048),
+    file_formats: Sequence[str] = tuple(SYNTHETIC_FORMATS),
+    n_shapes: int = 10,
+    **slide_options,
+) -> Dict[str, Path]:
+    """
+    Write the same slide in several formats and its GeoJSON shapes
+
+    Returns
+    -------
+    files: dict
+        path of each format, and of the shapes under "geojson"
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    files = {}
+    for file_format in file_formats:
+        files[file_format], _ = write_synthetic_slide(
+            output_dir / f"synthetic.{file_format}",
+            size=size,
+            file_format=file_format,
+            **slide_options,
+        )
+    files["geojson"] = write_synthetic_geojson(
+        output_dir / "synthetic.geojson",
+        size,
+        n_shapes=n_shapes,
+        seed=slide_options.get("seed", 0),
+    )
+    return files
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import pytest
+
+import napari_wsireg
+
+# import time budgets in milliseconds, measured with `python -X importtime` once
+# napari and its dependencies are imported, as when napari opens the plugin.
+# Timings depend on the machine, they are only checked when a budget is set.
+DATA_IMPORT_BUDGET_ENV = "NAPARI_WSIREG_DATA_IMPORT_MS"
+WIDGET_IMPORT_BUDGET_ENV = "NAPARI_WSIREG_WIDGET_IMPORT_MS"
+
+# modules only imported once registration data or the graph plot are used
+DEFERRED_MODULES = [
+    "wsireg.wsireg2d",
+    "SimpleITK",
+    "matplotlib",
+    "networkx",
+    "ome_types",
+    "pint",
+]
+
+# file format backends, only imported with the first file of their format
+BACKEND_MODULES = ["czifile", "imagecodecs", "tifffile", "zarr"]
+
+IMPORT_MARKER = "napari-wsireg-import-start"
+
+
+def import_times(
+    module: str, preload: Sequence[str] = (), n_runs: int = 3
+) -> Tuple[float, Dict[str, float]]:
+    """
+    Import `module` in fresh interpreters with `-X importtime` after importing
+    `preload`, the fastest run is kept to leave out compilation and disk caches
+
+    Returns
+    -------
+    import_ms: float
+        cumulative import time of `module`
+    imported: dict
+        self import time in milliseconds of every module `module` imported
+    """
+    code = "; ".join(
+        [f"import {m}" for m in preload]
+        + [f"import sys; sys.stderr.write('{IMPORT_MARKER}\\n')", f"import {module}"]
+    )
+    src_dir = Path(napari_wsireg.__file__).parents[1]
+    best = None
+    for _ in range(n_runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=src_dir,
+        )
+        lines = result.stderr.split(f"{IMPORT_MARKER}\n", 1)[1].splitlines()
+        imported, import_ms = {}, None
+        for line in lines:
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            imported[name.strip()] = int(self_us) / 1000
+            if name.strip() == module:
+                import_ms = int(cumulative_us) / 1000
+        if best is None or import_ms < best[0]:
+            best = (import_ms, imported)
+    return best
+
+
+def check_import_budget(import_ms: float, budget_env: str) -> None:
+    if os.environ.get(budget_env):
+        assert import_ms < float(os.environ[budget_env])
+
+
+def test_data_import_time():
+    import_ms, imported = import_times("napari_wsireg.data", preload=["numpy"])
+    check_import_budget(import_ms, DATA_IMPORT_BUDGET_ENV)
+    for module in [*BACKEND_MODULES, *DEFERRED_MODULES]:
+        assert module not in imported
+
+
+def test_widget_import_time():
+    for module in ["napari", "qtpy", "superqt", "wsireg"]:
+        pytest.importorskip(module)
+
+    import_ms, imported = import_times(
+        "napari_wsireg._widget",
+        preload=["napari", "napari.qt.threading", "qtpy.QtWidgets", "dask.array"],
+    )
+    check_import_budget(import_ms, WIDGET_IMPORT_BUDGET_ENV)
+    for module in [*BACKEND_MODULES, *DEFERRED_MODULES]:
+        assert module not in imported
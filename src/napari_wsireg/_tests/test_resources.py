@@ -0,0 +1,130 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dask
+import dask.array as da
+import numpy as np
+import pytest
+
+from napari_wsireg.resources import ResourceManager
+
+
+def test_resource_manager_partial_grants():
+    manager = ResourceManager(n_threads=8, memory_bytes=1000)
+
+    with manager.request(6) as first:
+        assert first.threads == 6
+        # only what is left of the budget is granted
+        with manager.request(6) as second:
+            assert second.threads == 2
+            assert manager.threads_in_use == 8
+            # other threads wait for the budget to be released
+            with pytest.raises(TimeoutError):
+                ThreadPoolExecutor(1).submit(manager.request, 1, timeout=0.01).result()
+
+        # memory per thread bounds the grant
+        with manager.request(2, memory_per_thread=600) as third:
+            assert third.threads == 1
+            assert manager.memory_in_use == 600
+
+    assert manager.threads_in_use == 0
+    assert manager.memory_in_use == 0
+
+    # oversized requests still run when nothing else holds the budget
+    with manager.request(2, memory_per_thread=5000) as grant:
+        assert grant.threads == 1
+
+
+def test_resource_manager_waits_for_release():
+    manager = ResourceManager(n_threads=2)
+    first = manager.request(2)
+    granted = []
+
+    def request():
+        with manager.request(2) as grant:
+            granted.append(grant.threads)
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    thread.join(0.05)
+    assert granted == []
+
+    first.release()
+    thread.join(5)
+    assert granted == [2]
+
+
+def test_resource_manager_set_budget():
+    manager = ResourceManager(n_threads=2, memory_bytes=0)
+    assert manager.memory_bytes is None
+
+    changes = []
+    manager.add_listener(lambda m: changes.append(m.n_threads))
+    manager.set_budget(n_threads=4)
+    assert manager.n_threads == 4
+    assert changes == [4]
+
+    with manager.request(8) as grant:
+        assert grant.threads == 4
+
+
+def test_resource_manager_nested_requests():
+    manager = ResourceManager(n_threads=2)
+
+    nested_threads = []
+
+    def request_nested():
+        with manager.request(2):
+            with manager.request(2) as nested:
+                nested_threads.append(nested.threads)
+
+    # requests in work holding the whole budget get a thread without waiting
+    thread = threading.Thread(target=request_nested)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert nested_threads == [1]
+
+    # as do the threads of a store, e.g. CZI tiles read while a pyramid is
+    # written
+    nested_threads = []
+
+    def read_chunk(block):
+        with manager.request(2) as grant:
+            nested_threads.append(grant.threads)
+        return block
+
+    image = da.from_array(np.arange(64 * 64).reshape(64, 64), chunks=16)
+    out = np.zeros(image.shape, dtype=image.dtype)
+    read = image.map_blocks(read_chunk, meta=np.empty((0, 0), dtype=image.dtype))
+    thread = threading.Thread(target=manager.store, args=([read], [out]))
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    np.testing.assert_array_equal(out, image)
+    assert nested_threads == [1] * 16
+    assert manager.threads_in_use == 0
+    assert manager._holders == dict()
+
+
+def test_resource_manager_configure_dask():
+    with dask.config.set(num_workers=None):
+        # dask's global config is only changed when asked for
+        manager = ResourceManager(n_threads=2)
+        manager.set_budget(n_threads=3)
+        assert dask.config.get("num_workers") is None
+
+        manager.configure_dask()
+        assert dask.config.get("num_workers") == 3
+        manager.set_budget(n_threads=5)
+        assert dask.config.get("num_workers") == 5
+
+
+def test_resource_manager_store():
+    manager = ResourceManager(n_threads=2)
+    image = np.arange(64 * 64).reshape(64, 64)
+    out = np.zeros_like(image)
+
+    manager.store([da.from_array(image, chunks=16)], [out], lock=False)
+    np.testing.assert_array_equal(out, image)
+    assert manager.threads_in_use == 0
@@ -0,0 +1,112 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from napari_wsireg._tests.fixtures.synthetic import (
+    write_synthetic_geojson,
+    write_synthetic_slide,
+)
+from napari_wsireg.data import CziWsiRegImage, TiffFileWsiRegImage
+
+# edge length in pixels of the largest synthetic slide
+SCALE_SIZE = int(os.environ.get("NAPARI_WSIREG_SCALE_SIZE", 100000))
+
+pytestmark = pytest.mark.scale
+
+
+def random_regions(shape, n_regions=8, size=700, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_regions):
+        y = int(rng.integers(0, max(shape[0] - size, 1)))
+        x = int(rng.integers(0, max(shape[1] - size, 1)))
+        yield slice(y, y + size), slice(x, x + size)
+
+
+@pytest.fixture(scope="module")
+def scale_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("scale")
+
+
+def test_scale_pyramidal_ome_tiff(scale_dir):
+    n_levels = int(np.log2(SCALE_SIZE / 512))
+    im_fp, slide = write_synthetic_slide(
+        scale_dir / "pyramid.ome.tiff",
+        size=(SCALE_SIZE, SCALE_SIZE),
+        n_channels=1,
+        tile_size=512,
+        compression="zlib",
+        n_levels=n_levels,
+    )
+    tf_wsi = TiffFileWsiRegImage(im_fp)
+    tf_wsi.prepare_image_data()
+
+    assert len(tf_wsi.dask_pyr) == n_levels
+    assert tf_wsi.dask_pyr[0].shape == (1, SCALE_SIZE, SCALE_SIZE)
+    # coalesced chunks keep the task graph of the base level small
+    assert tf_wsi.dask_pyr[0].npartitions < 5000
+    for yx in random_regions((SCALE_SIZE, SCALE_SIZE)):
+        np.testing.assert_array_equal(tf_wsi.dask_pyr[0][(0,) + yx], slide[(0,) + yx])
+    np.testing.assert_array_equal(
+        np.asarray(tf_wsi.thumbnail)[0], slide.level(2 ** (n_levels - 1))[0]
+    )
+    tf_wsi.close()
+
+
+def test_scale_multichannel_stack(scale_dir):
+    size = SCALE_SIZE // 8
+    im_fp, slide = write_synthetic_slide(
+        scale_dir / "mc.ome.tiff",
+        size=(size, size),
+        n_channels=40,
+        dtype=np.uint16,
+        tile_size=512,
+        compression="zlib",
+        n_levels=4,
+    )
+    tf_wsi = TiffFileWsiRegImage(im_fp)
+    assert tf_wsi.n_ch == 40
+    tf_wsi.prepare_image_data(channel_indices=[0, 17, 39])
+
+    assert tf_wsi.dask_pyr[0].shape == (3, size, size)
+    for yx in random_regions((size, size), n_regions=4):
+        np.testing.assert_array_equal(
+            tf_wsi.dask_pyr[0][(slice(None),) + yx],
+            np.stack([slide[(c,) + yx] for c in [0, 17, 39]]),
+        )
+    tf_wsi.close()
+
+
+def test_scale_mosaic_czi(scale_dir):
+    size = SCALE_SIZE // 4
+    im_fp, slide = write_synthetic_slide(
+        scale_dir / "mosaic.czi",
+        size=(size, size),
+        n_channels=3,
+        file_format="czi",
+        tile_size=1024,
+        n_levels=4,
+    )
+    czi_wsi = CziWsiRegImage(im_fp, pyramid_mode="stored")
+    czi_wsi.prepare_image_data()
+
+    assert czi_wsi.dask_pyr[0].shape == (3, size, size)
+    for yx in random_regions((size, size), n_regions=4):
+        np.testing.assert_array_equal(
+            czi_wsi.dask_pyr[0][(slice(None),) + yx], slide[(slice(None),) + yx]
+        )
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[3], slide.level(8))
+    czi_wsi.close()
+
+
+def test_scale_geojson(scale_dir):
+    gj_fp = write_synthetic_geojson(
+        scale_dir / "shapes.geojson",
+        (SCALE_SIZE, SCALE_SIZE),
+        n_shapes=5000,
+        n_vertices=256,
+    )
+    features = json.loads(gj_fp.read_text())
+    assert len(features) == 5000
+    assert all(len(f["geometry"]["coordinates"][0]) == 257 for f in features)
@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+from napari_wsireg._tests.fixtures.synthetic import (
+    SYNTHETIC_FORMATS,
+    SyntheticSlide,
+    synthetic_slide_set,
+    write_synthetic_slide,
+)
+from napari_wsireg.data import open_image_data
+
+
+def test_synthetic_slide():
+    slide = SyntheticSlide((300, 500), n_channels=4, dtype=np.uint16, seed=1)
+    image = np.asarray(slide)
+    assert image.shape == (4, 300, 500)
+    assert image.dtype == np.uint16
+
+    # regions and levels are computed from the pixel coordinates
+    np.testing.assert_array_equal(
+        slide[2, 100:150, 7:300:3], image[2, 100:150, 7:300:3]
+    )
+    np.testing.assert_array_equal(slide[:, -1], image[:, -1])
+    np.testing.assert_array_equal(slide.level(4), image[:, ::4, ::4])
+    np.testing.assert_array_equal(
+        np.asarray(SyntheticSlide((300, 500), 4, np.uint16, seed=1)), image
+    )
+    assert not np.array_equal(
+        np.asarray(SyntheticSlide((300, 500), 4, np.uint16, seed=2)), image
+    )
+    # channels differ
+    assert not np.array_equal(image[0], image[1])
+
+    rgb = SyntheticSlide((64, 32), rgb=True)
+    assert rgb[:].shape == (64, 32, 3)
+    np.testing.assert_array_equal(rgb[10, :, 1], rgb[:][10, :, 1])
+    assert SyntheticSlide((8, 8), dtype=np.float32)[:].max() <= 1
+
+
+@pytest.mark.parametrize("file_format", SYNTHETIC_FORMATS)
+@pytest.mark.parametrize("rgb", [False, True])
+def test_write_synthetic_slide(tmp_path, file_format, rgb):
+    im_fp, slide = write_synthetic_slide(
+        tmp_path / f"slide.{file_format}",
+        size=(700, 900),
+        n_channels=2,
+        rgb=rgb,
+        file_format=file_format,
+        tile_size=256,
+        compression=None if file_format == "czi" else "zlib",
+        n_levels=3,
+    )
+    image_data = open_image_data(im_fp)
+    image_data.prepare_image_data()
+
+    assert image_data.is_rgb == rgb
+    assert image_data.pixel_spacing == (0.65, 0.65)
+    np.testing.assert_array_equal(
+        np.squeeze(np.asarray(image_data.dask_pyr[0])), np.squeeze(slide[:])
+    )
+    assert len(image_data.dask_pyr) == 3
+    np.testing.assert_array_equal(
+        np.squeeze(np.asarray(image_data.dask_pyr[2])), np.squeeze(slide.level(4))
+    )
+    image_data.close()
+
+
+def test_synthetic_slide_set(tmp_path):
+    files = synthetic_slide_set(tmp_path, size=(512, 512), n_channels=1, n_shapes=5)
+    assert sorted(files) == sorted(SYNTHETIC_FORMATS + ["geojson"])
+
+    features = json.loads(files["geojson"].read_text())
+    assert len(features) == 5
+    for feature in features:
+        ring = np.asarray(feature["geometry"]["coordinates"][0])
+        assert np.array_equal(ring[0], ring[-1])
+        assert ring.min() >= 0 and ring.max() <= 512
+        assert feature["properties"]["object_type"] == "annotation"
+
+    # the same seed writes the same shapes
+    other_files = synthetic_slide_set(
+        tmp_path / "other", size=(512, 512), file_formats=[], n_shapes=5
+    )
+    assert other_files["geojson"].read_text() == files["geojson"].read_text()
@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+for module in ["napari", "pytestqt", "qtpy", "superqt", "wsireg"]:
+    pytest.importorskip(module)
+
+from napari_wsireg._widget import WsiReg2DMain  # noqa: E402
+
+
+@pytest.fixture
+def wsireg_widget(make_napari_viewer, tmp_path):
+    viewer = make_napari_viewer()
+    widget = WsiReg2DMain(viewer)
+    rng = np.random.default_rng(0)
+    for mod_tag, in_data in [("fixed", "array"), ("moving", "in-memory layer")]:
+        layer = viewer.add_image(
+            rng.integers(0, 255, size=(256, 256)).astype(np.uint8), name=mod_tag
+        )
+        widget.layer_data[mod_tag] = layer
+        widget.image_spacings[mod_tag] = 1.0
+        widget.reg_graph.add_modality(
+            mod_tag, layer.data if in_data == "array" else in_data, 1.0
+        )
+    widget.reg_graph.add_reg_path("moving", "fixed", reg_params=["rigid"])
+    widget.project_name_entry.setText("layers")
+    widget.output_dir_entry.setText(str(tmp_path))
+    yield widget
+    widget.close()
+
+
+@pytest.mark.parametrize("layer_writer", ["OME-TIFF (pyramidal)", "OME-Zarr"])
+def test_run_registration_layer_modalities(
+    wsireg_widget, qtbot, monkeypatch, layer_writer
+):
+    wsireg_widget.setup.proj_ctrl.layer_writer.setCurrentText(layer_writer)
+    started = []
+    monkeypatch.setattr(
+        wsireg_widget, "_start_registration", lambda: started.append(True)
+    )
+    wsireg_widget.run_registration_direct()
+    qtbot.waitUntil(lambda: len(started) == 1, timeout=30000)
+
+    for mod_tag in ["fixed", "moving"]:
+        image_filepath = wsireg_widget.reg_graph.modalities[mod_tag]["image_filepath"]
+        if layer_writer != "OME-Zarr":
+            assert Path(image_filepath).exists()
+        else:
+            assert not isinstance(image_filepath, str)
+
+    # exported layers are handed off again when the graph is re-run
+    wsireg_widget._hand_off_backing_stores()
+
+
+def test_queue_layer_modalities(wsireg_widget, qtbot):
+    wsireg_widget.add_current_graph_to_queue()
+    qtbot.waitUntil(lambda: wsireg_widget.queue_list.count() == 1, timeout=30000)
+
+    reg_graph = wsireg_widget.queue_list.item(0).reg_graph
+    for mod_tag in ["fixed", "moving"]:
+        assert Path(reg_graph.modalities[mod_tag]["image_filepath"]).exists()
@@ -1,7 +1,7 @@
 import shutil
 from copy import deepcopy
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
 from tempfile import TemporaryDirectory
 
 import napari
@@ -10,7 +10,7 @@ from napari.qt.threading import thread_worker
 from napari.utils import progress
 from napari_plugin_engine import napari_hook_implementation
 from napari.layers import Image, Shapes, Labels, Points
-from qtpy.QtCore import QEvent, Qt, QThreadPool
+from qtpy.QtCore import QEvent, Qt, QThreadPool, QTimer
 from qtpy.QtWidgets import (
     QErrorMessage,
     QMessageBox,
@@ -21,21 +21,9 @@ from qtpy.QtWidgets import (
     QWidget,
     QScrollArea,
 )
-from wsireg.parameter_maps.preprocessing import ImagePreproParams
-from wsireg.parameter_maps.reg_model import RegModel
-from wsireg.reg_shapes import RegShapes
-from wsireg.wsireg2d import WsiReg2D
-from wsireg.wsireg2d import wsireg_run as wsireg2d_main
-from wsireg.utils.im_utils import ARRAYLIKE_CLASSES
-from napari_wsireg.data import (
-    FILE_ERROR_MESSAGE,
-    TIFFFILE_EXTS,
-    CziWsiRegImage,
-    TiffFileWsiRegImage,
-    WsiRegImage,
-)
+from napari_wsireg.data.readers import is_zarr_path, open_image_data
 from napari_wsireg.gui.utils.file import open_file_dialog
-from napari_wsireg.data.utils.image import guess_rgb, write_image_from_napari
+from napari_wsireg.data.utils.probe import ProbeResult, probe_files
 from napari_wsireg.data.utils.shapes import napari_shapes_to_qp_geojson
 from napari_wsireg.data.utils.transform import centered_flip, centered_transform
 from napari_wsireg.gui.dialogs.add_merge import AddMerge
@@ -43,6 +31,28 @@ from napari_wsireg.gui.dialogs.add_modality import AddModality
 from napari_wsireg.gui.setup_gui import SetupTab
 from napari_wsireg.gui.setup_sub.modality import create_modality_item
 from napari_wsireg.gui.queue import reg_queue_item, generate_queue_tag
+from napari_wsireg.resources import get_resource_manager
+
+# wsireg imports SimpleITK and is only imported once registration data is used,
+# the readers, writers and tile utilities import the file format backends and
+# are imported once a file or layer is used, keeping the plugin quick to open
+if TYPE_CHECKING:
+    from wsireg.reg_shapes import RegShapes
+    from wsireg.wsireg2d import WsiReg2D
+
+    from napari_wsireg.data import (
+        CziWsiRegImage,
+        TiffFileWsiRegImage,
+        WsiRegImage,
+        ZarrWsiRegImage,
+    )
+    from napari_wsireg.data.utils.prefetch import PrefetchRequest
+    from napari_wsireg.data.utils.stores import BackingStore
+    from napari_wsireg.data.utils.writers import WriteProgress
+
+# delay in milliseconds after the camera or dims stop changing before tiles
+# around the viewport are prefetched
+PREFETCH_DELAY_MS = 150
 
 
 class WsiReg2DMain(QWidget):
@@ -55,10 +65,11 @@ class WsiReg2DMain(QWidget):
         self._threadpool = QThreadPool()
         self._threadpool.setMaxThreadCount(1)
         self._pbar: Optional[progress] = None
+        self._write_progress: Optional["WriteProgress"] = None
         self._n_graphs_registered: int = 0
 
-        self.reg_graph: WsiReg2D = WsiReg2D(None, None)
-        self.graph_queue: List[Tuple[WsiReg2D, Dict[str, bool]]] = []
+        self._reg_graph: Optional["WsiReg2D"] = None
+        self.graph_queue: List[Tuple["WsiReg2D", Dict[str, bool]]] = []
 
         self.image_mods: List[str] = []
         self.attachment_mods: List[str] = []
@@ -66,11 +77,37 @@ class WsiReg2DMain(QWidget):
         self.merge_mods: Dict[str, List[str]] = dict()
         self.mask_mods: Dict[str, str] = dict()
 
-        self.image_data: Dict[str, WsiRegImage] = dict()
+        self.image_data: Dict[str, "WsiRegImage"] = dict()
         self.layer_data: Dict[str, Any] = dict()
         self.image_spacings: Dict[str, float] = dict()
+        self.backing_stores: Dict[str, "BackingStore"] = dict()
         self.attachment_keys: Dict[str, List[str]] = dict()
 
+        # files opened concurrently wait here for their dialog, in order
+        self._probed_files: List[Tuple[str, bool, ProbeResult]] = []
+        self._adding_probed_files: bool = False
+
+        # napari reads dask backed layers with dask's default scheduler, its
+        # pool is kept to the thread budget while the plugin is open
+        get_resource_manager().configure_dask()
+
+        from napari_wsireg.data.utils.prefetch import TilePrefetcher
+
+        # tiles around the viewport are read into the tile cache once the
+        # camera or the dims settle
+        self._prefetcher = TilePrefetcher()
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.setInterval(PREFETCH_DELAY_MS)
+        self._prefetch_timer.timeout.connect(self._prefetch_viewport)
+        self._viewport_events = [
+            self.viewer.camera.events.center,
+            self.viewer.camera.events.zoom,
+            self.viewer.dims.events.current_step,
+        ]
+        for event in self._viewport_events:
+            event.connect(self._schedule_prefetch)
+
         main_layout = QVBoxLayout()
         main_layout.setAlignment(Qt.AlignTop)
         self.setLayout(main_layout)
@@ -103,16 +140,14 @@ class WsiReg2DMain(QWidget):
 
         self.graph_view = self.setup.graph_view
 
-        model_names = [m.name for m in RegModel]
-        model_names.append("from file")
-        model_names.append("[reset]")
-
-        for m in model_names:
-            self.reg_models_box.addItem(m)
+        # registration models come from wsireg, they are listed once the widget
+        # is shown rather than while it is created
+        QTimer.singleShot(0, self._add_reg_model_names)
 
         self.run_reg_btn = self.setup.proj_ctrl.run_reg
         self.add_to_queue_btn = self.setup.proj_ctrl.add_to_queue
         self.write_config_btn = self.setup.proj_ctrl.write_config
+        self.cancel_export_btn = self.setup.proj_ctrl.cancel_export
 
         self.project_name_entry = self.setup.proj_ctrl.project_name_entry
         self.output_dir_select = self.setup.proj_ctrl.output_dir_select
@@ -206,6 +241,7 @@ class WsiReg2DMain(QWidget):
         self.write_config_btn.clicked.connect(self.save_graph_config)
         self.run_reg_btn.clicked.connect(self.run_registration_direct)
         self.add_to_queue_btn.clicked.connect(self.add_current_graph_to_queue)
+        self.cancel_export_btn.clicked.connect(self.cancel_napari_layer_export)
 
         # queue managment
         # self.up_queue_btn.clicked.connect(lambda: self.move_queue_item("up"))
@@ -213,6 +249,29 @@ class WsiReg2DMain(QWidget):
         self.del_queue_btn.clicked.connect(self.delete_queue_items)
         self.run_queue_btn.clicked.connect(self.run_registration_queue)
 
+    @property
+    def reg_graph(self) -> "WsiReg2D":
+        """Registration graph, created on first use"""
+        if self._reg_graph is None:
+            from wsireg.wsireg2d import WsiReg2D
+
+            self._reg_graph = WsiReg2D(None, None)
+        return self._reg_graph
+
+    @reg_graph.setter
+    def reg_graph(self, reg_graph: "WsiReg2D") -> None:
+        self._reg_graph = reg_graph
+
+    def _add_reg_model_names(self) -> None:
+        from wsireg.parameter_maps.reg_model import RegModel
+
+        model_names = [m.name for m in RegModel]
+        model_names.append("from file")
+        model_names.append("[reset]")
+
+        for m in model_names:
+            self.reg_models_box.addItem(m)
+
     def add_data(
         self,
         data_type: str,
@@ -244,18 +303,101 @@ class WsiReg2DMain(QWidget):
             if not isinstance(file_paths, list):
                 file_paths = [file_paths]
 
-            for file_path in file_paths:
-                if data_type == "image":
-                    self._add_image_data(file_path, no_dialog)
+            if len(file_paths) == 1:
+                self._add_file_data(data_type, file_paths[0], no_dialog)
+                self._update_reg_plot()
+            else:
+                self._add_files_concurrently(data_type, file_paths, no_dialog)
 
-                elif data_type == "attachment":
-                    self._add_attachment_data(file_path, no_dialog)
-                elif data_type == "shape":
-                    self._add_shape_data(file_path, no_dialog)
-                else:
-                    self._add_mask_data(file_path, no_dialog)
+    def _add_file_data(
+        self,
+        data_type: str,
+        file_path: Union[str, Path],
+        no_dialog: bool = False,
+        file_data: Optional[Union["WsiRegImage", "RegShapes"]] = None,
+    ) -> None:
+        if data_type == "image":
+            self._add_image_data(file_path, no_dialog, image_data=file_data)
+        elif data_type == "attachment":
+            self._add_attachment_data(file_path, no_dialog, image_data=file_data)
+        elif data_type == "shape":
+            self._add_shape_data(file_path, no_dialog, shape_data=file_data)
+        else:
+            self._add_mask_data(file_path, no_dialog, mask_data=file_data)
+
+    def _probe_file(
+        self, data_type: str, file_path: Union[str, Path]
+    ) -> Union["WsiRegImage", "RegShapes"]:
+        from wsireg.reg_shapes import RegShapes
+
+        if data_type == "shape" or (
+            data_type == "mask"
+            and Path(file_path).suffix.lower() in [".geojson", ".json"]
+        ):
+            return RegShapes(file_path)
+        return self._probe_image_data(file_path)
+
+    @thread_worker
+    def _probe_files(self, data_type: str, file_paths: List[Union[str, Path]]):
+        for result in probe_files(
+            file_paths, lambda file_path: self._probe_file(data_type, file_path)
+        ):
+            yield result
 
+    def _add_files_concurrently(
+        self, data_type: str, file_paths: List[Union[str, Path]], no_dialog: bool
+    ) -> None:
+        """
+        Open the headers of several files in a background thread pool, the
+        modality dialogs are shown in the order of `file_paths` as the files
+        are opened, and files that can't be opened are reported together once
+        the batch is done
+        """
+        probe_pbar = progress(total=len(file_paths))
+        probe_pbar.set_description(f"opening {len(file_paths)} files")
+        errors: List[ProbeResult] = []
+
+        def _file_probed(result: ProbeResult) -> None:
+            probe_pbar.update(1)
+            if result.error is not None:
+                errors.append(result)
+            else:
+                self._add_probed_file(data_type, no_dialog, result)
+
+        def _probing_done() -> None:
+            probe_pbar.close()
+            if errors:
+                emsg = QErrorMessage(self)
+                emsg.showMessage(
+                    "<br>".join(
+                        f"{Path(r.file_path).name} could not be opened: {r.error}"
+                        for r in errors
+                    )
+                )
+
+        probe_worker = self._probe_files(data_type, file_paths)
+        probe_worker.yielded.connect(_file_probed)
+        probe_worker.finished.connect(_probing_done)
+        probe_worker.start()
+
+    def _add_probed_file(
+        self, data_type: str, no_dialog: bool, result: ProbeResult
+    ) -> None:
+        # dialogs run a nested event loop that delivers the next probed files,
+        # they are queued and added one at a time by the outermost call
+        self._probed_files.append((data_type, no_dialog, result))
+        if self._adding_probed_files:
+            return
+        self._adding_probed_files = True
+        try:
+            while self._probed_files:
+                data_type, no_dialog, result = self._probed_files.pop(0)
+                self._add_file_data(
+                    data_type, result.file_path, no_dialog, file_data=result.data
+                )
                 self._update_reg_plot()
+        finally:
+            self._adding_probed_files = False
 
     def _check_data_type(
         self, data_type: str, layer: Union[Image, Shapes, Labels, Points]
@@ -355,23 +497,22 @@ class WsiReg2DMain(QWidget):
         rstr = "".join(random.choice(letters) for i in range(5))
         return rstr
 
-    def _get_image_data(
-        self, file_path: Union[str, Path]
-    ) -> Optional[Union[CziWsiRegImage, TiffFileWsiRegImage]]:
+    @staticmethod
+    def _probe_image_data(
+        file_path: Union[str, Path], header_only: bool = True
+    ) -> "WsiRegImage":
+        # readers only parse headers here, pixel data is read in _prepare_image_data
+        # once the modality has been confirmed
+        return open_image_data(file_path, header_only=header_only)
 
-        if Path(file_path).suffix.lower() in TIFFFILE_EXTS:
-            return TiffFileWsiRegImage(file_path)
-        elif Path(file_path).suffix.lower() == ".czi":
-            return CziWsiRegImage(file_path)
-        else:
+    def _get_image_data(
+        self, file_path: Union[str, Path], header_only: bool = True
+    ) -> Optional[Union["CziWsiRegImage", "TiffFileWsiRegImage", "ZarrWsiRegImage"]]:
+        try:
+            return self._probe_image_data(file_path, header_only=header_only)
+        except ValueError as e:
             emsg_d = QErrorMessage(self)
-            err_msg = FILE_ERROR_MESSAGE.substitute(
-                file_path=Path(file_path).name,
-                ext=Path(file_path).suffix.lower(),
-                tiff_ext=",".join(TIFFFILE_EXTS),
-            )
-            emsg_d.showMessage(err_msg)
-
+            emsg_d.showMessage(str(e))
             return None
 
     def _add_image_data(
@@ -380,9 +521,13 @@ class WsiReg2DMain(QWidget):
         no_dialog: bool = False,
         from_file: bool = True,
         selected_layer: Optional[Union[Image, Labels]] = None,
+        image_data: Optional["WsiRegImage"] = None,
     ):
+        from napari_wsireg.data import ZarrWsiRegImage
+
         if from_file:
-            image_data = self._get_image_data(file_path)
+            if image_data is None:
+                image_data = self._get_image_data(file_path)
             if image_data:
                 image_data_loaded = True
         else:
@@ -422,14 +567,20 @@ class WsiReg2DMain(QWidget):
                 self.attachment_keys.update({mod_tag: []})
 
                 if from_file:
+                    # only the channels selected for registration are read
                     self._run_add_image(
                         mod_tag,
                         image_data,
                         use_thumbnail=added_mod.use_thumbnail.isChecked(),
+                        channel_indices=preprocessing.get("ch_indices"),
                     )
+                    # wsireg can't read zarr paths, it reads the store as an
+                    # array, RGB images interleaved like napari layers
                     self.reg_graph.add_modality(
                         mod_tag,
-                        file_path,
+                        image_data.registration_level
+                        if isinstance(image_data, ZarrWsiRegImage)
+                        else file_path,
                         mod_spacing,
                         preprocessing=preprocessing,
                         channel_names=channel_names,
@@ -438,7 +589,8 @@ class WsiReg2DMain(QWidget):
                     selected_layer.name = mod_tag
                     selected_layer.scale = [float(mod_spacing), float(mod_spacing)]
                     self.layer_data.update({mod_tag: selected_layer})
-                    if file_path != "in-memory layer":
+                    # wsireg can't read zarr paths, the layer data reads the store
+                    if file_path != "in-memory layer" and not is_zarr_path(file_path):
                         in_data = file_path
                     elif selected_layer.multiscale:
                         in_data = selected_layer.data[0]
@@ -454,6 +606,9 @@ class WsiReg2DMain(QWidget):
 
                 self._update_path_possibilties()
 
+            elif image_data is not None:
+                image_data.close()
+
     def _get_all_entity_tags(self):
         all_entities = []
         all_entities.extend(self.image_mods)
@@ -466,9 +621,10 @@ class WsiReg2DMain(QWidget):
     def _run_add_image(
         self,
         mod_tag: str,
-        image_data: Union[TiffFileWsiRegImage, CziWsiRegImage],
+        image_data: Union["TiffFileWsiRegImage", "CziWsiRegImage"],
         use_thumbnail: bool = False,
         attachment_mod: Optional[str] = None,
+        channel_indices: Optional[List[int]] = None,
     ):
         self._pbar = progress(total=0)
         self._pbar.set_description(f"reading {mod_tag} image")
@@ -478,6 +634,7 @@ class WsiReg2DMain(QWidget):
             image_data,
             use_thumbnail=use_thumbnail,
             attachment_mod=attachment_mod,
+            channel_indices=channel_indices,
         )
         micro_reader_worker.start()
         micro_reader_worker.returned.connect(self._add_image_to_viewer)
@@ -490,24 +647,30 @@ class WsiReg2DMain(QWidget):
     def _prepare_image_data(
         self,
         mod_tag: str,
-        image_data: Union[TiffFileWsiRegImage, CziWsiRegImage],
+        image_data: Union["TiffFileWsiRegImage", "CziWsiRegImage"],
         use_thumbnail: bool = False,
         attachment_mod: Optional[str] = None,
+        channel_indices: Optional[List[int]] = None,
     ):
         if attachment_mod:
             image_data._pixel_spacing = (
                 self.image_spacings[attachment_mod],
                 self.image_spacings[attachment_mod],
             )
-        if isinstance(image_data, TiffFileWsiRegImage) or not use_thumbnail:
-            image_data.prepare_image_data()
-        elif isinstance(image_data, CziWsiRegImage) and use_thumbnail:
+        from napari_wsireg.data import CziWsiRegImage
+
+        # only CZI reads its thumbnail without the pyramid, other readers map
+        # the pyramid lazily and take the thumbnail from it
+        if isinstance(image_data, CziWsiRegImage) and use_thumbnail:
+            image_data._set_channel_indices(channel_indices)
             image_data._get_thumbnail()
+        else:
+            image_data.prepare_image_data(channel_indices=channel_indices)
 
         return mod_tag, image_data, use_thumbnail
 
     def _add_image_to_viewer(
-        self, data: Tuple[str, Union[TiffFileWsiRegImage, CziWsiRegImage], bool]
+        self, data: Tuple[str, Union["TiffFileWsiRegImage", "CziWsiRegImage"], bool]
     ):
         mod_tag, image_data, use_thumbnail = data
         channel_names = [f"{mod_tag}-{c}" for c in image_data.channel_names]
@@ -555,7 +718,10 @@ class WsiReg2DMain(QWidget):
         no_dialog: bool = False,
         from_file: bool = True,
         selected_layer: Optional[Union[Image, Labels]] = None,
+        image_data: Optional["WsiRegImage"] = None,
     ):
+        from napari_wsireg.data import ZarrWsiRegImage
+
         if len(self.attachment_keys.keys()) == 0:
             emsg = QErrorMessage(self)
             emsg.showMessage(
@@ -564,7 +730,8 @@ class WsiReg2DMain(QWidget):
             )
             return
         if from_file:
-            image_data = self._get_image_data(file_path)
+            if image_data is None:
+                image_data = self._get_image_data(file_path)
             if image_data:
                 image_data_loaded = True
         else:
@@ -620,12 +787,17 @@ class WsiReg2DMain(QWidget):
                     attachment_mod=attachment_modality,
                 )
                 self.reg_graph.add_attachment_images(
-                    attachment_modality, mod_tag, file_path, mod_spacing
+                    attachment_modality,
+                    mod_tag,
+                    image_data.registration_level
+                    if isinstance(image_data, ZarrWsiRegImage)
+                    else file_path,
+                    mod_spacing,
                 )
             else:
                 selected_layer.name = mod_tag
                 self.layer_data.update({mod_tag: selected_layer})
-                if file_path != "in-memory layer":
+                if file_path != "in-memory layer" and not is_zarr_path(file_path):
                     in_data = file_path
                 elif selected_layer.multiscale:
                     in_data = selected_layer.data[0]
@@ -673,7 +845,10 @@ class WsiReg2DMain(QWidget):
         no_dialog: bool = False,
         from_file: bool = True,
         selected_layer: Optional[Union[Image, Labels]] = None,
+        shape_data: Optional["RegShapes"] = None,
     ):
+        from wsireg.reg_shapes import RegShapes
+
         if len(self.attachment_keys.keys()) == 0:
             emsg = QErrorMessage(self)
             emsg.showMessage(
@@ -682,7 +857,7 @@ class WsiReg2DMain(QWidget):
             )
             return
 
-        if from_file:
+        if from_file and shape_data is None:
             shape_data = RegShapes(file_path)
 
         all_entites = self._get_all_entity_tags()
@@ -742,7 +917,10 @@ class WsiReg2DMain(QWidget):
         no_dialog: bool = False,
         from_file: bool = True,
         selected_layer: Optional[Union[Image, Labels]] = None,
+        mask_data: Optional[Union["WsiRegImage", "RegShapes"]] = None,
     ):
+        from wsireg.reg_shapes import RegShapes
+
         if len(self.attachment_keys.keys()) == 0:
             emsg = QErrorMessage(self)
             emsg.showMessage(
@@ -754,7 +932,9 @@ class WsiReg2DMain(QWidget):
         is_shapes = False
         all_entities = self._get_all_entity_tags()
         if from_file:
-            if Path(file_path).suffix.lower() in [".geojson", ".json"]:
+            if mask_data is not None:
+                is_shapes = isinstance(mask_data, RegShapes)
+            elif Path(file_path).suffix.lower() in [".geojson", ".json"]:
                 mask_data = RegShapes(file_path)
                 is_shapes = True
             else:
@@ -798,6 +978,7 @@ class WsiReg2DMain(QWidget):
                     self._add_shapes_to_viewer(mod_tag, mask_data, mod_spacing)
                 else:
                     mask_data._pixel_spacing = (mod_spacing, mod_spacing)
+                    self.image_data.update({mod_tag: mask_data})
                     self._run_add_image(
                         mod_tag,
                         mask_data,
@@ -821,7 +1002,7 @@ class WsiReg2DMain(QWidget):
         self.mask_mods.update({mod_tag: attachment_modality})
 
     def _add_shapes_to_viewer(
-        self, mod_tag: str, shape_data: RegShapes, mod_spacing: float
+        self, mod_tag: str, shape_data: "RegShapes", mod_spacing: float
     ):
         shape_arrays, shape_props, shape_text = self._get_shape_data_from_reg_shapes(
             shape_data
@@ -841,7 +1022,7 @@ class WsiReg2DMain(QWidget):
         )
 
     def _get_shape_data_from_reg_shapes(
-        self, shape_data: RegShapes
+        self, shape_data: "RegShapes"
     ) -> Tuple[List[np.ndarray], Dict[str, List[str]], Dict[str, Union[str, int]]]:
         shape_arrays = [s["array"][:, [1, 0]] for s in shape_data.shape_data]
         shape_props = {"name": shape_data.shape_names}
@@ -868,6 +1049,8 @@ class WsiReg2DMain(QWidget):
         return mod_data
 
     def _edit_data(self):
+        from wsireg.parameter_maps.preprocessing import ImagePreproParams
+
         mod_items = self.mod_list.selectedItems()
         if len(mod_items) == 1:
             mod_tag, mod_path, mod_spacing, mod_type = self._get_current_mod_item()
@@ -1050,10 +1233,12 @@ class WsiReg2DMain(QWidget):
                     self._pop_napari_layer_data(mod_tag)
                 except (ValueError, KeyError):
                     pass
+                self._close_image_data(mod_tag)
 
             elif mod_type.name == "MASK":
                 if mod_tag in self.mask_mods.keys():
                     self._pop_napari_layer_data(mod_tag)
+                    self._close_image_data(mod_tag)
                     attachment_modality = self.mask_mods[mod_tag]
                     try:
                         self.reg_graph.modalities[attachment_modality]["mask"] = None
@@ -1103,6 +1288,7 @@ class WsiReg2DMain(QWidget):
                 except ValueError:
                     continue
                 self.mod_list.takeItem(rm_idx)
+                self._close_image_data(assoc_mod)
                 try:
                     self._pop_napari_layer_data(assoc_mod)
                 except KeyError:
@@ -1142,6 +1328,56 @@ class WsiReg2DMain(QWidget):
         else:
             self.viewer.layers.pop(self.viewer.layers.index(ld.name))
 
+    def _schedule_prefetch(self, _=None) -> None:
+        # tiles queued for a viewport that moved on are not read
+        self._prefetcher.cancel()
+        self._prefetch_timer.start()
+
+    def _prefetch_requests(self) -> List["PrefetchRequest"]:
+        from napari_wsireg.data.utils.prefetch import PrefetchRequest
+
+        if self.viewer.dims.ndisplay != 2:
+            return []
+        requests = []
+        for layer_data in self.layer_data.values():
+            layers = layer_data if isinstance(layer_data, list) else [layer_data]
+            for layer in layers:
+                if (
+                    not isinstance(layer, Image)
+                    or not layer.multiscale
+                    or not layer.visible
+                    or layer not in self.viewer.layers
+                ):
+                    continue
+                # corners of the viewport in pixels of the level on screen
+                corners = np.asarray(layer.corner_pixels, dtype=int)
+                viewport = (
+                    (corners[0, -2], corners[1, -2] + 1),
+                    (corners[0, -1], corners[1, -1] + 1),
+                )
+                requests.append(
+                    PrefetchRequest(
+                        list(layer.data),
+                        layer.data_level,
+                        viewport,
+                        leading=tuple(corners[0, :-2]),
+                        rgb=layer.rgb,
+                    )
+                )
+        return requests
+
+    def _prefetch_viewport(self) -> None:
+        self._prefetcher.update(self._prefetch_requests())
+
+    def _close_image_data(self, mod_tag: str) -> None:
+        image_data = self.image_data.pop(mod_tag, None)
+        if image_data is not None:
+            image_data.close()
+
+    def _close_all_image_data(self) -> None:
+        for mod_tag in list(self.image_data.keys()):
+            self._close_image_data(mod_tag)
+
     def set_project_output_dir(self, file_path: Optional[Union[str, Path]]) -> None:
         if not file_path:
             output_dir = QFileDialog.getExistingDirectory(
@@ -1152,6 +1388,8 @@ class WsiReg2DMain(QWidget):
                 self.output_dir_entry.setToolTip(Path(output_dir).as_posix())
 
     def _update_preprocessing(self):
+        from wsireg.parameter_maps.preprocessing import ImagePreproParams
+
         mod_tag = self.current_mod_in_prepro.text()
         if mod_tag not in ["[no preprocessing data type]", "[none selected]"]:
             preprocessing, channel_names = deepcopy(
@@ -1296,6 +1534,8 @@ class WsiReg2DMain(QWidget):
         return super().eventFilter(source, event)
 
     def _get_layer_spatial_info(self, layer):
+        from napari_wsireg.data.utils.image import guess_rgb
+
         is_mc = isinstance(layer, list)
         is_multiscale = layer[0].multiscale if is_mc else layer.multiscale
 
@@ -1472,8 +1712,10 @@ class WsiReg2DMain(QWidget):
         }
 
     def _add_registered_data_from_executed_graph(
-        self, reg_graph_output: Tuple[List[str], WsiReg2D]
+        self, reg_graph_output: Tuple[List[str], "WsiReg2D"]
     ) -> None:
+        from wsireg.reg_shapes import RegShapes
+
         output_data, reg_graph = reg_graph_output
         for output in output_data:
             name = Path(output).name
@@ -1497,6 +1739,8 @@ class WsiReg2DMain(QWidget):
                     scale=shape_spacing,
                 )
             else:
+                from napari_wsireg.data import TiffFileWsiRegImage
+
                 image_data = TiffFileWsiRegImage(output)
                 image_data.prepare_image_data()
                 channel_names = [f"{name}-{c}" for c in image_data.channel_names]
@@ -1509,31 +1753,123 @@ class WsiReg2DMain(QWidget):
                     rgb=image_data.is_rgb,
                 )
 
-    def _check_modalities_for_napari_layers(self) -> None:
+    def _get_layer_writer(self) -> str:
+        if self.setup.proj_ctrl.layer_writer.currentText() == "OME-Zarr":
+            return "ome.zarr"
+        return "ome.tiff"
+
+    def _hand_off_backing_stores(self) -> None:
+        from wsireg.parameter_maps.preprocessing import ImagePreproParams
+        from wsireg.utils.im_utils import ARRAYLIKE_CLASSES
+
+        from napari_wsireg.data.utils.stores import find_backing_store
+
+        self.backing_stores = dict()
+        for image_name, image_data in self.reg_graph.modalities.items():
+            in_image = image_data["image_filepath"]
+            # layers and exported OME-Zarr stores are held as arrays, which
+            # can't be compared to a string
+            if isinstance(in_image, str) and in_image == "in-memory layer":
+                in_image = self.layer_data[image_name].data
+            elif not isinstance(in_image, ARRAYLIKE_CLASSES):
+                continue
+
+            backing_store = find_backing_store(in_image)
+            if backing_store is None:
+                continue
+            self.backing_stores[image_name] = backing_store._replace(
+                pixel_spacing=self.image_spacings.get(image_name)
+            )
+
+            if backing_store.is_tiff:
+                image_data["image_filepath"] = str(backing_store.path)
+                if backing_store.channel is not None:
+                    # the layer is one channel of the file wsireg reads
+                    preprocessing = image_data["preprocessing"]
+                    prepro_data = dict(preprocessing) if preprocessing else dict()
+                    prepro_data["ch_indices"] = [backing_store.channel]
+                    image_data["preprocessing"] = ImagePreproParams(**prepro_data)
+            else:
+                # wsireg reads zarr as an array, the layer data reads the store
+                image_data["image_filepath"] = (
+                    in_image[0] if isinstance(in_image, (list, tuple)) else in_image
+                )
+
+    def _collect_napari_layer_exports(self) -> List[Tuple[str, str, Any, str]]:
+        from wsireg.utils.im_utils import ARRAYLIKE_CLASSES
+
+        exports = []
         for shape_name, shape_data in self.reg_graph.shape_sets.items():
             if shape_data["shape_files"] == "in-memory layer":
                 output_fp = str(
                     self.reg_graph.output_dir
                     / f"{self.reg_graph.project_name}-{shape_name}-from-napari-layer.geojson"
                 )
-                output_shapes_fp = napari_shapes_to_qp_geojson(
-                    self.layer_data[shape_name], output_fp
+                exports.append(
+                    ("shape", shape_name, self.layer_data[shape_name], output_fp)
                 )
-                shape_data["shape_files"] = output_shapes_fp
 
         for image_name, image_data in self.reg_graph.modalities.items():
-            if (
-                isinstance(image_data["image_filepath"], ARRAYLIKE_CLASSES)
-                or image_data["image_filepath"] == "in-memory layer"
+            if image_name in self.backing_stores:
+                continue
+            in_image = image_data["image_filepath"]
+            if isinstance(in_image, ARRAYLIKE_CLASSES) or (
+                isinstance(in_image, str) and in_image == "in-memory layer"
             ):
                 output_fp = str(
                     self.reg_graph.output_dir
                     / f"{self.reg_graph.project_name}-{image_name}-from-napari-layer.tiff"
                 )
-                output_image_fp = write_image_from_napari(
-                    self.layer_data[image_name].data, output_fp
+                if not isinstance(in_image, ARRAYLIKE_CLASSES):
+                    in_image = self.layer_data[image_name].data
+                exports.append(("image", image_name, in_image, output_fp))
+        return exports
+
+    @thread_worker
+    def _export_napari_layers(
+        self,
+        exports: List[Tuple[str, str, Any, str]],
+        layer_writer: str,
+        write_progress: "WriteProgress",
+    ) -> Dict[Tuple[str, str], Any]:
+        from napari_wsireg.data import ZarrWsiRegImage
+        from napari_wsireg.data.utils.writers import write_image_from_napari
+
+        exported = dict()
+        for data_type, name, data, output_fp in exports:
+            write_progress.check()
+            if data_type == "shape":
+                exported[(data_type, name)] = napari_shapes_to_qp_geojson(
+                    data, output_fp
                 )
-                image_data["image_filepath"] = output_image_fp
+                continue
+
+            # label values are kept through the pyramid, not averaged
+            is_labels = isinstance(self.layer_data.get(name), Labels)
+            output_image_fp = write_image_from_napari(
+                data,
+                output_fp,
+                file_writer=layer_writer,
+                pixel_spacing=self.image_spacings.get(name),
+                write_progress=write_progress,
+                reducer="mode" if is_labels else "mean",
+            )
+            if layer_writer == "ome.zarr":
+                # wsireg reads OME-Zarr as an array, backed by the written store
+                zarr_image = ZarrWsiRegImage(output_image_fp)
+                exported[(data_type, name)] = zarr_image.registration_level
+            else:
+                exported[(data_type, name)] = output_image_fp
+        return exported
+
+    def _apply_napari_layer_exports(self, exported: Dict[Tuple[str, str], Any]) -> None:
+        for (data_type, name), output in exported.items():
+            if data_type == "shape" and name in self.reg_graph.shape_sets:
+                self.reg_graph.shape_sets[name]["shape_files"] = output
+            elif data_type == "image" and name in self.reg_graph.modalities:
+                self.reg_graph.modalities[name]["image_filepath"] = output
+
+        for image_name, image_data in self.reg_graph.modalities.items():
             if isinstance(image_data["mask"], str):
                 if (
                     Path(image_data["mask"]).suffix.lower() == ".geojson"
@@ -1546,6 +1882,79 @@ class WsiReg2DMain(QWidget):
                     shutil.copy(image_data["mask"], output_fp)
                     image_data["mask"] = output_fp
 
+    def _set_exporting(self, exporting: bool) -> None:
+        self.run_reg_btn.setEnabled(not exporting)
+        self.add_to_queue_btn.setEnabled(not exporting)
+        self.cancel_export_btn.setEnabled(exporting)
+
+    def _export_failed(self, error: Exception) -> None:
+        from napari_wsireg.data.utils.writers import WriteCancelled
+
+        if isinstance(error, WriteCancelled):
+            self.progress_label.setText("napari layer export cancelled")
+            return
+        emsg = QErrorMessage(self)
+        emsg.showMessage(f"napari layers could not be written: {error}")
+
+    def _check_modalities_for_napari_layers(
+        self, on_exported: Callable[[], None]
+    ) -> None:
+        """
+        Write the in-memory napari layers of the graph to the output directory
+        in a background thread, `on_exported` is called on the GUI thread once
+        the graph refers to the written files and is not called if the export
+        is cancelled or fails
+        """
+        from napari_wsireg.data.utils.writers import WriteProgress, layer_write_nbytes
+
+        # layers read from files on disk are registered from those files
+        self._hand_off_backing_stores()
+        exports = self._collect_napari_layer_exports()
+        if len(exports) == 0:
+            self._apply_napari_layer_exports(dict())
+            on_exported()
+            return
+
+        layer_writer = self._get_layer_writer()
+        write_progress = WriteProgress(
+            sum(
+                layer_write_nbytes(data, layer_writer)
+                for data_type, _, data, _ in exports
+                if data_type == "image"
+            )
+        )
+        self._write_progress = write_progress
+        self._set_exporting(True)
+
+        export_pbar = progress(total=write_progress.total_bytes)
+        export_pbar.set_description("writing napari layers")
+        # the writing thread only counts bytes, the bar is updated from here
+        pbar_timer = QTimer(self)
+        pbar_timer.setInterval(250)
+        pbar_timer.timeout.connect(
+            lambda: export_pbar.update(write_progress.bytes_written - export_pbar.n)
+        )
+
+        def _export_done():
+            pbar_timer.stop()
+            export_pbar.close()
+            self._write_progress = None
+            self._set_exporting(False)
+
+        export_worker = self._export_napari_layers(
+            exports, layer_writer, write_progress
+        )
+        export_worker.finished.connect(_export_done)
+        export_worker.errored.connect(self._export_failed)
+        export_worker.returned.connect(self._apply_napari_layer_exports)
+        export_worker.returned.connect(lambda _: on_exported())
+        pbar_timer.start()
+        export_worker.start()
+
+    def cancel_napari_layer_export(self) -> None:
+        if self._write_progress:
+            self._write_progress.cancel()
+
     def run_registration_direct(self):
         if self._threadpool.activeThreadCount() > 0:
             msg = QMessageBox(self)
@@ -1567,42 +1976,45 @@ class WsiReg2DMain(QWidget):
             self.reg_graph.setup_project_output(
                 self.project_name_entry.text(), output_dir=self.output_dir_entry.text()
             )
-            self._check_modalities_for_napari_layers()
-            cache_images = self.setup.proj_ctrl.cache_images_check.isChecked()
-            self.reg_graph.cache_images = cache_images
-            reg_opts = self._get_proj_opts()
+            # registration starts once the napari layers are on disk
+            self._check_modalities_for_napari_layers(self._start_registration)
 
-            self._pbar = progress(total=0)
-            self._pbar.set_description(
-                f"Registering graph {self.reg_graph.project_name}"
-            )
-            graph_runner_worker = self._run_registration(
-                deepcopy(self.reg_graph), reg_opts
-            )
-            graph_runner_worker.started.connect(lambda: self._clear_graph("run"))
-            graph_runner_worker.returned.connect(
-                self._add_registered_data_from_executed_graph
-            )
-            graph_runner_worker.finished.connect(
-                lambda: self._pbar.set_description(
-                    f"finished registered {self.reg_graph.project_name}"
-                )
+    def _start_registration(self):
+        cache_images = self.setup.proj_ctrl.cache_images_check.isChecked()
+        self.reg_graph.cache_images = cache_images
+        reg_opts = self._get_proj_opts()
+
+        self._pbar = progress(total=0)
+        self._pbar.set_description(f"Registering graph {self.reg_graph.project_name}")
+        graph_runner_worker = self._run_registration(deepcopy(self.reg_graph), reg_opts)
+        graph_runner_worker.started.connect(lambda: self._clear_graph("run"))
+        graph_runner_worker.returned.connect(
+            self._add_registered_data_from_executed_graph
+        )
+        graph_runner_worker.finished.connect(
+            lambda: self._pbar.set_description(
+                f"finished registered {self.reg_graph.project_name}"
             )
-            graph_runner_worker.finished.connect(self._pbar.close)
-            self._threadpool.start(graph_runner_worker)
+        )
+        graph_runner_worker.finished.connect(self._pbar.close)
+        self._threadpool.start(graph_runner_worker)
 
     @thread_worker
     def _run_registration(
-        self, reg_graph: WsiReg2D, reg_opts: dict
-    ) -> Tuple[List[str], WsiReg2D]:
-        output_data = wsireg2d_main(reg_graph, **reg_opts)
+        self, reg_graph: "WsiReg2D", reg_opts: dict
+    ) -> Tuple[List[str], "WsiReg2D"]:
+        # graphs wait here for their share of the thread budget
+        from wsireg.wsireg2d import wsireg_run as wsireg2d_main
+
+        with get_resource_manager().registration_grant():
+            output_data = wsireg2d_main(reg_graph, **reg_opts)
         return output_data, reg_graph
 
-    def _add_graph_item_to_queue(self, reg_graph: WsiReg2D, reg_opts: dict) -> None:
+    def _add_graph_item_to_queue(self, reg_graph: "WsiReg2D", reg_opts: dict) -> None:
         queue_item = reg_queue_item(reg_graph, reg_opts)
         self.queue_list.addItem(queue_item)
 
-    def _check_queue_for_identical_item(self, reg_graph: WsiReg2D) -> bool:
+    def _check_queue_for_identical_item(self, reg_graph: "WsiReg2D") -> bool:
         queue_tags = [
             self.queue_list.item(r).queue_tag for r in range(self.queue_list.count())
         ]
@@ -1624,15 +2036,15 @@ class WsiReg2DMain(QWidget):
             self.reg_graph.setup_project_output(
                 self.project_name_entry.text(), output_dir=self.output_dir_entry.text()
             )
-            self._check_modalities_for_napari_layers()
-            cache_images = self.setup.proj_ctrl.cache_images_check.isChecked()
-            self.reg_graph.cache_images = cache_images
-            reg_opts = self._get_proj_opts()
-            if self._check_queue_for_identical_item(self.reg_graph):
-                self._add_graph_item_to_queue(
-                    deepcopy(self.reg_graph), deepcopy(reg_opts)
-                )
-                self._clear_graph("queue")
+            self._check_modalities_for_napari_layers(self._queue_current_graph)
+
+    def _queue_current_graph(self):
+        cache_images = self.setup.proj_ctrl.cache_images_check.isChecked()
+        self.reg_graph.cache_images = cache_images
+        reg_opts = self._get_proj_opts()
+        if self._check_queue_for_identical_item(self.reg_graph):
+            self._add_graph_item_to_queue(deepcopy(self.reg_graph), deepcopy(reg_opts))
+            self._clear_graph("queue")
 
     def _set_running_queue_label(self, running_data):
         self.progress_label.setText(running_data)
@@ -1736,9 +2148,10 @@ class WsiReg2DMain(QWidget):
 
         self.mod_list.selectAll()
         self.delete_modality(warn=False)
+        self._close_all_image_data()
 
-        self.reg_graph: WsiReg2D = WsiReg2D(None, None)
-        self.graph_queue: List[Tuple[WsiReg2D, Dict[str, bool]]] = []
+        self._reg_graph: Optional["WsiReg2D"] = None
+        self.graph_queue: List[Tuple["WsiReg2D", Dict[str, bool]]] = []
 
         self.image_mods: List[str] = []
         self.attachment_mods: List[str] = []
@@ -1746,13 +2159,18 @@ class WsiReg2DMain(QWidget):
         self.merge_mods: Dict[str, List[str]] = dict()
         self.mask_mods: Dict[str, str] = dict()
 
-        self.image_data: Dict[str, WsiRegImage] = dict()
+        self.image_data: Dict[str, "WsiRegImage"] = dict()
         self.layer_data: Dict[str, Any] = dict()
         self.image_spacings: Dict[str, float] = dict()
         self.attachment_keys: Dict[str, List[str]] = dict()
         self.project_name_entry.setText("")
 
     def closeEvent(self, _) -> None:
+        for event in self._viewport_events:
+            event.disconnect(self._schedule_prefetch)
+        self._prefetch_timer.stop()
+        self._prefetcher.close()
+        self._close_all_image_data()
         self._temp_dir.cleanup()
 
 
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from napari_wsireg.data.utils.cache import CACHE_DIR_ENV, get_pyramid_cache
+
+# scale tests write slides of production size and only run when this is set
+SCALE_TESTS_ENV = "NAPARI_WSIREG_SCALE_TESTS"
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        f"scale: reads synthetic slides of production size, run with {SCALE_TESTS_ENV}=1",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get(SCALE_TESTS_ENV):
+        return
+    skip_scale = pytest.mark.skip(reason=f"set {SCALE_TESTS_ENV}=1 to run")
+    for item in items:
+        if item.get_closest_marker("scale") is not None:
+            item.add_marker(skip_scale)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_pyramid_cache(tmp_path_factory):
+    """keep tests that enable the pyramid cache from writing to the user's cache"""
+    prev_cache_dir = os.environ.get(CACHE_DIR_ENV)
+    os.environ[CACHE_DIR_ENV] = str(tmp_path_factory.mktemp("pyramid_cache"))
+    get_pyramid_cache.cache_clear()
+    yield
+    if prev_cache_dir is None:
+        os.environ.pop(CACHE_DIR_ENV)
+    else:
+        os.environ[CACHE_DIR_ENV] = prev_cache_dir
+    get_pyramid_cache.cache_clear()
@@ -1,11 +1,43 @@
-from string import Template
+from importlib import import_module
 
-from .czi_image import CziWsiRegImage  # noqa: F401
-from .tifffile_image import TIFFFILE_EXTS, TiffFileWsiRegImage  # noqa: F401
-from .wsireg_image import WsiRegImage  # noqa: F401
-
-FILE_ERROR_MESSAGE = Template(
-    "The imported data file $file_path with extesnsion "
-    "$ext does not match an acceptable "
-    "tiff extension: \n[$tiff_ext] \nor .czi for Zeiss images"
+from .readers import (  # noqa: F401
+    CZI_EXTS,
+    FILE_ERROR_MESSAGE,
+    TIFFFILE_EXTS,
+    ZARR_EXTS,
+    ReaderSpec,
+    find_reader,
+    is_zarr_path,
+    open_image_data,
+    register_reader,
+    registered_readers,
 )
+
+# reader classes are imported on first access, importing the package does not
+# import the backends of every format
+_LAZY_ATTRIBUTES = {
+    "CziWsiRegImage": ".czi_image",
+    "TiffFileWsiRegImage": ".tifffile_image",
+    "WsiRegImage": ".wsireg_image",
+    "ZarrWsiRegImage": ".zarr_image",
+}
+
+__all__ = [
+    "CZI_EXTS",
+    "FILE_ERROR_MESSAGE",
+    "TIFFFILE_EXTS",
+    "ZARR_EXTS",
+    "ReaderSpec",
+    "find_reader",
+    "is_zarr_path",
+    "open_image_data",
+    "register_reader",
+    "registered_readers",
+    *_LAZY_ATTRIBUTES,
+]
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
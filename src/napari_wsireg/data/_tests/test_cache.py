@@ -0,0 +1,212 @@
+import os
+from pathlib import Path
+
+import dask.array as da
+import numpy as np
+import zarr
+from tifffile import imwrite
+
+from napari_wsireg._tests.fixtures.czi_writer import write_czi
+from napari_wsireg.data import CziWsiRegImage, TiffFileWsiRegImage
+from napari_wsireg.data.utils.cache import (
+    CACHE_DIR_ENV,
+    CACHE_MAX_GB_ENV,
+    PyramidCache,
+    get_pyramid_cache,
+)
+from napari_wsireg.data.utils.czi import CziRegImageReader
+
+
+def _write_ones(store):
+    zarr.open_group(store, mode="a").create_dataset(
+        "0", data=np.ones((256, 256), dtype=np.uint8), chunks=(256, 256)
+    )
+
+
+def test_PyramidCache_get_or_create(tmp_path):
+    im_fp = tmp_path / "im.bin"
+    im_fp.write_bytes(b"image")
+    cache = PyramidCache(tmp_path / "cache", max_bytes=2**30)
+    calls = []
+
+    def writer(store):
+        calls.append(store)
+        _write_ones(store)
+
+    assert cache.get(im_fp, "v") is None
+    group = cache.get_or_create(im_fp, "v", writer)
+    np.testing.assert_array_equal(group["0"][:], 1)
+    cache.get_or_create(im_fp, "v", writer)
+    assert len(calls) == 1
+
+    # different variants and modified files are different entries
+    cache.get_or_create(im_fp, "other", writer)
+    assert len(calls) == 2
+    os.utime(im_fp, ns=(0, 0))
+    assert cache.get(im_fp, "v") is None
+
+    assert not list((tmp_path / "cache").glob("*.tmp"))
+
+
+def test_PyramidCache_lru_eviction(tmp_path):
+    cache = PyramidCache(tmp_path / "cache", max_bytes=2**30)
+    im_fps = []
+    for idx in range(3):
+        im_fp = tmp_path / f"im{idx}.bin"
+        im_fp.write_bytes(b"image")
+        im_fps.append(im_fp)
+        cache.put(im_fp, "v", _write_ones)
+        entry_fp = cache.entry_path(cache.key(im_fp, "v"))
+        os.utime(entry_fp, (idx, idx))
+
+    # accessing the oldest entry makes it the most recently used
+    assert cache.get(im_fps[0], "v") is not None
+    entry_size = cache.entries()[0][2]
+    cache.max_bytes = entry_size * 2
+    cache.evict()
+
+    assert cache.get(im_fps[1], "v") is None
+    assert cache.get(im_fps[0], "v") is not None
+    assert cache.get(im_fps[2], "v") is not None
+
+
+def test_PyramidCache_lease(tmp_path):
+    cache = PyramidCache(tmp_path / "cache", max_bytes=2**30)
+    im_fps = []
+    for idx in range(2):
+        im_fp = tmp_path / f"im{idx}.bin"
+        im_fp.write_bytes(b"image")
+        im_fps.append(im_fp)
+        cache.put(im_fp, "v", _write_ones)
+    entry_fp = cache.entry_path(cache.key(im_fps[0], "v"))
+
+    # leases are counted, the entry is pinned until the last is released
+    leases = [cache.lease(im_fps[0], "v") for _ in range(2)]
+    group = cache.get(im_fps[0], "v")
+    cache.max_bytes = 1
+    cache.evict()
+    assert entry_fp.exists()
+    assert cache.get(im_fps[1], "v") is None
+    np.testing.assert_array_equal(group["0"][:], 1)
+
+    leases[0].release()
+    leases[0].release()
+    cache.evict()
+    assert entry_fp.exists()
+    leases[1].release()
+    cache.evict()
+    assert not entry_fp.exists()
+    assert not list((tmp_path / "cache").glob("*.lease"))
+
+
+def test_PyramidCache_stale_lease(tmp_path):
+    im_fp = tmp_path / "im.bin"
+    im_fp.write_bytes(b"image")
+    cache = PyramidCache(tmp_path / "cache", max_bytes=2**30)
+    cache.put(im_fp, "v", _write_ones)
+    key = cache.key(im_fp, "v")
+    # pid of a process that has exited
+    stale_fp = tmp_path / "cache" / f"{key}.{2**22 + 1}.lease"
+    stale_fp.touch()
+
+    cache.max_bytes = 1
+    cache.evict()
+    assert not cache.entry_path(key).exists()
+    assert not stale_fp.exists()
+
+
+def test_CziWsiRegImage_cached_pyramid_open_during_eviction(tmp_path):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (1, 1100, 1300), dtype=np.uint8)
+    im_fp = write_czi(tmp_path / "sc_no_pyr.czi", image, tile_size=300)
+    other_fp = tmp_path / "other.bin"
+    other_fp.write_bytes(b"image")
+    cache = PyramidCache(tmp_path / "cache", max_bytes=2**30)
+
+    czi_wsi = CziWsiRegImage(im_fp, pyramid_mode="zarr", pyramid_cache=cache)
+    czi_wsi.prepare_image_data()
+    sub_res = czi_wsi.dask_pyr[1].compute()
+
+    # storing another entry over the cap evicts around the open pyramid
+    cache.max_bytes = 1
+    cache.put(other_fp, "v", _write_ones)
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[1], sub_res)
+    assert len(cache.entries()) == 2
+
+    czi_wsi.close()
+    cache.evict()
+    assert len(cache.entries()) == 0
+
+
+def test_PyramidCache_disabled(tmp_path, monkeypatch):
+    cache = PyramidCache(tmp_path / "cache", max_bytes=0)
+    assert cache.enabled is False
+
+    # the cache is opt-in
+    monkeypatch.delenv(CACHE_MAX_GB_ENV, raising=False)
+    assert PyramidCache(tmp_path / "cache").enabled is False
+    monkeypatch.setenv(CACHE_MAX_GB_ENV, "0.5")
+    assert PyramidCache(tmp_path / "cache").max_bytes == 2**29
+
+
+def test_get_pyramid_cache_enabled(tmp_path, monkeypatch):
+    rng = np.random.default_rng(42)
+    im_fp = tmp_path / "mc.tiff"
+    imwrite(im_fp, rng.integers(0, 255, (2, 2048, 2048), dtype=np.uint8))
+
+    # readers use the process wide cache, in the session's isolated directory
+    monkeypatch.setenv(CACHE_MAX_GB_ENV, "1")
+    get_pyramid_cache.cache_clear()
+    try:
+        cache = get_pyramid_cache()
+        assert cache.enabled is True
+        assert cache.cache_dir == Path(os.environ[CACHE_DIR_ENV])
+
+        tf_wsi = TiffFileWsiRegImage(im_fp)
+        tf_wsi.prepare_image_data()
+        assert tf_wsi.thumbnail.shape == (2, 128, 128)
+        assert len(cache.entries()) == 1
+        tf_wsi.close()
+    finally:
+        get_pyramid_cache.cache_clear()
+
+
+def test_CziWsiRegImage_cached_zarr_pyramid(tmp_path, monkeypatch):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (2, 1100, 1300), dtype=np.uint8)
+    im_fp = write_czi(tmp_path / "mc_no_pyr.czi", image, tile_size=300)
+    cache = PyramidCache(tmp_path / "cache", max_bytes=2**30)
+
+    czi_wsi = CziWsiRegImage(im_fp, pyramid_mode="zarr", pyramid_cache=cache)
+    czi_wsi.prepare_image_data()
+    sub_res = czi_wsi.dask_pyr[1].compute()
+    czi_wsi.close()
+    assert len(cache.entries()) == 1
+
+    def not_cached(*args, **kwargs):
+        raise AssertionError("pyramid was recomputed")
+
+    monkeypatch.setattr(CziRegImageReader, "zarr_pyramidalize_czi", not_cached)
+    czi_wsi = CziWsiRegImage(im_fp, pyramid_mode="zarr", pyramid_cache=cache)
+    czi_wsi.prepare_image_data()
+    assert len(czi_wsi.dask_pyr) == 2
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[0], image)
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[1], sub_res)
+    czi_wsi.close()
+
+
+def test_TiffFileWsiRegImage_cached_thumbnail(tmp_path):
+    rng = np.random.default_rng(42)
+    im_fp = tmp_path / "mc.tiff"
+    zarr_im = rng.integers(0, 255, (2, 2048, 2048), dtype=np.uint8)
+    imwrite(im_fp, zarr_im, rowsperstrip=8)
+    cache = PyramidCache(tmp_path / "cache", max_bytes=2**30)
+
+    tf_wsi = TiffFileWsiRegImage(im_fp, pyramid_cache=cache)
+    tf_wsi.prepare_image_data()
+    assert isinstance(tf_wsi.thumbnail, da.Array)
+    assert tf_wsi.thumbnail.shape == (2, 128, 128)
+    assert len(cache.entries()) == 1
+    # single-level thumbnails of thin strips sample every 16th pixel
+    np.testing.assert_array_equal(tf_wsi.thumbnail, zarr_im[:, ::16, ::16])
+    tf_wsi.close()
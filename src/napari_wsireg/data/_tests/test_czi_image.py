@@ -2,9 +2,18 @@ import os
 from pathlib import Path
 
 import dask.array as da
+import numpy as np
 import pytest
+import zarr
 
+from napari_wsireg._tests.fixtures.czi_writer import write_czi
 from napari_wsireg.data import CziWsiRegImage
+from napari_wsireg.data.utils.czi import (
+    CziRegImageReader,
+    czi_index_sidecar_path,
+    get_level_blocks,
+)
+from napari_wsireg.resources import ResourceManager, get_resource_manager
 
 # private data logic borrowed from
 # https://github.com/cgohlke/tifffile/tests/test_tifffile.py
@@ -145,3 +154,288 @@ def test_CziWsiRegImage_mc_thumbnail():
     assert czi_wsi.channel_names == ["DAPI", "EGFP", "DsRed"]
     assert czi_wsi.channel_colors is not None
     assert czi_wsi.thumbnail_spacing[0] > 0
+
+
+@pytest.fixture
+def mc_pyr_czi(tmp_path):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (3, 700, 900), dtype=np.uint8)
+    im_fp = write_czi(
+        tmp_path / "mc_pyr.czi",
+        image,
+        channel_names=["DAPI", "EGFP", "DsRed"],
+        tile_size=256,
+        pyramid_factors=(2, 4),
+    )
+    return im_fp, image
+
+
+def test_CziWsiRegImage_header_only(mc_pyr_czi):
+    im_fp, image = mc_pyr_czi
+    czi_wsi = CziWsiRegImage(im_fp, header_only=True)
+
+    assert czi_wsi.header_only is True
+    assert czi_wsi.shape == (3, 700, 900)
+    assert czi_wsi.channel_names == ["DAPI", "EGFP", "DsRed"]
+    assert czi_wsi.pixel_spacing == (0.65, 0.65)
+    with pytest.raises(AttributeError):
+        czi_wsi.thumbnail
+
+    czi_wsi.prepare_image_data()
+    assert czi_wsi.header_only is False
+    czi_wsi.close()
+
+
+def test_czi_subblock_index(mc_pyr_czi):
+    im_fp, _ = mc_pyr_czi
+    czi = CziRegImageReader(im_fp)
+    index = czi.subblock_index
+
+    assert index.levels == [1, 2, 4]
+    assert index.channels == [0, 1, 2]
+    assert index.bounds(1) == (0, 0, 700, 900)
+    assert index.bounds(4) == (0, 0, 700, 900)
+    assert len(index.level(1)) == 3 * 3 * 4
+    assert len(index.level(4, channels=[1])) == 1
+
+    # 256 px tiles, a region within the first tile and across four tiles
+    assert len(index.query((0, 0, 100, 100), channels=[0])) == 1
+    assert len(index.query((200, 200, 300, 300), channels=[0])) == 4
+    assert len(index.query((200, 200, 300, 300), downsample=2)) == 3
+
+    level_blocks = get_level_blocks(czi)
+    assert sorted(level_blocks.keys()) == [0, 2, 4]
+    assert len(level_blocks[4]) == 3
+    czi.close()
+
+
+def test_czi_subblock_index_sidecar(mc_pyr_czi):
+    im_fp, _ = mc_pyr_czi
+    index_fp = czi_index_sidecar_path(im_fp)
+
+    czi = CziRegImageReader(im_fp, index_sidecar=True)
+    records = czi.subblock_index.records
+    czi.close()
+    assert index_fp.exists()
+
+    czi = CziRegImageReader(im_fp, index_sidecar=True)
+    assert czi.subblock_index.records == records
+    czi.close()
+
+    # stale sidecars are rebuilt
+    os.utime(im_fp, (0, 0))
+    czi = CziRegImageReader(im_fp, index_sidecar=True)
+    assert czi.subblock_index.records == records
+    czi.close()
+
+
+def test_CziWsiRegImage_stored_pyramid_thumbnail(mc_pyr_czi):
+    im_fp, image = mc_pyr_czi
+    czi_wsi = CziWsiRegImage(im_fp)
+
+    assert czi_wsi.thumbnail.shape == (3, 175, 225)
+    assert czi_wsi.thumbnail_spacing == (2.6, 2.6)
+    np.testing.assert_array_equal(czi_wsi.thumbnail, image[:, ::4, ::4])
+    czi_wsi.close()
+
+
+def test_CziWsiRegImage_stored_pyramid(mc_pyr_czi):
+    im_fp, image = mc_pyr_czi
+    czi_wsi = CziWsiRegImage(im_fp, header_only=True)
+    assert czi_wsi.pyramid_mode == "stored"
+    czi_wsi.prepare_image_data()
+
+    assert [d.shape for d in czi_wsi.dask_pyr] == [
+        (3, 700, 900),
+        (3, 350, 450),
+        (3, 175, 225),
+    ]
+    for level, ds in zip(czi_wsi.dask_pyr, [1, 2, 4]):
+        np.testing.assert_array_equal(level, image[:, ::ds, ::ds])
+    np.testing.assert_array_equal(
+        czi_wsi.dask_pyr[0][1, 123:456, 77:888], image[1, 123:456, 77:888]
+    )
+    czi_wsi.close()
+
+
+def test_CziWsiRegImage_stored_pyramid_rgb_scenes(tmp_path):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (600, 500, 3), dtype=np.uint8)
+    im_fp = write_czi(
+        tmp_path / "rgb_scenes.czi", [image, image[:300]], pyramid_factors=(2,)
+    )
+    czi_wsi = CziWsiRegImage(im_fp, pyramid_mode="stored")
+    czi_wsi.prepare_image_data()
+
+    base = czi_wsi.dask_pyr[0].compute()
+    assert base.shape == (600, 1000, 3)
+    np.testing.assert_array_equal(base[:, :500], image)
+    np.testing.assert_array_equal(base[:300, 500:], image[:300])
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[1][:, :250], image[::2, ::2])
+    czi_wsi.close()
+
+
+def test_czi_subblock_index_grid_query(mc_pyr_czi):
+    im_fp, _ = mc_pyr_czi
+    czi = CziRegImageReader(im_fp)
+    index = czi.subblock_index
+    rng = np.random.default_rng(0)
+
+    for _ in range(50):
+        y0, x0 = rng.integers(0, 700), rng.integers(0, 900)
+        y1, x1 = y0 + rng.integers(1, 400), x0 + rng.integers(1, 400)
+        for ds in index.levels:
+            expected = [
+                r
+                for r in index.level(ds)
+                if r.y < y1 and r.y + r.height > y0 and r.x < x1 and r.x + r.width > x0
+            ]
+            assert index.query((y0, x0, y1, x1), downsample=ds) == expected
+    czi.close()
+
+
+def test_CziWsiRegImage_zarr_mode_lazy_base(tmp_path):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (2, 1100, 1300), dtype=np.uint8)
+    im_fp = write_czi(tmp_path / "mc_no_pyr.czi", image, tile_size=300)
+
+    czi_wsi = CziWsiRegImage(im_fp, header_only=True)
+    assert czi_wsi.pyramid_mode == "zarr"
+    czi_wsi.prepare_image_data()
+
+    # the base level is read from the subblocks, only sub-resolutions are stored
+    assert "czi-" in czi_wsi.dask_pyr[0].name
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[0], image)
+    expected = image.reshape(2, 550, 2, 650, 2).mean(axis=(2, 4)).astype(np.uint8)
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[1], expected)
+    czi_wsi.close()
+
+
+class CountingStore(zarr.MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.n_writes = dict()
+
+    def __setitem__(self, key, value):
+        self.n_writes[key] = self.n_writes.get(key, 0) + 1
+        super().__setitem__(key, value)
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_sub_asarray_chunk_aligned_writes(tmp_path, max_workers):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (2, 2500, 2300), dtype=np.uint8)
+    # tiles straddle the 2048 px zarr chunks
+    im_fp = write_czi(tmp_path / "mc.czi", image, tile_size=700, pyramid_factors=(2,))
+
+    czi = CziRegImageReader(im_fp)
+    store = CountingStore()
+    out = czi.sub_asarray(zarr_fp=store, max_workers=max_workers)
+
+    np.testing.assert_array_equal(np.squeeze(out[:]), image)
+    chunk_writes = [
+        n for k, n in store.n_writes.items() if not k.split("/")[-1].startswith(".")
+    ]
+    assert len(chunk_writes) == 2 * 2 * 2
+    assert all(n == 1 for n in chunk_writes)
+
+    np.testing.assert_array_equal(
+        np.squeeze(czi.sub_asarray(max_workers=max_workers)), image
+    )
+    czi.close()
+
+
+def test_sub_asarray_default_workers(tmp_path, monkeypatch):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (1, 1100, 900), dtype=np.uint8)
+    im_fp = write_czi(tmp_path / "sc.czi", image, tile_size=300)
+
+    manager = get_resource_manager()
+    n_threads = manager.n_threads
+    requested = []
+
+    def request(threads=1, *args, **kwargs):
+        requested.append(threads)
+        return ResourceManager.request(manager, threads, *args, **kwargs)
+
+    monkeypatch.setattr(manager, "request", request)
+    czi = CziRegImageReader(im_fp)
+    try:
+        # the thread budget is asked for, not the number of CPUs
+        manager.set_budget(n_threads=3)
+        np.testing.assert_array_equal(np.squeeze(czi.sub_asarray()), image[0])
+        assert requested == [3]
+    finally:
+        manager.set_budget(n_threads=n_threads)
+        czi.close()
+
+
+@pytest.mark.parametrize("pyramid_mode", ["stored", "zarr"])
+def test_CziWsiRegImage_channel_selection(mc_pyr_czi, pyramid_mode):
+    im_fp, image = mc_pyr_czi
+    czi_wsi = CziWsiRegImage(im_fp, header_only=True, pyramid_mode=pyramid_mode)
+    czi_wsi.prepare_image_data(channel_indices=[0, 2])
+
+    assert czi_wsi.channel_indices == [0, 2]
+    assert czi_wsi.n_ch == 2
+    assert czi_wsi.shape == (2, 700, 900)
+    assert czi_wsi.channel_names == ["DAPI", "DsRed"]
+    assert len(czi_wsi.channel_colors) == 2
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[0], image[[0, 2]])
+    assert czi_wsi.thumbnail.shape[0] == 2
+
+    # subblocks of unselected channels are never decoded
+    decoded = []
+    level = czi_wsi.czi.level_to_dask(1, channel_indices=[1])
+    original_data_segment = type(czi_wsi.czi.subblock_directory[0]).data_segment
+
+    def data_segment(entry):
+        decoded.append(entry.start[entry.axes.index("C")])
+        return original_data_segment(entry)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            type(czi_wsi.czi.subblock_directory[0]), "data_segment", data_segment
+        )
+        np.testing.assert_array_equal(level, image[[1]])
+    assert set(decoded) == {1}
+
+    czi_wsi.prepare_image_data()
+    assert czi_wsi.channel_indices is None
+    assert czi_wsi.channel_names == ["DAPI", "EGFP", "DsRed"]
+    assert czi_wsi.dask_pyr[0].shape == (3, 700, 900)
+
+    with pytest.raises(ValueError):
+        czi_wsi.prepare_image_data(channel_indices=[3])
+    czi_wsi.close()
+
+
+def test_CziWsiRegImage_scene_selection(tmp_path):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (2, 400, 300), dtype=np.uint8)
+    im_fp = write_czi(
+        tmp_path / "mc_scenes.czi", [image, image[:, :200]], pyramid_factors=(2,)
+    )
+    czi_wsi = CziWsiRegImage(im_fp, header_only=True)
+    czi_wsi.prepare_image_data(channel_indices=[1], scene_indices=[1])
+
+    # the base is cropped to the bounds of the selected scene
+    assert czi_wsi.shape == (1, 200, 300)
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[0], image[[1], :200])
+    np.testing.assert_array_equal(czi_wsi.dask_pyr[1], image[[1], :200:2, ::2])
+    czi_wsi.close()
+
+
+def test_sub_asarray_selection(tmp_path):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (3, 500, 400), dtype=np.uint8)
+    im_fp = write_czi(
+        tmp_path / "mc_scenes.czi", [image, image[:, :, :100]], tile_size=128
+    )
+
+    czi = CziRegImageReader(im_fp)
+    out = czi.sub_asarray(channel_indices=[2, 0], scene_indices=[0])
+    assert out.shape[czi.axes.index("S")] == 1
+    assert out.shape[czi.axes.index("C")] == 2
+    np.testing.assert_array_equal(np.squeeze(out)[:, :, :400], image[[2, 0]])
+    czi.close()
@@ -0,0 +1,154 @@
+import dask.array as da
+import numpy as np
+import pytest
+import zarr
+
+from napari_wsireg.data.utils.image import (
+    _sum_dtype,
+    compute_pyramid,
+    compute_sub_res,
+    n_pyramid_levels,
+)
+
+
+class CountingArray:
+    """array-like that counts how often it is read"""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.ndim = array.ndim
+        self.n_reads = 0
+
+    def __getitem__(self, key):
+        self.n_reads += 1
+        return self.array[key]
+
+
+def test_n_pyramid_levels():
+    assert n_pyramid_levels((1000, 1000), 512) == 1
+    assert n_pyramid_levels((1024, 4000), 512) == 2
+    assert n_pyramid_levels((4096, 4096), 512) == 4
+
+
+@pytest.mark.parametrize("is_rgb", [False, True])
+def test_compute_pyramid_matches_direct_coarsening(is_rgb):
+    rng = np.random.default_rng(0)
+    shape = (1100, 900, 3) if is_rgb else (2, 1100, 900)
+    image = rng.integers(0, 255, shape, dtype=np.uint8)
+    chunks = (300, 300, 3) if is_rgb else (1, 300, 300)
+
+    dask_pyr = compute_pyramid(
+        da.from_array(image, chunks=chunks), 4, 256, is_rgb, image.dtype
+    )
+    assert len(dask_pyr) == 4
+    for ds_factor in range(1, 4):
+        expected = compute_sub_res(
+            da.from_array(image), ds_factor, 256, is_rgb, image.dtype
+        )
+        np.testing.assert_array_equal(dask_pyr[ds_factor], expected)
+
+
+def test_compute_pyramid_single_pass_store():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (2, 2100, 1700), dtype=np.uint8)
+    counting = CountingArray(image)
+    base = da.from_array(
+        counting,
+        chunks=(1, 512, 512),
+        asarray=False,
+        meta=np.empty((0, 0, 0), dtype=image.dtype),
+    )
+
+    store = zarr.MemoryStore()
+    dask_pyr = compute_pyramid(base, 4, 256, False, image.dtype, zarr_store=store)
+
+    # every base chunk is read exactly once to write all levels
+    assert counting.n_reads == base.npartitions
+    assert [d.shape for d in dask_pyr] == [
+        (2, 2100, 1700),
+        (2, 1050, 850),
+        (2, 525, 425),
+        (2, 262, 212),
+    ]
+    assert sorted(zarr.open_group(store).array_keys()) == ["1", "2", "3"]
+    np.testing.assert_array_equal(
+        dask_pyr[3], compute_sub_res(da.from_array(image), 3, 256, False, image.dtype)
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.int16, np.float32])
+def test_compute_sub_res_mean_matches_float(dtype):
+    rng = np.random.default_rng(0)
+    info = np.finfo(dtype) if np.dtype(dtype).kind == "f" else np.iinfo(dtype)
+    image = rng.uniform(max(info.min, -1e4), min(info.max, 1e4), (2, 300, 260))
+    image = image.astype(dtype)
+
+    for ds_factor in range(1, 4):
+        sub_res = compute_sub_res(
+            da.from_array(image, chunks=(1, 128, 128)), ds_factor, 64, False, dtype
+        )
+        expected = da.coarsen(
+            np.mean, da.from_array(image), {1: 2**ds_factor, 2: 2**ds_factor}, True
+        ).astype(dtype)
+        assert sub_res.dtype == dtype
+        np.testing.assert_allclose(sub_res, expected, rtol=1e-5)
+
+
+def test_sum_dtype():
+    assert _sum_dtype(np.uint8, 4) == np.uint16
+    assert _sum_dtype(np.uint8, 4**4) == np.uint16
+    assert _sum_dtype(np.uint8, 4**5) == np.uint32
+    assert _sum_dtype(np.int16, 4) == np.int32
+    assert _sum_dtype(np.uint64, 4) == np.float64
+    assert _sum_dtype(np.float32, 4) == np.float32
+
+
+def test_compute_sub_res_reducers():
+    labels = np.array(
+        [
+            [1, 1, 2, 3, 0, 0],
+            [1, 2, 4, 5, 0, 7],
+            [6, 6, 6, 6, 0, 0],
+            [8, 8, 6, 6, 0, 0],
+        ],
+        dtype=np.uint32,
+    )[None]
+
+    def sub_res(reducer, ds_factor=1):
+        return compute_sub_res(
+            da.from_array(labels), ds_factor, 256, False, labels.dtype, reducer
+        ).compute()
+
+    np.testing.assert_array_equal(sub_res("mode"), [[[1, 2, 0], [6, 6, 0]]])
+    np.testing.assert_array_equal(sub_res("nearest"), [[[1, 2, 0], [6, 6, 0]]])
+    np.testing.assert_array_equal(sub_res("max"), [[[2, 5, 7], [8, 6, 0]]])
+    np.testing.assert_array_equal(sub_res("mode", 2), [[[6]]])
+
+    mask = labels > 0
+    mask_sub_res = compute_sub_res(da.from_array(mask), 1, 256, False, bool)
+    np.testing.assert_array_equal(
+        mask_sub_res, [[[True, True, True], [True, True, False]]]
+    )
+
+    with pytest.raises(ValueError):
+        sub_res("median")
+
+
+def test_compute_pyramid_mode_labels():
+    labels = np.repeat(
+        np.repeat(np.arange(16, dtype=np.uint16).reshape(4, 4), 64, 0), 64, 1
+    )
+    dask_pyr = compute_pyramid(
+        da.from_array(labels[None], chunks=(1, 100, 100)),
+        4,
+        64,
+        False,
+        labels.dtype,
+        reducer="mode",
+    )
+    # every level holds the original label values only
+    for level in dask_pyr[1:]:
+        assert set(np.unique(level.compute())) <= set(range(16))
+    np.testing.assert_array_equal(dask_pyr[3][0], labels[::8, ::8])
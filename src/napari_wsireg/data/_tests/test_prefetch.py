@@ -0,0 +1,129 @@
+import time
+
+import dask.array as da
+import numpy as np
+from tifffile import TiffWriter
+
+from napari_wsireg.data.utils.handles import TiffFileHandle
+from napari_wsireg.data.utils.image import tifffile_to_dask
+from napari_wsireg.data.utils.prefetch import (
+    PrefetchRequest,
+    TilePrefetcher,
+    is_tile_cached,
+    prefetch_regions,
+)
+from napari_wsireg.data.utils.tile_cache import get_tile_cache
+from napari_wsireg.resources import get_resource_manager
+
+
+def region_bounds(regions, level_index):
+    return sorted(
+        (index[-2].start, index[-1].start)
+        for level, index in regions
+        if level == level_index
+    )
+
+
+def test_prefetch_regions():
+    pyramid = [
+        da.zeros((2, 4096, 4096), chunks=(1, 512, 512)),
+        da.zeros((2, 2048, 2048), chunks=(1, 512, 512)),
+        da.zeros((2, 1024, 1024), chunks=(1, 512, 512)),
+    ]
+    request = PrefetchRequest(pyramid, 1, ((512, 1024), (512, 1024)), leading=(1,))
+    regions = prefetch_regions(request)
+
+    # chunks around the viewport, napari reads the viewport itself
+    assert region_bounds(regions, 1) == [
+        (y, x) for y in (0, 512, 1024) for x in (0, 512, 1024) if (y, x) != (512, 512)
+    ]
+    # the viewport and its neighbours one level coarser, the viewport one
+    # level finer
+    assert region_bounds(regions, 2) == [(0, 0), (0, 512), (512, 0), (512, 512)]
+    assert region_bounds(regions, 0) == [
+        (1024, 1024),
+        (1024, 1536),
+        (1536, 1024),
+        (1536, 1536),
+    ]
+    # nearest chunks come first and only the plane on screen is read
+    assert [level for level, _ in regions] == [1] * 8 + [2] * 4 + [0] * 4
+    assert all(index[0] == slice(1, 2) for _, index in regions)
+
+
+def test_prefetch_regions_edges():
+    pyramid = [da.zeros((1000, 1000, 3), chunks=(256, 256, 3))]
+    request = PrefetchRequest(pyramid, 0, ((0, 100), (900, 1000)), rgb=True)
+    assert region_bounds(
+        [(level, index[:-1]) for level, index in prefetch_regions(request)], 0
+    ) == [(0, 512), (256, 512), (256, 768)]
+
+
+def wait_for_grants_released(manager, timeout=10):
+    start = time.monotonic()
+    while manager.n_grants > 0 and time.monotonic() - start < timeout:
+        time.sleep(0.01)
+    return manager.n_grants == 0
+
+
+def test_tile_prefetcher(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, size=(2048, 2048)).astype(np.uint8)
+    im_fp = tmp_path / "im.ome.tiff"
+    with TiffWriter(im_fp) as tif:
+        options = dict(tile=(256, 256), compression="zlib")
+        tif.write(image, subifds=1, **options)
+        tif.write(image[::2, ::2], subfiletype=1, **options)
+
+    handle = TiffFileHandle(im_fp)
+    prefetcher = TilePrefetcher(max_workers=2)
+    try:
+        pyramid = tifffile_to_dask(im_fp, 0, handle=handle, chunk_bytes=2**16)
+        assert all(is_tile_cached(level) for level in pyramid)
+        assert not is_tile_cached(da.zeros((256, 256)))
+
+        request = PrefetchRequest(pyramid, 1, ((256, 512), (256, 512)))
+        futures = prefetcher.update([request])
+        assert len(futures) == len(prefetch_regions(request))
+        assert all(future.result() for future in futures)
+
+        # prefetched tiles are read from memory
+        stats = get_tile_cache().stats()
+        np.testing.assert_array_equal(
+            pyramid[1][:256, :768].compute(), image[:512:2, :1536:2]
+        )
+        assert get_tile_cache().stats().hits == stats.hits + 3
+        assert get_tile_cache().stats().misses == stats.misses
+        # prefetch threads are granted from the budget and returned
+        assert wait_for_grants_released(get_resource_manager())
+
+        # chunks queued for a viewport that moved on are not read
+        futures = prefetcher.update([request._replace(viewport=((0, 256), (0, 256)))])
+        prefetcher.cancel()
+        assert not any(f.result() for f in futures if not f.cancelled())
+    finally:
+        prefetcher.close()
+        handle.close()
+
+
+def test_tile_prefetcher_budget_held(tmp_path):
+    image = np.zeros((1024, 1024), dtype=np.uint8)
+    im_fp = tmp_path / "im.ome.tiff"
+    with TiffWriter(im_fp) as tif:
+        tif.write(image, tile=(256, 256), compression="zlib")
+
+    handle = TiffFileHandle(im_fp)
+    prefetcher = TilePrefetcher(max_workers=2)
+    manager = get_resource_manager()
+    try:
+        pyramid = tifffile_to_dask(im_fp, 0, handle=handle, chunk_bytes=2**16)
+        request = PrefetchRequest(pyramid, 0, ((256, 512), (256, 512)))
+
+        # no threads of the budget are free, the update is dropped
+        with manager.request(manager.n_threads):
+            assert prefetcher.update([request]) == []
+        assert prefetcher.update([request])
+    finally:
+        prefetcher.close()
+        assert wait_for_grants_released(manager)
+        handle.close()
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from tifffile import imwrite
+
+from napari_wsireg.data import TiffFileWsiRegImage
+from napari_wsireg.data.utils.probe import probe_files
+from napari_wsireg.resources import get_resource_manager
+
+
+@pytest.fixture
+def four_threads():
+    manager = get_resource_manager()
+    n_threads = manager.n_threads
+    manager.set_budget(n_threads=4)
+    yield
+    manager.set_budget(n_threads=n_threads)
+
+
+def test_probe_files_ordered(tmp_path):
+    file_paths = []
+    for idx in range(4):
+        im_fp = tmp_path / f"im{idx}.tiff"
+        imwrite(im_fp, np.full((64, 64), idx, dtype=np.uint8))
+        file_paths.append(im_fp)
+    file_paths.insert(2, tmp_path / "missing.tiff")
+
+    results = list(
+        probe_files(file_paths, lambda fp: TiffFileWsiRegImage(fp, header_only=True))
+    )
+    assert [r.file_path for r in results] == file_paths
+    assert [r.index for r in results] == list(range(5))
+
+    # a file that can't be opened doesn't interrupt the batch
+    assert isinstance(results[2].error, FileNotFoundError)
+    assert results[2].data is None
+    for result in results[:2] + results[3:]:
+        assert result.error is None
+        assert result.data.shape == (1, 64, 64)
+        assert result.data.header_only
+        result.data.close()
+
+
+def test_probe_files_concurrent(four_threads):
+    n_running, max_running = 0, 0
+    lock = threading.Lock()
+
+    def probe(file_path):
+        nonlocal n_running, max_running
+        with lock:
+            n_running += 1
+            max_running = max(max_running, n_running)
+        time.sleep(0.05)
+        with lock:
+            n_running -= 1
+        return file_path
+
+    file_paths = [f"im{idx}.tiff" for idx in range(8)]
+    results = list(probe_files(file_paths, probe, max_workers=4))
+    assert [r.data for r in results] == file_paths
+    assert max_running > 1
+
+
+def test_probe_files_closed_early():
+    probed = []
+
+    def probe(file_path):
+        time.sleep(0.02)
+        probed.append(file_path)
+        return file_path
+
+    results = probe_files([f"im{idx}.tiff" for idx in range(64)], probe, max_workers=2)
+    assert next(results).data == "im0.tiff"
+    results.close()
+    # files not yet started are not opened
+    assert len(probed) < 64
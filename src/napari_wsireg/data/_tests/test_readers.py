@@ -0,0 +1,137 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from tifffile import imwrite
+
+import napari_wsireg
+from napari_wsireg.data import readers
+from napari_wsireg.data.readers import (
+    ReaderSpec,
+    find_reader,
+    open_image_data,
+    register_reader,
+)
+
+
+@pytest.fixture
+def reader_registry(monkeypatch):
+    # registrations made by a test are dropped afterwards
+    monkeypatch.setattr(readers, "_READERS", list(readers._READERS))
+    monkeypatch.setattr(readers, "_entry_points_loaded", True)
+
+
+class InHouseImage:
+    def __init__(self, image_filepath, header_only=False):
+        self.path = image_filepath
+        self.header_only = header_only
+
+
+def test_find_reader_suffix_and_content(tmp_path):
+    im_fp = tmp_path / "im.tiff"
+    imwrite(im_fp, np.zeros((32, 32), dtype=np.uint8))
+    assert find_reader(im_fp).name == "tiff"
+
+    # content is recognised when the extension is misleading or missing
+    misnamed_fp = tmp_path / "im.czi"
+    misnamed_fp.write_bytes(im_fp.read_bytes())
+    assert find_reader(misnamed_fp).name == "tiff"
+    bare_fp = tmp_path / "im"
+    bare_fp.write_bytes(im_fp.read_bytes())
+    assert find_reader(bare_fp).name == "tiff"
+
+    czi_fp = tmp_path / "im.dat"
+    czi_fp.write_bytes(b"ZISRAWFILE" + bytes(22))
+    assert find_reader(czi_fp).name == "czi"
+
+    # files that can't be read fall back to their extension
+    assert find_reader(tmp_path / "missing.svs").name == "tiff"
+
+    unknown_fp = tmp_path / "im.png"
+    unknown_fp.write_bytes(b"\x89PNG\r\n\x1a\n")
+    assert find_reader(unknown_fp) is None
+    with pytest.raises(ValueError):
+        open_image_data(unknown_fp)
+
+
+def test_find_reader_zarr(tmp_path):
+    store_path = tmp_path / "im.ome.zarr"
+    store_path.mkdir()
+    (store_path / ".zgroup").write_text('{"zarr_format": 2}')
+    assert find_reader(store_path).name == "ome-zarr"
+    assert find_reader(store_path / ".zgroup").name == "ome-zarr"
+
+    unnamed_store = tmp_path / "store"
+    unnamed_store.mkdir()
+    (unnamed_store / ".zattrs").write_text("{}")
+    assert find_reader(unnamed_store).name == "ome-zarr"
+
+
+def test_register_reader(tmp_path, reader_registry):
+    im_fp = tmp_path / "im.inhouse.tiff"
+    imwrite(im_fp, np.zeros((32, 32), dtype=np.uint8))
+    assert find_reader(im_fp).name == "tiff"
+
+    register_reader(
+        ReaderSpec(
+            "in-house",
+            InHouseImage,
+            suffixes=(".inhouse.tiff",),
+            magic=readers.TIFF_MAGIC,
+            priority=1,
+        )
+    )
+    image_data = open_image_data(im_fp, header_only=True)
+    assert isinstance(image_data, InHouseImage)
+    assert image_data.header_only is True
+
+    # other TIFF files are still read by the TIFF reader
+    other_fp = tmp_path / "im.tiff"
+    imwrite(other_fp, np.zeros((32, 32), dtype=np.uint8))
+    assert find_reader(other_fp).name == "tiff"
+
+
+def test_entry_point_readers(monkeypatch, reader_registry):
+    class EntryPoint:
+        def __init__(self, name, value):
+            self.name = name
+            self.value = value
+
+        def load(self):
+            if isinstance(self.value, Exception):
+                raise self.value
+            return self.value
+
+    class EntryPoints(list):
+        def select(self, group):
+            assert group == readers.READER_ENTRY_POINT_GROUP
+            return self
+
+    entry_points = EntryPoints(
+        [
+            EntryPoint("in-house", ReaderSpec("in-house", InHouseImage, (".ih",))),
+            EntryPoint("broken", ImportError("missing dependency")),
+        ]
+    )
+    monkeypatch.setattr("importlib.metadata.entry_points", lambda: entry_points)
+    monkeypatch.setattr(readers, "_entry_points_loaded", False)
+
+    with pytest.warns(UserWarning, match="broken"):
+        names = [spec.name for spec in readers.registered_readers()]
+    assert names == ["tiff", "czi", "ome-zarr", "in-house"]
+
+
+def test_data_import_is_lazy():
+    # reader backends are imported when a reader is first used
+    code = (
+        "import sys, napari_wsireg.data as d; "
+        "assert 'czifile' not in sys.modules; "
+        "assert 'ome_types' not in sys.modules; "
+        "assert 'zarr' not in sys.modules; "
+        "d.CziWsiRegImage; "
+        "assert 'czifile' in sys.modules"
+    )
+    src_dir = Path(napari_wsireg.__file__).parents[1]
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=src_dir)
@@ -0,0 +1,76 @@
+import dask.array as da
+import numpy as np
+from tifffile import imwrite
+
+from napari_wsireg.data import TiffFileWsiRegImage, ZarrWsiRegImage
+from napari_wsireg.data._tests.test_zarr_image import write_ngff
+from napari_wsireg.data.utils.image import tifffile_to_dask
+from napari_wsireg.data.utils.stores import find_backing_store
+from napari_wsireg.data.utils.writers import write_image_from_napari
+
+
+def test_find_backing_store_tiff(tmp_path):
+    image = np.zeros((3, 1100, 1300), dtype=np.uint8)
+    im_fp = write_image_from_napari(image, tmp_path / "mc.tiff")
+    tf_wsi = TiffFileWsiRegImage(im_fp)
+    tf_wsi.prepare_image_data()
+
+    backing_store = find_backing_store(tf_wsi.dask_pyr)
+    assert backing_store.path == tmp_path / "mc.ome.tiff"
+    assert backing_store.component == "0"
+    assert backing_store.is_tiff is True
+    assert backing_store.channel is None
+
+    # napari splits multichannel layers into single channel views
+    assert find_backing_store(np.take(tf_wsi.dask_pyr[0], 2, axis=0)).channel == 2
+
+    # sub-resolutions, copies and computations are not the file wsireg reads
+    assert find_backing_store(tf_wsi.dask_pyr[1]) is None
+    assert find_backing_store(tf_wsi.dask_pyr[0][:, ::-1]) is None
+    assert find_backing_store(tf_wsi.dask_pyr[0] + 1) is None
+    assert find_backing_store(tf_wsi.dask_pyr[0].compute()) is None
+
+    tf_wsi.prepare_image_data(channel_indices=[0, 2])
+    assert find_backing_store(tf_wsi.dask_pyr) is None
+    tf_wsi.close()
+
+
+def test_find_backing_store_tiff_2d(tmp_path):
+    im_fp = tmp_path / "2d.tiff"
+    imwrite(im_fp, np.zeros((256, 256), dtype=np.uint16), tile=(128, 128))
+    tf_wsi = TiffFileWsiRegImage(im_fp)
+    tf_wsi.prepare_image_data()
+
+    backing_store = find_backing_store(tf_wsi.dask_pyr[0][0])
+    assert backing_store.path == im_fp
+    assert backing_store.component == ""
+    tf_wsi.close()
+
+
+def test_find_backing_store_tiff_coalesced_zarr(tmp_path):
+    # levels read through tifffile's zarr store with grouped tiles
+    im_fp = tmp_path / "2d.tiff"
+    imwrite(im_fp, np.zeros((2048, 2048), dtype=np.uint8), tile=(256, 256))
+    image = tifffile_to_dask(im_fp, 0, chunk_bytes=2**20)
+    assert image.chunksize == (1024, 1024)
+
+    backing_store = find_backing_store(image)
+    assert backing_store.path == im_fp
+    assert backing_store.component == ""
+
+
+def test_find_backing_store_zarr(tmp_path):
+    image = np.zeros((1, 2, 1, 256, 320), dtype=np.uint8)
+    im_fp = tmp_path / "mc.ome.zarr"
+    write_ngff(im_fp, image)
+    zarr_wsi = ZarrWsiRegImage(im_fp)
+    zarr_wsi.prepare_image_data()
+
+    backing_store = find_backing_store(zarr_wsi.dask_pyr)
+    assert backing_store.path == im_fp
+    assert backing_store.component == "0"
+    assert backing_store.is_tiff is False
+    assert backing_store.channel is None
+    assert find_backing_store(zarr_wsi.dask_pyr[0][1]).channel == 1
+
+    assert find_backing_store(da.zeros((2, 256, 320), chunks=64)) is None
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from tifffile import FileHandle, TiffFile, TiffWriter, imwrite
+
+from napari_wsireg.data import TiffFileWsiRegImage
+from napari_wsireg.data.utils.cache import PyramidCache
+from napari_wsireg.data.utils.thumbnail import (
+    _sampled_segments,
+    reads_sparsely,
+    thumbnail_ds_factor,
+    tiff_thumbnail,
+)
+
+
+def test_thumbnail_ds_factor():
+    assert thumbnail_ds_factor((1000, 2000)) == 16
+    assert thumbnail_ds_factor((1000, 2049), min_factor=1) == 2
+    assert thumbnail_ds_factor((60000, 60000)) == 32
+
+
+@pytest.mark.parametrize(
+    "layout",
+    [
+        {"tile": (16, 16), "compression": "deflate"},
+        {"rowsperstrip": 16, "compression": "zlib"},
+        {"rowsperstrip": 1},
+    ],
+)
+@pytest.mark.parametrize("is_rgb", [False, True])
+def test_tiff_thumbnail_strided(tmp_path, monkeypatch, layout, is_rgb):
+    rng = np.random.default_rng(0)
+    shape = (700, 900, 3) if is_rgb else (700, 900)
+    image = rng.integers(0, 255, shape, dtype=np.uint8)
+    im_fp = tmp_path / "im.tiff"
+    imwrite(im_fp, image, photometric="rgb" if is_rgb else "minisblack", **layout)
+
+    n_read = []
+    read_segments = FileHandle.read_segments
+
+    def counted_read_segments(self, offsets, *args, **kwargs):
+        n_read.append(len(offsets))
+        return read_segments(self, offsets, *args, **kwargs)
+
+    monkeypatch.setattr(FileHandle, "read_segments", counted_read_segments)
+    with TiffFile(im_fp) as tf:
+        thumbnail = tiff_thumbnail(tf.series[0], 32)
+        n_segments = len(tf.pages[0].dataoffsets)
+    expected = image[::32, ::32] if is_rgb else image[None, ::32, ::32]
+    np.testing.assert_array_equal(thumbnail, expected)
+    # segments without sampled pixels are not read
+    assert sum(n_read) < n_segments
+
+
+def test_tiff_thumbnail_dense_tiles(tmp_path):
+    image = np.zeros((700, 900), dtype=np.uint8)
+    im_fp = tmp_path / "tiles.tiff"
+    imwrite(im_fp, image, tile=(128, 128), compression="zlib")
+
+    with TiffFile(im_fp) as tf:
+        # every tile holds sampled pixels, the image is averaged instead
+        assert reads_sparsely(tf.pages[0], 8) is False
+        assert tiff_thumbnail(tf.series[0], 8) is None
+
+
+def test_tiff_thumbnail_sparse_strips(tmp_path):
+    image = np.zeros((1024, 256), dtype=np.uint16)
+    im_fp = tmp_path / "strips.tiff"
+    imwrite(im_fp, image, rowsperstrip=2, compression="zlib")
+
+    with TiffFile(im_fp) as tf:
+        # only the strips holding every 16th row are decoded
+        assert len(_sampled_segments(tf.pages[0], 16)) == 1024 // 16
+
+
+@pytest.mark.parametrize("n_ch", [3, 5])
+def test_tiff_thumbnail_channels(tmp_path, n_ch):
+    # 3 channels are written as separate sample planes, 5 as a page each
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 2**16, (n_ch, 600, 500), dtype=np.uint16)
+    im_fp = tmp_path / "mc.tiff"
+    imwrite(im_fp, image, tile=(16, 16), compression="zlib")
+
+    with TiffFile(im_fp) as tf:
+        thumbnail = tiff_thumbnail(tf.series[0], 32, channel_indices=[2, 0])
+    np.testing.assert_array_equal(thumbnail, image[[2, 0], ::32, ::32])
+
+
+def test_tiff_thumbnail_reduced_ifd(tmp_path):
+    image = np.zeros((1024, 1024, 3), dtype=np.uint8)
+    reduced = np.full((256, 256, 3), 7, dtype=np.uint8)
+    im_fp = tmp_path / "reduced.tiff"
+    with TiffWriter(im_fp) as tif:
+        tif.write(image, photometric="rgb", tile=(256, 256))
+        tif.write(reduced, photometric="rgb", subfiletype=1)
+
+    with TiffFile(im_fp) as tf:
+        thumbnail = tiff_thumbnail(tf.series[0], 8)
+    # the stored 4x reduced IFD is sampled, the base level is not read
+    np.testing.assert_array_equal(thumbnail, reduced[::2, ::2])
+
+
+def test_TiffFileWsiRegImage_fast_thumbnail(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (2, 2200, 1800), dtype=np.uint8)
+    im_fp = tmp_path / "mc.tiff"
+    imwrite(im_fp, image, rowsperstrip=8, compression="zlib")
+
+    tf_wsi = TiffFileWsiRegImage(
+        im_fp, pyramid_cache=PyramidCache(tmp_path / "cache", max_bytes=0)
+    )
+    tf_wsi.prepare_image_data()
+    np.testing.assert_array_equal(tf_wsi.thumbnail, image[:, ::16, ::16])
+    assert tf_wsi.thumbnail_spacing == (16.0, 16.0)
+    tf_wsi.close()
@@ -0,0 +1,223 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from tifffile import TiffFile, TiffWriter, imwrite
+
+from napari_wsireg.data.utils.handles import TiffFileHandle
+from napari_wsireg.data.utils.image import tifffile_to_dask
+from napari_wsireg.data.utils.tiff_tiles import (
+    TIFF_CHUNK_BYTES,
+    TIFF_CHUNK_MB_ENV,
+    TiffLevelArray,
+    coalesce_chunks,
+    default_chunk_bytes,
+)
+from napari_wsireg.data.utils.tile_cache import TileCache
+from napari_wsireg.resources import ResourceManager, get_resource_manager
+
+
+def random_image(shape, dtype=np.uint16):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, size=shape).astype(dtype)
+
+
+@pytest.mark.parametrize(
+    "shape,kwargs",
+    [
+        ((700, 900), dict(tile=(128, 128), compression="zlib")),
+        ((700, 900), dict(rowsperstrip=64)),
+        ((700, 900, 3), dict(tile=(256, 256), photometric="rgb")),
+        (
+            (3, 700, 900),
+            dict(tile=(128, 128), photometric="rgb", planarconfig="separate"),
+        ),
+        ((4, 700, 900), dict(tile=(128, 128), photometric="minisblack")),
+    ],
+)
+def test_tiff_level_array(tmp_path, shape, kwargs):
+    image = random_image(shape, np.uint8 if "photometric" in kwargs else np.uint16)
+    im_fp = tmp_path / "im.tiff"
+    imwrite(im_fp, image, **kwargs)
+
+    with TiffFile(im_fp) as tf:
+        series = tf.series[0]
+        assert TiffLevelArray.is_supported(series)
+        level = TiffLevelArray(series, 0, chunk_bytes=2**17)
+        assert level.shape == image.shape
+        np.testing.assert_array_equal(level[:], image)
+        np.testing.assert_array_equal(
+            level[..., 50:300, 333:700], image[..., 50:300, 333:700]
+        )
+        np.testing.assert_array_equal(level[0], image[0])
+        np.testing.assert_array_equal(level[-1, ::3], image[-1, ::3])
+        np.testing.assert_array_equal(level[::-1, 10:20], image[::-1, 10:20])
+
+        dask_image = level.to_dask()
+        np.testing.assert_array_equal(dask_image.compute(), image)
+        assert (
+            dask_image.name
+            == TiffLevelArray(series, 0, chunk_bytes=2**17).to_dask().name
+        )
+
+
+def test_tiff_level_array_chunks(tmp_path):
+    im_fp = tmp_path / "im.tiff"
+    imwrite(im_fp, random_image((2048, 2048)), tile=(256, 256))
+
+    with TiffFile(im_fp) as tf:
+        level = TiffLevelArray(tf.series[0], 0, chunk_bytes=2 * 1024**2)
+        # a chunk covers several tiles, read in one pass
+        assert level.chunks == (1024, 1024)
+        assert len(level._segments([(0, 1024), (0, 1024)])) == 16
+        assert len(level._segments([(1000, 1030), (0, 10)])) == 2
+
+
+def test_coalesce_chunks():
+    # tiles are grouped on both axes up to the target size
+    assert coalesce_chunks((8192, 8192), (256, 256), 1, (0, 1), 2**20) == (
+        1024,
+        1024,
+    )
+    assert coalesce_chunks((4, 8192, 8192), (1, 512, 512), 2, (1, 2), 2**23) == (
+        1,
+        2048,
+        2048,
+    )
+    assert coalesce_chunks((8192, 8192, 3), (256, 256, 3), 1, (0, 1), 3 * 2**20) == (
+        1024,
+        1024,
+        3,
+    )
+    # strips are grouped along y, small levels are a single chunk
+    assert coalesce_chunks((8192, 4096), (16, 4096), 1, (0, 1), 2**20) == (256, 4096)
+    assert coalesce_chunks((300, 5000), (256, 256), 1, (0, 1), 2**20) == (300, 2048)
+    assert coalesce_chunks((700, 500), (256, 256), 1, (0, 1), 2**22) == (700, 500)
+    # tiles larger than the target are kept
+    assert coalesce_chunks((8192, 8192), (1024, 1024), 4, (0, 1), 2**20) == (
+        1024,
+        1024,
+    )
+
+
+def test_default_chunk_bytes(monkeypatch):
+    monkeypatch.delenv(TIFF_CHUNK_MB_ENV, raising=False)
+    assert default_chunk_bytes() == TIFF_CHUNK_BYTES
+    monkeypatch.setenv(TIFF_CHUNK_MB_ENV, "16")
+    assert default_chunk_bytes() == 16 * 1024**2
+
+
+def test_tifffile_to_dask_pyramid(tmp_path):
+    image = random_image((2, 1024, 1024))
+    im_fp = tmp_path / "im.ome.tiff"
+    with TiffWriter(im_fp, bigtiff=True) as tif:
+        options = dict(tile=(256, 256), metadata={"axes": "CYX"})
+        tif.write(image, subifds=2, **options)
+        tif.write(image[:, ::2, ::2], subfiletype=1, **options)
+        tif.write(image[:, ::4, ::4], subfiletype=1, **options)
+
+    handle = TiffFileHandle(im_fp)
+    try:
+        pyramid = tifffile_to_dask(im_fp, 0, handle=handle, chunk_bytes=2**19)
+        assert len(pyramid) == 3
+        # coarser levels are read in fewer chunks
+        assert [level.numblocks for level in pyramid] == [
+            (2, 2, 2),
+            (2, 1, 1),
+            (2, 1, 1),
+        ]
+        for level_index, level in enumerate(pyramid):
+            ds = 2**level_index
+            assert level.name.startswith("tiff-level-")
+            np.testing.assert_array_equal(level.compute(), image[:, ::ds, ::ds])
+    finally:
+        handle.close()
+
+
+def test_decode_executor_budget():
+    manager = get_resource_manager()
+    n_threads = manager.n_threads
+    try:
+        manager.set_budget(n_threads=2)
+        executor = manager.decode_executor()
+        assert executor is manager.decode_executor()
+        assert executor._max_workers == 2
+
+        # the pool follows the thread budget
+        manager.set_budget(n_threads=3)
+        assert manager.decode_executor()._max_workers == 3
+    finally:
+        manager.set_budget(n_threads=n_threads)
+
+
+def test_tiff_level_array_decode_grant(tmp_path, monkeypatch):
+    image = random_image((1024, 1024))
+    im_fp = tmp_path / "im.tiff"
+    imwrite(im_fp, image, tile=(128, 128), compression="zlib")
+
+    manager = get_resource_manager()
+    n_threads = manager.n_threads
+    grants = []
+
+    def request(*args, **kwargs):
+        grant = ResourceManager.request(manager, *args, **kwargs)
+        grants.append(grant.threads)
+        return grant
+
+    monkeypatch.setattr(manager, "request", request)
+    try:
+        manager.set_budget(n_threads=2)
+        with TiffFile(im_fp) as tf:
+            level = TiffLevelArray(tf.series[0], 0, tile_cache=TileCache(0))
+            # decoding keeps to the threads granted for the batch
+            np.testing.assert_array_equal(level[:], image)
+            assert grants == [2]
+            assert manager.n_grants == 0
+
+            # the budget is held by the caller, segments are decoded inline
+            with ResourceManager.request(manager, 2):
+                np.testing.assert_array_equal(level[:], image)
+            assert grants == [2]
+    finally:
+        manager.set_budget(n_threads=n_threads)
+
+
+def test_tiff_level_array_decode_errors(tmp_path, monkeypatch):
+    image = random_image((1024, 1024))
+    im_fp = tmp_path / "im.tiff"
+    imwrite(im_fp, image, tile=(128, 128), compression="zlib")
+
+    manager = get_resource_manager()
+    n_threads = manager.n_threads
+    try:
+        manager.set_budget(n_threads=2)
+        with TiffFile(im_fp) as tf:
+            level = TiffLevelArray(tf.series[0], 0, tile_cache=TileCache(0))
+            n_decoded = []
+            decode = type(tf.pages[0]).decode
+
+            def failing_decode(self, *args, **kwargs):
+                n_decoded.append(1)
+                raise RuntimeError("corrupt tile")
+
+            # errors of decoding are raised once, not retried on a new pool
+            monkeypatch.setattr(type(tf.pages[0]), "decode", failing_decode)
+            with pytest.raises(RuntimeError, match="corrupt tile"):
+                level[:]
+            assert len(n_decoded) == 2
+
+            # a pool shut down between its lookup and the submission is replaced
+            monkeypatch.setattr(type(tf.pages[0]), "decode", decode)
+            shut_down = ThreadPoolExecutor(1)
+            shut_down.shutdown()
+            executors = [shut_down]
+            decode_executor = manager.decode_executor
+            monkeypatch.setattr(
+                manager,
+                "decode_executor",
+                lambda: executors.pop() if executors else decode_executor(),
+            )
+            np.testing.assert_array_equal(level[:], image)
+            assert not executors
+    finally:
+        manager.set_budget(n_threads=n_threads)
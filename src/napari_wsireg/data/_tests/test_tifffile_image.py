@@ -1,10 +1,24 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import dask.array as da
+import numpy as np
 import pytest
+from tifffile import imwrite
 
 from napari_wsireg.data import TiffFileWsiRegImage
+from napari_wsireg.data.utils.handles import (
+    TIFF_HANDLES,
+    TiffFileHandle,
+    TiffHandleRegistry,
+)
+from napari_wsireg.data.utils.tifffile_meta import (
+    ome_xml_pixels_metadata,
+    ometiff_ch_names,
+    ometiff_xy_pixel_sizes,
+)
 
 # private data logic borrowed from
 # https://github.com/cgohlke/tifffile/tests/test_tifffile.py
@@ -292,3 +306,151 @@ def test_TiffFileWsiRegImage_sc_data_thumbnail():
     assert isinstance(tf_wsi.thumbnail, da.Array) is True
     assert tf_wsi.dask_pyr[0].shape == tf_wsi.shape
     assert tf_wsi.thumbnail_spacing[0] > 0
+
+
+def test_TiffFileWsiRegImage_thumbnail_before_prepare(tmp_path):
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 255, (2, 2048, 2048), dtype=np.uint8)
+    im_fp = tmp_path / "mc.tiff"
+    imwrite(im_fp, image, rowsperstrip=8)
+
+    # the pyramid is read first when the thumbnail is asked for before it
+    tf_wsi = TiffFileWsiRegImage(im_fp)
+    thumbnail = tf_wsi._get_thumbnail()
+    assert isinstance(thumbnail, da.Array)
+    np.testing.assert_array_equal(thumbnail, image[:, ::16, ::16])
+    np.testing.assert_array_equal(tf_wsi.thumbnail, thumbnail)
+    tf_wsi.close()
+
+
+def test_TiffFileWsiRegImage_shared_handle(tmp_path):
+    im_fp = tmp_path / "mc_im_8bit.tiff"
+    im_fp.write_bytes((fixtures_dir / "mc_im_8bit.tiff").read_bytes())
+
+    tf_wsi = TiffFileWsiRegImage(im_fp)
+    tf_wsi_2 = TiffFileWsiRegImage(im_fp)
+
+    assert tf_wsi.tf is tf_wsi_2.tf
+    tf_wsi.prepare_image_data()
+    tf_wsi_2.prepare_image_data()
+    assert tf_wsi._handle.zarr_store() is tf_wsi_2._handle.zarr_store()
+
+    tf_wsi.close()
+    assert im_fp in TIFF_HANDLES
+    assert tf_wsi_2.tf.filehandle.closed is False
+
+    tf_wsi_2.close()
+    assert im_fp not in TIFF_HANDLES
+    assert tf_wsi_2.tf.filehandle.closed is True
+
+
+def test_TiffHandleRegistry_acquire_concurrent(tmp_path, monkeypatch):
+    im_fps = []
+    for name in ["slow", "fast"]:
+        im_fp = tmp_path / f"{name}.tiff"
+        im_fp.write_bytes((fixtures_dir / "mc_im_8bit.tiff").read_bytes())
+        im_fps.append(im_fp)
+    slow_fp, fast_fp = im_fps
+
+    registry = TiffHandleRegistry()
+    opening, opened = threading.Event(), threading.Event()
+    init = TiffFileHandle.__init__
+
+    def slow_init(self, image_filepath):
+        init(self, image_filepath)
+        if Path(image_filepath) == slow_fp:
+            opening.set()
+            opened.wait(10)
+
+    monkeypatch.setattr(TiffFileHandle, "__init__", slow_init)
+    with ThreadPoolExecutor(3) as executor:
+        slow_handles = [executor.submit(registry.acquire, slow_fp) for _ in range(2)]
+        assert opening.wait(10)
+
+        # other paths are opened while a file is being parsed
+        fast_handle = executor.submit(registry.acquire, fast_fp).result(5)
+        assert fast_handle.closed is False
+        opened.set()
+        slow_handle, slow_handle_2 = [f.result(10) for f in slow_handles]
+
+    # a path racing to be opened keeps one handle, the other is closed
+    assert slow_handle is slow_handle_2
+    assert slow_handle.closed is False
+    assert slow_handle._n_refs == 2
+    registry.close_all()
+
+
+def test_TiffFileWsiRegImage_header_only(tmp_path):
+    im_fp = tmp_path / "rgb_im_8bit.tiff"
+    im_fp.write_bytes((fixtures_dir / "rgb_im_8bit.tiff").read_bytes())
+
+    tf_wsi = TiffFileWsiRegImage(im_fp, header_only=True)
+
+    assert tf_wsi.header_only is True
+    assert tf_wsi._handle._zarr_stores == {}
+    assert tf_wsi.shape == (2048, 2048, 3)
+    assert tf_wsi.is_rgb is True
+    assert tf_wsi.n_ch == 3
+    assert tf_wsi.channel_names == ["C01 - RGB"]
+
+    tf_wsi.prepare_image_data()
+    assert tf_wsi.header_only is False
+    assert tf_wsi.dask_pyr[0].shape == tf_wsi.shape
+    tf_wsi.close()
+
+
+@pytest.fixture
+def ome_mc_nm_fp(tmp_path):
+    im_fp = tmp_path / "mc_nm.ome.tiff"
+    imwrite(
+        im_fp,
+        np.zeros((3, 64, 64), dtype=np.uint16),
+        ome=True,
+        metadata={
+            "axes": "CYX",
+            "PhysicalSizeX": 650,
+            "PhysicalSizeXUnit": "nm",
+            "PhysicalSizeY": 650,
+            "PhysicalSizeYUnit": "nm",
+            "Channel": {"Name": ["DAPI", "EGFP", "DsRed"]},
+        },
+    )
+    return im_fp
+
+
+def test_TiffFileWsiRegImage_ome_nm_metadata(ome_mc_nm_fp):
+    tf_wsi = TiffFileWsiRegImage(ome_mc_nm_fp)
+
+    assert tf_wsi.shape == (3, 64, 64)
+    assert tf_wsi.is_rgb is False
+    assert tf_wsi.channel_axis == 0
+    assert tf_wsi.pixel_spacing == pytest.approx((0.65, 0.65))
+    assert tf_wsi.channel_names == ["DAPI", "EGFP", "DsRed"]
+    # full model is only parsed on request and then re-used
+    assert tf_wsi._handle._ome_metadata is None
+    assert tf_wsi.ome_metadata is tf_wsi._handle.ome_metadata
+    tf_wsi.close()
+
+
+def test_ome_xml_pixels_metadata_matches_model(ome_mc_nm_fp):
+    tf_wsi = TiffFileWsiRegImage(ome_mc_nm_fp)
+    ome_pixels = ome_xml_pixels_metadata(tf_wsi.tf.ome_metadata, 0)
+
+    assert ometiff_xy_pixel_sizes(ome_pixels, 0) == pytest.approx(
+        ometiff_xy_pixel_sizes(tf_wsi.ome_metadata, 0)
+    )
+    assert ometiff_ch_names(ome_pixels, 0) == ometiff_ch_names(tf_wsi.ome_metadata, 0)
+    assert ome_xml_pixels_metadata(tf_wsi.tf.ome_metadata, 1) is None
+    tf_wsi.close()
+
+
+def test_TiffFileWsiRegImage_channel_selection(ome_mc_nm_fp):
+    tf_wsi = TiffFileWsiRegImage(ome_mc_nm_fp)
+    tf_wsi.prepare_image_data(channel_indices=[1, 2])
+
+    assert tf_wsi.shape == (2, 64, 64)
+    assert tf_wsi.n_ch == 2
+    assert tf_wsi.channel_names == ["EGFP", "DsRed"]
+    assert tf_wsi.dask_pyr[0].shape == (2, 64, 64)
+    assert tf_wsi.thumbnail.shape[0] == 2
+    tf_wsi.close()
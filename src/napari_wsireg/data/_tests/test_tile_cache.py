@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from tifffile import TiffFile, imwrite
+
+from napari_wsireg.data.utils.tiff_tiles import TiffLevelArray
+from napari_wsireg.data.utils.tile_cache import (
+    TILE_CACHE_MB_ENV,
+    TileCache,
+    get_tile_cache,
+)
+
+
+def test_tile_cache_lru():
+    cache = TileCache(max_bytes=3 * 1024)
+    for idx in range(3):
+        cache.put(idx, np.zeros(1024, dtype=np.uint8))
+    assert cache.get(0) is not None
+
+    # the least recently used tile is evicted
+    cache.put(3, np.zeros(1024, dtype=np.uint8))
+    assert cache.get(1) is None
+    for idx in [0, 2, 3]:
+        assert cache.get(idx) is not None
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses) == (4, 1)
+    assert stats.n_tiles == 3
+    assert stats.size_bytes == 3 * 1024
+    assert stats.hit_rate == pytest.approx(0.8)
+
+    # tiles are shared read-only
+    with pytest.raises(ValueError):
+        cache.get(0)[0] = 1
+
+    # tiles larger than the cache are not cached
+    cache.put(4, np.zeros(4 * 1024, dtype=np.uint8))
+    assert cache.get(4) is None
+    assert cache.stats().n_tiles == 3
+
+    cache.clear()
+    assert cache.stats() == (0, 0, 0, 0, 3 * 1024)
+
+
+def test_tile_cache_disabled(monkeypatch):
+    monkeypatch.setenv(TILE_CACHE_MB_ENV, "0")
+    cache = TileCache()
+    assert not cache.enabled
+    cache.put(0, np.zeros(16, dtype=np.uint8))
+    assert cache.get(0) is None
+
+    monkeypatch.setenv(TILE_CACHE_MB_ENV, "2")
+    assert TileCache().max_bytes == 2 * 1024**2
+    assert get_tile_cache() is get_tile_cache()
+
+
+def test_tiff_level_array_tile_cache(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, size=(3, 512, 512)).astype(np.uint8)
+    im_fp = tmp_path / "mc.tiff"
+    imwrite(im_fp, image, tile=(128, 128), compression="zlib", photometric="minisblack")
+    cache = TileCache(max_bytes=2**20)
+
+    with TiffFile(im_fp) as tf:
+        level = TiffLevelArray(tf.series[0], 0, tile_cache=cache)
+        np.testing.assert_array_equal(level[0, :256, :256], image[0, :256, :256])
+        assert cache.stats()[:3] == (0, 4, 4)
+
+        # another view of the channel, e.g. a second layer, decodes no tile
+        other_level = TiffLevelArray(tf.series[0], 0, tile_cache=cache)
+        np.testing.assert_array_equal(
+            other_level[0, 100:300, 100:200], image[0, 100:300, 100:200]
+        )
+        assert cache.stats()[:3] == (4, 6, 6)
+
+        # other channels are other tiles
+        np.testing.assert_array_equal(level[1, :256, :256], image[1, :256, :256])
+        assert cache.stats()[:2] == (4, 10)
+
+    # tiles of a replaced file are not reused
+    imwrite(im_fp, image[::-1], tile=(128, 128), photometric="minisblack")
+    with TiffFile(im_fp) as tf:
+        level = TiffLevelArray(tf.series[0], 0, tile_cache=cache)
+        np.testing.assert_array_equal(level[0, :256, :256], image[2, :256, :256])
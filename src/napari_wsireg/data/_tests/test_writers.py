@@ -0,0 +1,159 @@
+import dask.array as da
+import numpy as np
+import pytest
+from tifffile import TiffFile
+
+from napari_wsireg.data import TiffFileWsiRegImage, ZarrWsiRegImage
+from napari_wsireg.data.utils.image import compute_pyramid
+from napari_wsireg.data.utils.writers import (
+    WriteCancelled,
+    WriteProgress,
+    layer_write_nbytes,
+    write_image_from_napari,
+    write_pyramidal_ome_tiff,
+)
+
+
+class CountingArray:
+    """Array counting the pixels read from it"""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.ndim = array.ndim
+        self.n_read = 0
+
+    def __getitem__(self, key):
+        region = self.array[key]
+        self.n_read += region.size
+        return region
+
+
+@pytest.mark.parametrize("is_rgb", [False, True])
+def test_write_pyramidal_ome_tiff(tmp_path, is_rgb):
+    rng = np.random.default_rng(0)
+    shape = (1100, 1300, 3) if is_rgb else (2, 1100, 1300)
+    image = rng.integers(0, 255, shape, dtype=np.uint8)
+
+    output_fp = write_image_from_napari(
+        da.from_array(image, chunks=700),
+        tmp_path / "layer.tiff",
+        pixel_spacing=0.5,
+    )
+    assert output_fp.endswith("layer.ome.tiff")
+
+    with TiffFile(output_fp) as tf:
+        assert tf.is_ome
+        levels = tf.series[0].levels
+        assert len(levels) == 2
+        np.testing.assert_array_equal(levels[0].asarray(), image)
+        assert levels[1].shape == ((550, 650, 3) if is_rgb else (2, 550, 650))
+
+    tf_wsi = TiffFileWsiRegImage(output_fp)
+    assert tf_wsi.pixel_spacing == (0.5, 0.5)
+    assert tf_wsi.is_rgb is is_rgb
+    tf_wsi.close()
+
+
+@pytest.mark.parametrize("is_rgb", [False, True])
+@pytest.mark.parametrize("reducer", ["mean", "mode"])
+def test_write_pyramidal_ome_tiff_single_pass(tmp_path, is_rgb, reducer):
+    rng = np.random.default_rng(0)
+    shape = (1100, 1301, 3) if is_rgb else (2, 1100, 1301)
+    image = rng.integers(0, 255, shape, dtype=np.uint8)
+    source = CountingArray(image)
+
+    output_fp = write_pyramidal_ome_tiff(
+        da.from_array(source, chunks=300),
+        tmp_path / "layer.ome.tiff",
+        tile_size=128,
+        reducer=reducer,
+    )
+    # the base is read once, sub-resolutions are reduced from its bands
+    assert source.n_read == image.size
+
+    expected = compute_pyramid(
+        da.from_array(image, chunks=300), 4, 128, is_rgb, image.dtype, reducer=reducer
+    )
+    with TiffFile(output_fp) as tf:
+        levels = tf.series[0].levels
+        assert len(levels) == 4
+        for level, expected_level in zip(levels, expected):
+            np.testing.assert_array_equal(level.asarray(), expected_level)
+
+
+@pytest.mark.parametrize("is_rgb", [False, True])
+def test_write_ome_zarr(tmp_path, is_rgb):
+    rng = np.random.default_rng(0)
+    shape = (1100, 1300, 3) if is_rgb else (2, 1100, 1300)
+    image = rng.integers(0, 255, shape, dtype=np.uint8)
+
+    output_fp = write_image_from_napari(
+        [image, image[..., ::2, ::2]],
+        tmp_path / "layer.tiff",
+        file_writer="ome.zarr",
+        pixel_spacing=0.5,
+    )
+    assert output_fp.endswith("layer.ome.zarr")
+
+    zarr_wsi = ZarrWsiRegImage(output_fp)
+    assert zarr_wsi.is_rgb is is_rgb
+    assert zarr_wsi.pixel_spacing == (0.5, 0.5)
+    zarr_wsi.prepare_image_data()
+    assert len(zarr_wsi.dask_pyr) == 2
+    np.testing.assert_array_equal(zarr_wsi.dask_pyr[0], image)
+
+
+def test_write_image_from_napari_2d(tmp_path):
+    image = np.arange(600 * 700, dtype=np.uint16).reshape(600, 700)
+    output_fp = write_image_from_napari(image, tmp_path / "layer.tif")
+    with TiffFile(output_fp) as tf:
+        np.testing.assert_array_equal(tf.series[0].asarray(), image)
+
+    with pytest.raises(ValueError):
+        write_image_from_napari(image, tmp_path / "layer.tif", file_writer="png")
+
+
+@pytest.mark.parametrize("file_writer", ["ome.tiff", "ome.zarr"])
+def test_write_image_from_napari_progress(tmp_path, file_writer):
+    image = da.zeros((2, 1100, 1300), dtype=np.uint16, chunks=(1, 512, 512))
+    write_progress = WriteProgress(layer_write_nbytes(image, file_writer))
+    write_image_from_napari(
+        image,
+        tmp_path / "layer.tiff",
+        file_writer=file_writer,
+        write_progress=write_progress,
+    )
+    assert write_progress.total_bytes > image.nbytes
+    assert write_progress.bytes_written == write_progress.total_bytes
+
+
+@pytest.mark.parametrize("file_writer", ["ome.tiff", "ome.zarr"])
+def test_write_image_from_napari_cancel(tmp_path, file_writer):
+    image = da.zeros((2, 1100, 1300), dtype=np.uint16, chunks=(1, 512, 512))
+
+    class CancelAfterFirst(WriteProgress):
+        def update(self, n_bytes):
+            self.cancel()
+            super().update(n_bytes)
+
+    write_progress = CancelAfterFirst()
+    with pytest.raises(WriteCancelled):
+        write_image_from_napari(
+            image,
+            tmp_path / "layer.tiff",
+            file_writer=file_writer,
+            write_progress=write_progress,
+        )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_image_from_napari_labels(tmp_path):
+    labels = np.repeat(np.arange(1, 7, dtype=np.uint16).reshape(2, 3), 550, axis=0)
+    labels = np.repeat(labels, 450, axis=1)
+    labels[::2, ::2] = 0
+    output_fp = write_image_from_napari(labels, tmp_path / "labels.tif", reducer="mode")
+    with TiffFile(output_fp) as tf:
+        sub_res = tf.series[0].levels[1].asarray()
+    assert set(np.unique(sub_res)) == set(range(1, 7))
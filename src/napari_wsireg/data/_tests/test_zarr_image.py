@@ -0,0 +1,174 @@
+from pathlib import Path
+
+import dask.array as da
+import numpy as np
+import pytest
+import zarr
+
+from napari_wsireg.data import ZarrWsiRegImage
+from napari_wsireg.data.readers import is_zarr_path, open_image_data
+from napari_wsireg.data.utils.image import zarr_level_paths
+from napari_wsireg.data.utils.stores import find_backing_store
+from napari_wsireg.data.utils.writers import write_image_from_napari
+
+
+def write_ngff(
+    output_fp,
+    image: np.ndarray,
+    n_levels: int = 3,
+    scale: float = 0.5,
+    unit: str = "micrometer",
+    channels=None,
+) -> None:
+    root = zarr.open_group(str(output_fp), mode="w")
+    datasets = []
+    for idx in range(n_levels):
+        level = image[..., :: 2**idx, :: 2**idx]
+        root.create_dataset(str(idx), data=level, chunks=(1, 1, 1, 64, 64))
+        datasets.append(
+            {
+                "path": str(idx),
+                "coordinateTransformations": [
+                    {
+                        "type": "scale",
+                        "scale": [1, 1, 1, scale * 2**idx, scale * 2**idx],
+                    }
+                ],
+            }
+        )
+    root.attrs["multiscales"] = [
+        {
+            "version": "0.4",
+            "axes": [
+                {"name": "t", "type": "time"},
+                {"name": "c", "type": "channel"},
+                {"name": "z", "type": "space"},
+                {"name": "y", "type": "space", "unit": unit},
+                {"name": "x", "type": "space", "unit": unit},
+            ],
+            "datasets": datasets,
+        }
+    ]
+    if channels:
+        root.attrs["omero"] = {
+            "channels": [{"label": name, "color": color} for name, color in channels]
+        }
+
+
+@pytest.fixture
+def ngff_fp(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (1, 2, 1, 256, 320), dtype=np.uint8)
+    output_fp = tmp_path / "mc.ome.zarr"
+    write_ngff(output_fp, image, channels=[("DAPI", "0000FF"), ("EGFP", "00FF00")])
+    return output_fp, image
+
+
+def test_ZarrWsiRegImage_metadata(ngff_fp):
+    im_fp, _ = ngff_fp
+    assert is_zarr_path(im_fp)
+    assert is_zarr_path(im_fp / ".zattrs")
+
+    zarr_wsi = ZarrWsiRegImage(im_fp / ".zattrs", header_only=True)
+    assert zarr_wsi.path == im_fp
+    assert zarr_wsi.shape == (2, 256, 320)
+    assert zarr_wsi.n_ch == 2
+    assert zarr_wsi.is_rgb is False
+    assert zarr_wsi.channel_axis == 0
+    assert zarr_wsi.pixel_spacing == (0.5, 0.5)
+    assert zarr_wsi.channel_names == ["DAPI", "EGFP"]
+    assert zarr_wsi.channel_colors == ["0000FF", "00FF00"]
+
+
+def test_ZarrWsiRegImage_data(ngff_fp):
+    im_fp, image = ngff_fp
+    zarr_wsi = ZarrWsiRegImage(im_fp)
+    zarr_wsi.prepare_image_data()
+
+    assert [d.shape for d in zarr_wsi.dask_pyr] == [
+        (2, 256, 320),
+        (2, 128, 160),
+        (2, 64, 80),
+    ]
+    assert isinstance(zarr_wsi.thumbnail, da.Array)
+    assert zarr_wsi.thumbnail_spacing == (2.0, 2.0)
+    np.testing.assert_array_equal(zarr_wsi.dask_pyr[1], image[0, :, 0, ::2, ::2])
+
+    # levels are read from the store on demand, nothing is copied
+    zarr.open_group(str(im_fp))["0"][0, 1, 0, 10, 20] = 255
+    assert zarr_wsi.dask_pyr[0][1, 10, 20].compute() == 255
+    image[0, 1, 0, 10, 20] = 255
+
+    zarr_wsi.prepare_image_data(channel_indices=[1])
+    assert zarr_wsi.channel_names == ["EGFP"]
+    np.testing.assert_array_equal(zarr_wsi.dask_pyr[0], image[0, [1], 0])
+
+
+def test_ZarrWsiRegImage_rgb_nm(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (1, 3, 1, 128, 128), dtype=np.uint8)
+    im_fp = tmp_path / "rgb.zarr"
+    write_ngff(
+        im_fp,
+        image,
+        n_levels=1,
+        scale=650,
+        unit="nanometer",
+        channels=[("R", "FF0000"), ("G", "00FF00"), ("B", "0000FF")],
+    )
+    zarr_wsi = ZarrWsiRegImage(im_fp)
+    assert zarr_wsi.is_rgb is True
+    assert zarr_wsi.pixel_spacing == pytest.approx((0.65, 0.65))
+
+    zarr_wsi.prepare_image_data()
+    np.testing.assert_array_equal(
+        zarr_wsi.dask_pyr[0], np.moveaxis(image[0, :, 0], 0, -1)
+    )
+    assert zarr_wsi.thumbnail.shape == (8, 8, 3)
+
+
+@pytest.mark.parametrize("is_rgb", [False, True])
+def test_ZarrWsiRegImage_thumbnail_header_only(tmp_path, is_rgb):
+    rng = np.random.default_rng(0)
+    shape = (1100, 1300, 3) if is_rgb else (2, 1100, 1300)
+    image = rng.integers(0, 255, shape, dtype=np.uint8)
+    output_fp = write_image_from_napari(
+        image, tmp_path / "layer.tiff", file_writer="ome.zarr"
+    )
+
+    # the thumbnail is available before prepare_image_data, as the widget
+    # reads it for modalities added with "Read thumbnail?"
+    zarr_wsi = open_image_data(output_fp, header_only=True)
+    thumbnail = zarr_wsi.thumbnail.compute()
+    assert thumbnail.shape == ((550, 650, 3) if is_rgb else (2, 550, 650))
+    assert zarr_wsi.thumbnail_spacing == (2, 2)
+
+
+@pytest.mark.parametrize("is_rgb", [False, True])
+def test_ZarrWsiRegImage_registration_level(tmp_path, is_rgb):
+    rng = np.random.default_rng(0)
+    shape = (64, 48, 3) if is_rgb else (2, 64, 48)
+    image = rng.integers(0, 255, shape, dtype=np.uint8)
+    output_fp = write_image_from_napari(
+        image, tmp_path / "layer.tiff", file_writer="ome.zarr"
+    )
+
+    # added and exported OME-Zarr images are registered in the same layout
+    zarr_wsi = open_image_data(output_fp, header_only=True)
+    registration_level = zarr_wsi.registration_level
+    np.testing.assert_array_equal(registration_level.compute(), image)
+
+    backing_store = find_backing_store(registration_level)
+    assert backing_store is not None
+    assert backing_store.path == Path(output_fp)
+    assert not backing_store.is_tiff
+
+
+def test_zarr_level_paths():
+    group = zarr.group()
+    for key in ["0", "1", "10", "2", "labels"]:
+        group.create_dataset(key, shape=(4, 4))
+    assert zarr_level_paths(group) == ["0", "1", "2", "10"]
+
+    group.attrs["multiscales"] = [{"datasets": [{"path": "1"}, {"path": "0"}]}]
+    assert zarr_level_paths(group) == ["1", "0"]
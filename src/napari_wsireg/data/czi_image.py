@@ -1,24 +1,60 @@
+from functools import partial
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 import dask.array as da
 import numpy as np
 import zarr
 from tifffile import xml2dict
 
+from napari_wsireg.data.utils.cache import (
+    CacheLease,
+    PyramidCache,
+    get_pyramid_cache,
+)
 from napari_wsireg.data.utils.czi import CziRegImageReader, get_czi_thumbnail
 from napari_wsireg.data.wsireg_image import WsiRegImage
 
+# "stored" maps the pyramid levels stored in the CZI lazily, "zarr" computes the
+# pyramid from the base level into a zarr store, "auto" uses the stored pyramid
+# when the file has one
+CZI_PYRAMID_MODES = ["auto", "stored", "zarr"]
+CZI_PYRAMID_CACHE_VARIANT = "czi-zarr-pyramid-v1"
+
 
 class CziWsiRegImage(WsiRegImage):
-    def __init__(self, image_filepath: [str, Path]):
+    # indices of the scenes read from the file, None when all are read
+    _scene_indices: Optional[List[int]] = None
+
+    def __init__(
+        self,
+        image_filepath: [str, Path],
+        header_only: bool = False,
+        index_sidecar: bool = False,
+        pyramid_mode: str = "auto",
+        pyramid_cache: Optional[PyramidCache] = None,
+    ):
+        if pyramid_mode not in CZI_PYRAMID_MODES:
+            raise ValueError(
+                f"pyramid_mode must be one of {CZI_PYRAMID_MODES}, got {pyramid_mode}"
+            )
         self._path = image_filepath
-        self.czi = CziRegImageReader(self._path)
+        self._header_only = header_only
+        self._pyramid_mode = pyramid_mode
+        self._pyramid_cache = (
+            pyramid_cache if pyramid_cache is not None else get_pyramid_cache()
+        )
+        # cache entries read by the pyramid, released on close
+        self._cache_leases: List[CacheLease] = []
+        self.czi = CziRegImageReader(self._path, index_sidecar=index_sidecar)
 
         self._get_dim_info()
         self._get_pixel_scaling()
         self._get_channel_metadata()
-        self._get_thumbnail()
+
+        # reading the thumbnail decodes subblocks, defer it in header-only mode
+        if not self._header_only:
+            self._get_thumbnail()
 
     def _get_pixel_scaling(self) -> None:
         czi_meta = xml2dict(self.czi.metadata())
@@ -82,19 +118,106 @@ class CziWsiRegImage(WsiRegImage):
         else:
             self._channel_axis = 0
 
+    def close(self) -> None:
+        self.czi.close()
+        for lease in self._cache_leases:
+            lease.release()
+        self._cache_leases = []
+
+    @property
+    def scene_indices(self) -> Optional[List[int]]:
+        """Indices of the scenes of the file that are read, None when all are"""
+        return self._scene_indices
+
+    def prepare_image_data(
+        self,
+        channel_indices: Optional[List[int]] = None,
+        scene_indices: Optional[List[int]] = None,
+    ):
+        """
+        Read the image pyramid and thumbnail, only the subblocks of the selected
+        channels and scenes are decoded
+
+        Parameters
+        ----------
+        channel_indices: list of int
+            indices of the channels to read, all channels by default,
+            ignored for RGB images
+        scene_indices: list of int
+            indices of the scenes to read, all scenes by default, the image is
+            cropped to the bounds of the selected scenes
+        """
+        if scene_indices is not None:
+            n_scenes = len(self.czi.subblock_index.scenes)
+            scene_indices = [int(i) for i in scene_indices]
+            if len(scene_indices) == 0 or not all(
+                0 <= i < n_scenes for i in scene_indices
+            ):
+                raise ValueError(
+                    f"scene_indices must select scenes in [0, {n_scenes}), "
+                    f"got {scene_indices}"
+                )
+        self._scene_indices = scene_indices
+
+        super().prepare_image_data(channel_indices)
+        if self._scene_indices is not None:
+            self._shape = tuple(int(s) for s in self._dask_pyr[0].shape)
+
+    def _selection_variant(self) -> str:
+        variant = ""
+        if self._channel_indices is not None:
+            variant += f"-ch{'_'.join(map(str, self._channel_indices))}"
+        if self._scene_indices is not None:
+            variant += f"-s{'_'.join(map(str, self._scene_indices))}"
+        return variant
+
+    @property
+    def pyramid_mode(self) -> str:
+        """Pyramid mode used by prepare_image_data, "auto" resolved to the mode used"""
+        if self._pyramid_mode == "auto":
+            return "stored" if len(self.czi.subblock_index.levels) > 1 else "zarr"
+        return self._pyramid_mode
+
     def _get_dask_pyr(self) -> List[da.Array]:
-        return self.czi.zarr_pyramidalize_czi(zarr.storage.TempStore())
+        selection = dict(
+            channel_indices=self._channel_indices, scene_indices=self._scene_indices
+        )
+        if self.pyramid_mode == "stored":
+            return self.czi.stored_pyramid(**selection)
+
+        if not self._pyramid_cache.enabled:
+            return self.czi.zarr_pyramidalize_czi(zarr.storage.TempStore(), **selection)
+
+        # computed levels are re-used across sessions, the base is always lazy
+        variant = CZI_PYRAMID_CACHE_VARIANT + self._selection_variant()
+        self._cache_leases.append(self._pyramid_cache.lease(self._path, variant))
+        root = self._pyramid_cache.get_or_create(
+            self._path,
+            variant,
+            partial(self.czi.zarr_pyramidalize_czi, **selection),
+        )
+        sub_res_keys = sorted(root.array_keys(), key=int)
+        return [
+            self.czi.level_to_dask(1, **selection),
+            *[da.from_zarr(root[k]) for k in sub_res_keys],
+        ]
 
     def _get_thumbnail(self) -> da.Array:
 
-        thumbnail, thumbnail_spacing = get_czi_thumbnail(self.czi, self._pixel_spacing)
+        thumbnail, thumbnail_spacing = get_czi_thumbnail(
+            self.czi,
+            self._pixel_spacing,
+            channel_indices=self._channel_indices,
+            scene_indices=self._scene_indices,
+        )
 
         if thumbnail_spacing:
             self._thumbnail = da.from_array(thumbnail, chunks=thumbnail.shape)
             self._thumbnail_spacing = thumbnail_spacing
+            return self._thumbnail
         else:
             try:
                 return self._dask_pyr[-1]
             except AttributeError:
-                self.prepare_image_data()
+                self.prepare_image_data(self._channel_indices, self._scene_indices)
                 return self._get_thumbnail()
@@ -0,0 +1,232 @@
+import importlib
+import warnings
+from pathlib import Path
+from string import Template
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple, Type, Union
+
+if TYPE_CHECKING:
+    from napari_wsireg.data.wsireg_image import WsiRegImage
+
+# entry point group of third-party readers, each entry point refers to a
+# ReaderSpec, e.g. in setup.cfg:
+# [options.entry_points]
+# napari_wsireg.readers =
+#     my-format = my_package.readers:MY_FORMAT_SPEC
+READER_ENTRY_POINT_GROUP = "napari_wsireg.readers"
+
+TIFFFILE_EXTS = [".scn", ".ome.tiff", ".tif", ".tiff", ".svs", ".ndpi"]
+CZI_EXTS = [".czi"]
+ZARR_EXTS = [".zarr"]
+
+# metadata files a user may pick inside a zarr directory store
+ZARR_METADATA_FILES = [".zattrs", ".zgroup"]
+
+# leading bytes of classic and BigTIFF files, little and big endian, and of CZI
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+CZI_MAGIC = (b"ZISRAWFILE",)
+# longest magic byte sequence read from files
+MAGIC_READ_SIZE = 64
+
+FILE_ERROR_MESSAGE = Template(
+    "The imported data file $file_path with extesnsion "
+    "$ext does not match an acceptable "
+    "tiff extension: \n[$tiff_ext] \nor .czi for Zeiss images"
+    " or .zarr for OME-Zarr images"
+)
+
+
+def zarr_store_path(file_path: Union[str, Path]) -> Path:
+    """Directory of a zarr store, given the store or one of its metadata files"""
+    file_path = Path(file_path)
+    if file_path.name in ZARR_METADATA_FILES:
+        return file_path.parent
+    return file_path
+
+
+def is_zarr_path(file_path: Union[str, Path]) -> bool:
+    return zarr_store_path(file_path).suffix.lower() in ZARR_EXTS
+
+
+class ReaderSpec(NamedTuple):
+    """
+    Description of a WsiRegImage reader, used to select the reader of a file
+    without importing it
+
+    Attributes
+    ----------
+    name: str
+        name of the format
+    reader: str or type
+        the WsiRegImage subclass, or its import path as "module:ClassName",
+        imported the first time a file is opened with it
+    suffixes: tuple of str
+        lower case file name endings of the format, e.g. ".ome.tiff"
+    magic: tuple of bytes
+        possible leading bytes of files of the format
+    markers: tuple of str
+        names of files found in directory stores of the format
+    priority: int
+        readers with a higher priority are preferred when several match a
+        file, readers of equal priority are tried in registration order
+    """
+
+    name: str
+    reader: Union[str, Type["WsiRegImage"]]
+    suffixes: Tuple[str, ...] = ()
+    magic: Tuple[bytes, ...] = ()
+    markers: Tuple[str, ...] = ()
+    priority: int = 0
+
+    def load(self) -> Type["WsiRegImage"]:
+        """Import the reader class"""
+        if not isinstance(self.reader, str):
+            return self.reader
+        module_name, class_name = self.reader.split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+
+_READERS: List[ReaderSpec] = [
+    ReaderSpec(
+        "tiff",
+        "napari_wsireg.data.tifffile_image:TiffFileWsiRegImage",
+        suffixes=tuple(TIFFFILE_EXTS),
+        magic=TIFF_MAGIC,
+    ),
+    ReaderSpec(
+        "czi",
+        "napari_wsireg.data.czi_image:CziWsiRegImage",
+        suffixes=tuple(CZI_EXTS),
+        magic=CZI_MAGIC,
+    ),
+    ReaderSpec(
+        "ome-zarr",
+        "napari_wsireg.data.zarr_image:ZarrWsiRegImage",
+        suffixes=tuple(ZARR_EXTS),
+        markers=tuple(ZARR_METADATA_FILES),
+    ),
+]
+_entry_points_loaded = False
+
+
+def register_reader(spec: ReaderSpec) -> None:
+    """Add a reader, replacing any registered reader of the same name"""
+    _READERS[:] = [s for s in _READERS if s.name != spec.name]
+    _READERS.append(spec)
+
+
+def _load_entry_point_readers() -> None:
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+
+    from importlib.metadata import entry_points
+
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, "select"):
+        reader_entry_points = all_entry_points.select(group=READER_ENTRY_POINT_GROUP)
+    else:
+        reader_entry_points = all_entry_points.get(READER_ENTRY_POINT_GROUP, [])
+
+    for entry_point in reader_entry_points:
+        try:
+            spec = entry_point.load()
+        except Exception as e:
+            warnings.warn(f"reader {entry_point.name} could not be loaded: {e}")
+            continue
+        if not isinstance(spec, ReaderSpec):
+            warnings.warn(
+                f"reader {entry_point.name} is not a ReaderSpec and was not registered"
+            )
+            continue
+        register_reader(spec)
+
+
+def registered_readers() -> List[ReaderSpec]:
+    """Registered readers, including those of installed entry points"""
+    _load_entry_point_readers()
+    return list(_READERS)
+
+
+def _read_magic(file_path: Path) -> bytes:
+    try:
+        with open(file_path, "rb") as f:
+            return f.read(MAGIC_READ_SIZE)
+    except OSError:
+        return b""
+
+
+def _content_matches(spec: ReaderSpec, file_path: Path, header: bytes) -> bool:
+    if file_path.is_dir():
+        return any((file_path / marker).exists() for marker in spec.markers)
+    return any(header.startswith(magic) for magic in spec.magic)
+
+
+def find_reader(file_path: Union[str, Path]) -> Optional[ReaderSpec]:
+    """
+    Select the reader of a file by its content and name
+
+    Readers recognising both the leading bytes, or for directories the
+    marker files, and the name ending of the file are preferred, then readers
+    recognising the content, then those recognising the name, so that files
+    with a misleading or missing extension are opened by the right reader.
+
+    Parameters
+    ----------
+    file_path: str or Path
+        image file, or a directory store or one of its metadata files
+
+    Returns
+    -------
+    spec: ReaderSpec
+        the selected reader, None if no reader recognises the file
+    """
+    file_path = Path(file_path)
+    if file_path.name in ZARR_METADATA_FILES:
+        file_path = file_path.parent
+    name = file_path.name.lower()
+    header = b"" if file_path.is_dir() else _read_magic(file_path)
+
+    best: Optional[Tuple[Tuple[int, int], ReaderSpec]] = None
+    for spec in registered_readers():
+        content_match = _content_matches(spec, file_path, header)
+        name_match = any(name.endswith(suffix) for suffix in spec.suffixes)
+        if not (content_match or name_match):
+            continue
+        rank = (2 * content_match + name_match, spec.priority)
+        if best is None or rank > best[0]:
+            best = (rank, spec)
+    return best[1] if best else None
+
+
+def open_image_data(file_path: Union[str, Path], **kwargs) -> "WsiRegImage":
+    """
+    Open an image file with the registered reader selected for it
+
+    Parameters
+    ----------
+    file_path: str or Path
+        image file
+    kwargs
+        passed to the reader, e.g. header_only
+
+    Returns
+    -------
+    image_data: WsiRegImage
+        the opened image
+
+    Raises
+    ------
+    ValueError
+        if no registered reader recognises the file
+    """
+    spec = find_reader(file_path)
+    if spec is None:
+        raise ValueError(
+            FILE_ERROR_MESSAGE.substitute(
+                file_path=Path(file_path).name,
+                ext=Path(file_path).suffix.lower(),
+                tiff_ext=",".join(TIFFFILE_EXTS),
+            )
+        )
+    return spec.load()(file_path, **kwargs)
@@ -1,39 +1,64 @@
 import warnings
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
 import dask.array as da
 import numpy as np
-from ome_types import from_xml
-from ome_types.model import OME
-from tifffile import TiffFile
+import zarr
 
+from napari_wsireg.data.utils.cache import (
+    CacheLease,
+    PyramidCache,
+    get_pyramid_cache,
+)
+from napari_wsireg.data.utils.handles import TIFF_HANDLES
 from napari_wsireg.data.utils.image import (
-    compute_sub_res,
+    compute_pyramid,
     get_tifffile_info,
     guess_rgb,
     tifffile_to_dask,
 )
+from napari_wsireg.data.utils.thumbnail import thumbnail_ds_factor, tiff_thumbnail
 from napari_wsireg.data.utils.tifffile_meta import (
+    OmePixelsMetadata,
     ometiff_ch_names,
+    ometiff_spp_interleaved,
     ometiff_xy_pixel_sizes,
     svs_xy_pixel_sizes,
     tifftag_xy_pixel_sizes,
 )
 from napari_wsireg.data.wsireg_image import WsiRegImage
+from napari_wsireg.resources import get_resource_manager
 
-TIFFFILE_EXTS = [".scn", ".ome.tiff", ".tif", ".tiff", ".svs", ".ndpi"]
+if TYPE_CHECKING:
+    from ome_types.model import OME
 
 
 class TiffFileWsiRegImage(WsiRegImage):
-    ome_metadata: Optional[OME] = None
+    _ome_metadata: Optional["OME"] = None
+    _ome_pixels: Optional[Union["OME", OmePixelsMetadata]] = None
 
-    def __init__(self, image_filepath: [str, Path]):
+    def __init__(
+        self,
+        image_filepath: [str, Path],
+        header_only: bool = False,
+        pyramid_cache: Optional[PyramidCache] = None,
+        chunk_bytes: Optional[int] = None,
+    ):
 
         self._path = image_filepath
-        self.tf = TiffFile(self._path)
+        self._chunk_bytes = chunk_bytes
+        self._header_only = header_only
+        self._pyramid_cache = (
+            pyramid_cache if pyramid_cache is not None else get_pyramid_cache()
+        )
+        # cache entries read by the thumbnail, released on close
+        self._cache_leases: List[CacheLease] = []
+        self._handle = TIFF_HANDLES.acquire(self._path)
+        self.tf = self._handle.tf
 
         (self._shape, _, self.largest_series) = self._get_image_info()
+        self._ome_pixels = self._get_ome_pixels()
         self._get_dim_info()
 
         pix_spacing = self._get_pixel_spacing()
@@ -41,18 +66,27 @@ class TiffFileWsiRegImage(WsiRegImage):
 
         self._channel_names = self._get_ch_names()
 
+    @property
+    def ome_metadata(self) -> Optional["OME"]:
+        """Full OME model of the file, parsed on first access"""
+        if self._ome_metadata is None and self._handle is not None:
+            self._ome_metadata = self._handle.ome_metadata
+        return self._ome_metadata
+
+    def _get_ome_pixels(self) -> Optional[Union["OME", OmePixelsMetadata]]:
+        # partial parse of the XML is enough to set up the reader, the full
+        # model is only parsed if that fails
+        if not self._handle.is_ome:
+            return None
+        ome_pixels = self._handle.ome_pixels_metadata(self.largest_series)
+        return ome_pixels if ome_pixels is not None else self.ome_metadata
+
     def _get_dim_info(self) -> None:
         if self._shape:
-            if self.tf.ome_metadata:
-                self.ome_metadata = from_xml(self.tf.ome_metadata)
-                spp = (
-                    self.ome_metadata.images[self.largest_series]
-                    .pixels.channels[0]
-                    .samples_per_pixel
+            if self._ome_pixels:
+                spp, interleaved = ometiff_spp_interleaved(
+                    self._ome_pixels, self.largest_series
                 )
-                interleaved = self.ome_metadata.images[
-                    self.largest_series
-                ].pixels.interleaved
 
                 if spp and spp > 1:
                     self._is_rgb = True
@@ -77,7 +111,13 @@ class TiffFileWsiRegImage(WsiRegImage):
             self._n_ch = self._shape[self._channel_axis]
 
     def _get_dask_pyr(self) -> List[da.Array]:
-        dask_pyr = tifffile_to_dask(self._path, self.largest_series)
+        # tiles are grouped into chunks of about `chunk_bytes` at every level
+        dask_pyr = tifffile_to_dask(
+            self._path,
+            self.largest_series,
+            handle=self._handle,
+            chunk_bytes=self._chunk_bytes,
+        )
         if isinstance(dask_pyr, da.Array):
             dask_pyr = [dask_pyr]
         else:
@@ -87,6 +127,13 @@ class TiffFileWsiRegImage(WsiRegImage):
             d.reshape(1, *d.shape) if len(d.shape) == 2 else d for d in dask_pyr
         ]
 
+        if self._channel_indices is not None:
+            # lazy selection, chunks of unselected channels are never read
+            dask_pyr = [
+                da.take(d, self._channel_indices, axis=self._channel_axis)
+                for d in dask_pyr
+            ]
+
         return dask_pyr
 
     def _get_thumbnail(self) -> da.Array:
@@ -94,13 +141,55 @@ class TiffFileWsiRegImage(WsiRegImage):
             if len(self._dask_pyr) > 1:
                 return self._dask_pyr[-1]
             else:
-                is_rgb = True if self._channel_axis != 0 else False
-                return compute_sub_res(
-                    self._dask_pyr[0], 4, 512, is_rgb, self._dask_pyr[0].dtype
-                )
+                return self._get_cached_thumbnail()
         except AttributeError:
-            self.prepare_image_data()
-            self._get_thumbnail()
+            self.prepare_image_data(self._channel_indices)
+            return self._get_thumbnail()
+
+    def _compute_thumbnail(self) -> da.Array:
+        is_rgb = True if self._channel_axis != 0 else False
+        base = self._dask_pyr[0]
+        ds_factor = thumbnail_ds_factor(base.shape[:2] if is_rgb else base.shape[1:])
+
+        # only the tiles or strips of sampled pixels are read from the file
+        manager = get_resource_manager()
+        with manager.request(manager.n_threads) as grant:
+            thumbnail = tiff_thumbnail(
+                self.tf.series[self.largest_series],
+                ds_factor,
+                channel_indices=self._channel_indices,
+                max_workers=grant.threads,
+            )
+        if (
+            thumbnail is not None
+            and thumbnail.ndim == base.ndim
+            and thumbnail.shape[self._channel_axis] == base.shape[self._channel_axis]
+        ):
+            return da.from_array(thumbnail)
+
+        return compute_pyramid(base, 5, 512, is_rgb, base.dtype)[-1]
+
+    def _get_cached_thumbnail(self) -> da.Array:
+        if not self._pyramid_cache.enabled:
+            return self._compute_thumbnail()
+
+        def write_thumbnail(store: zarr.DirectoryStore) -> None:
+            thumbnail = self._compute_thumbnail()
+            target = zarr.open_group(store, mode="a").create_dataset(
+                "thumbnail",
+                shape=thumbnail.shape,
+                chunks=thumbnail.chunksize,
+                dtype=thumbnail.dtype,
+            )
+            da.store(thumbnail, target, lock=False)
+
+        variant = f"tiff-thumbnail-series{self.largest_series}-v2"
+        if self._channel_indices is not None:
+            variant += f"-ch{'_'.join(map(str, self._channel_indices))}"
+
+        self._cache_leases.append(self._pyramid_cache.lease(self._path, variant))
+        root = self._pyramid_cache.get_or_create(self._path, variant, write_thumbnail)
+        return da.from_zarr(root["thumbnail"])
 
     def _get_pixel_spacing(self) -> float:
         if Path(self._path).suffix.lower() in [".scn", ".ndpi"]:
@@ -115,9 +204,9 @@ class TiffFileWsiRegImage(WsiRegImage):
                 self.largest_series,
                 0,
             )[0]
-        elif self.tf.ome_metadata:
+        elif self._ome_pixels:
             return ometiff_xy_pixel_sizes(
-                from_xml(self.tf.ome_metadata),
+                self._ome_pixels,
                 self.largest_series,
             )[0]
         else:
@@ -135,10 +224,8 @@ class TiffFileWsiRegImage(WsiRegImage):
                 return 1.0
 
     def _get_ch_names(self) -> List[str]:
-        if self.tf.ome_metadata:
-            cnames = ometiff_ch_names(
-                from_xml(self.tf.ome_metadata), self.largest_series
-            )
+        if self._ome_pixels:
+            cnames = ometiff_ch_names(self._ome_pixels, self.largest_series)
         else:
             cnames = []
             if self.is_rgb:
@@ -156,8 +243,18 @@ class TiffFileWsiRegImage(WsiRegImage):
                 "the largest series will be read by default"
             )
 
-        im_dims, im_dtype, largest_series = get_tifffile_info(self._path)
+        im_dims, im_dtype, largest_series = get_tifffile_info(
+            self._path, handle=self._handle
+        )
 
         im_dims = (int(im_dims[0]), int(im_dims[1]), int(im_dims[2]))
 
         return im_dims, im_dtype, largest_series
+
+    def close(self) -> None:
+        if self._handle is not None:
+            TIFF_HANDLES.release(self._path)
+            self._handle = None
+        for lease in self._cache_leases:
+            lease.release()
+        self._cache_leases = []
@@ -0,0 +1,294 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import zarr
+
+# environment variables configuring the default cache
+CACHE_DIR_ENV = "NAPARI_WSIREG_CACHE_DIR"
+CACHE_MAX_GB_ENV = "NAPARI_WSIREG_CACHE_MAX_GB"
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "napari-wsireg" / "pyramids"
+# the cache is opt-in, nothing is written to the home directory by default
+DEFAULT_CACHE_MAX_GB = 0.0
+
+ENTRY_SUFFIX = ".zarr"
+TMP_SUFFIX = ".tmp"
+LEASE_SUFFIX = ".lease"
+
+
+def _dir_size(path: Path) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.stat(os.path.join(root, f)).st_size
+            except OSError:
+                continue
+    return size
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill terminates processes on Windows, leases are kept
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # the process exists but belongs to another user
+        return True
+    return True
+
+
+class CacheLease:
+    """
+    Pin on a cache entry, the entry is not evicted until the lease is released
+
+    Leases are reference counted per process, the process holds a lock file
+    next to the entry while any of its leases on the entry are held.
+    """
+
+    def __init__(self, cache: "PyramidCache", key: str):
+        self._cache = cache
+        self.key = key
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._cache._release(self.key)
+
+    def __enter__(self) -> "CacheLease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class PyramidCache:
+    """
+    On-disk cache of computed pyramid levels and thumbnails.
+
+    Entries are zarr directory stores keyed by the identity of the source file
+    (resolved path, size and modification time) and a variant describing what
+    was computed, editing or replacing the file invalidates its entries.
+    Entries are written to a temporary directory and renamed into place so
+    several napari instances can share a cache, a reader never sees a partial
+    entry and the first writer wins a race. The least recently used entries
+    are evicted once the cache grows above its size cap, entries leased by a
+    running reader are skipped.
+
+    Parameters
+    ----------
+    cache_dir: str or Path
+        cache directory, defaults to $NAPARI_WSIREG_CACHE_DIR or
+        ~/.cache/napari-wsireg/pyramids
+    max_bytes: int
+        size cap of the cache, defaults to $NAPARI_WSIREG_CACHE_MAX_GB or 0,
+        0 disables the cache
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_gb = float(os.environ.get(CACHE_MAX_GB_ENV, DEFAULT_CACHE_MAX_GB))
+            max_bytes = int(max_gb * 1024**3)
+
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lease_counts: Dict[str, int] = dict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, image_fp: Union[str, Path], variant: str) -> str:
+        """Cache key of a computed variant of an image file"""
+        image_fp = Path(image_fp).resolve()
+        stat = os.stat(image_fp)
+        identity = f"{image_fp}|{stat.st_size}|{stat.st_mtime_ns}|{variant}"
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{ENTRY_SUFFIX}"
+
+    def _lease_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.{os.getpid()}{LEASE_SUFFIX}"
+
+    def lease(self, image_fp: Union[str, Path], variant: str) -> CacheLease:
+        """
+        Pin the entry of a variant of an image file, taken before the entry is
+        opened and released once its arrays are no longer read
+        """
+        key = self.key(image_fp, variant)
+        with self._lock:
+            if self._lease_counts.get(key, 0) == 0:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                self._lease_path(key).touch()
+            self._lease_counts[key] = self._lease_counts.get(key, 0) + 1
+        return CacheLease(self, key)
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            self._lease_counts[key] -= 1
+            if self._lease_counts[key] == 0:
+                del self._lease_counts[key]
+                try:
+                    os.remove(self._lease_path(key))
+                except OSError:
+                    pass
+
+    def is_leased(self, entry_fp: Path) -> bool:
+        """Whether a running process holds a lease on an entry"""
+        key = entry_fp.name[: -len(ENTRY_SUFFIX)]
+        for lease_fp in self.cache_dir.glob(f"{key}.*{LEASE_SUFFIX}"):
+            try:
+                pid = int(lease_fp.name[len(key) + 1 : -len(LEASE_SUFFIX)])
+            except ValueError:
+                continue
+            if _pid_alive(pid):
+                return True
+            # left behind by a process that exited without releasing it
+            try:
+                os.remove(lease_fp)
+            except OSError:
+                pass
+        return False
+
+    def get(
+        self, image_fp: Union[str, Path], variant: str
+    ) -> Optional[zarr.hierarchy.Group]:
+        """Open a cached entry read-only, returns None on a cache miss"""
+        if not self.enabled:
+            return None
+
+        entry_fp = self.entry_path(self.key(image_fp, variant))
+        if not entry_fp.exists():
+            return None
+
+        try:
+            # directory mtime records the last access for LRU eviction
+            os.utime(entry_fp)
+        except OSError:
+            return None
+        return zarr.open_group(zarr.DirectoryStore(str(entry_fp)), mode="r")
+
+    def put(
+        self,
+        image_fp: Union[str, Path],
+        variant: str,
+        writer: Callable[[zarr.DirectoryStore], None],
+    ) -> zarr.hierarchy.Group:
+        """
+        Compute and store an entry
+
+        Parameters
+        ----------
+        image_fp: str or Path
+            source image file
+        variant: str
+            description of the computed data, e.g. "czi-pyramid"
+        writer: callable
+            writes the entry into the zarr store it is passed
+
+        Returns
+        -------
+        group: zarr.hierarchy.Group
+            read-only group of the stored entry
+        """
+        key = self.key(image_fp, variant)
+        entry_fp = self.entry_path(key)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        tmp_fp = self.cache_dir / f"{key}.{os.getpid()}.{uuid.uuid4().hex}{TMP_SUFFIX}"
+        try:
+            writer(zarr.DirectoryStore(str(tmp_fp)))
+            try:
+                os.rename(tmp_fp, entry_fp)
+            except OSError:
+                # another writer stored the same entry first
+                if not entry_fp.exists():
+                    raise
+        finally:
+            shutil.rmtree(tmp_fp, ignore_errors=True)
+
+        self.evict(keep=[entry_fp])
+        return zarr.open_group(zarr.DirectoryStore(str(entry_fp)), mode="r")
+
+    def get_or_create(
+        self,
+        image_fp: Union[str, Path],
+        variant: str,
+        writer: Callable[[zarr.DirectoryStore], None],
+    ) -> zarr.hierarchy.Group:
+        """Open a cached entry, computing it with `writer` on a cache miss"""
+        group = self.get(image_fp, variant)
+        if group is None:
+            group = self.put(image_fp, variant, writer)
+        return group
+
+    def entries(self) -> List[Tuple[Path, float, int]]:
+        """(path, last access, size in bytes) of every entry, least recent first"""
+        if not self.cache_dir.exists():
+            return []
+        entries = []
+        for entry_fp in self.cache_dir.glob(f"*{ENTRY_SUFFIX}"):
+            try:
+                last_access = os.stat(entry_fp).st_mtime
+            except OSError:
+                continue
+            entries.append((entry_fp, last_access, _dir_size(entry_fp)))
+        return sorted(entries, key=lambda e: e[1])
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(e[2] for e in self.entries())
+
+    def evict(self, keep: Optional[List[Path]] = None) -> None:
+        """
+        Remove least recently used entries until the cache fits its cap,
+        leased entries are kept
+        """
+        keep = keep or []
+        with self._lock:
+            entries = self.entries()
+            total = sum(e[2] for e in entries)
+            for entry_fp, _, size in entries:
+                if total <= self.max_bytes:
+                    break
+                if entry_fp in keep or self.is_leased(entry_fp):
+                    continue
+                # rename first so the entry disappears atomically for readers
+                trash_fp = entry_fp.with_suffix(f".{time.time_ns()}{TMP_SUFFIX}")
+                try:
+                    os.rename(entry_fp, trash_fp)
+                except OSError:
+                    continue
+                shutil.rmtree(trash_fp, ignore_errors=True)
+                total -= size
+
+    def clear(self) -> None:
+        if self.cache_dir.exists():
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+@lru_cache(maxsize=None)
+def get_pyramid_cache() -> PyramidCache:
+    """Process wide pyramid cache configured from the environment"""
+    return PyramidCache()
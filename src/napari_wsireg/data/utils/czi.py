@@ -1,21 +1,723 @@
-import multiprocessing
+import itertools
+import json
+import os
+import threading
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from typing import List, Optional, Union, Tuple
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import dask.array as da
 import numpy as np
 import zarr
 from czifile import CziFile
+from dask.base import tokenize
 from tifffile import create_output
 
-from napari_wsireg.data.utils.image import compute_sub_res, guess_rgb
+from napari_wsireg.data.utils.image import (
+    compute_pyramid,
+    n_pyramid_levels,
+)
+from napari_wsireg.resources import get_resource_manager
+
+
+class CziSubblockRecord(NamedTuple):
+    """Location of one subblock in the image, taken from its directory entry"""
+
+    idx: int
+    downsample: int
+    pyramid_type: int
+    channel: int
+    scene: int
+    mosaic_index: int
+    y: int
+    x: int
+    height: int
+    width: int
+    stored_height: int
+    stored_width: int
+
+
+class _SubblockGrid:
+    """
+    Uniform grid over the bounding boxes of one pyramid level, each cell lists
+    the subblocks overlapping it so region queries only test nearby subblocks
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        y0: np.ndarray,
+        x0: np.ndarray,
+        y1: np.ndarray,
+        x1: np.ndarray,
+    ):
+        self.origin = (int(y0.min()), int(x0.min())) if len(ids) else (0, 0)
+        # cells about the size of a subblock keep cell lists short
+        self.cell_size = (
+            max(int(np.median(np.maximum(y1 - y0, x1 - x0))), 1) if len(ids) else 1
+        )
+        self.cells: Dict[Tuple[int, int], List[int]] = dict()
+        for i, by0, bx0, by1, bx1 in zip(ids, y0, x0, y1, x1):
+            for gy in self._cell_range(by0, by1, 0):
+                for gx in self._cell_range(bx0, bx1, 1):
+                    self.cells.setdefault((gy, gx), []).append(int(i))
+
+    def _cell_range(self, start: int, stop: int, axis: int) -> range:
+        return range(
+            (start - self.origin[axis]) // self.cell_size,
+            (stop - 1 - self.origin[axis]) // self.cell_size + 1,
+        )
+
+    def candidates(self, bbox: Tuple[int, int, int, int]) -> np.ndarray:
+        y0, x0, y1, x1 = bbox
+        ids = set()
+        for gy in self._cell_range(y0, y1, 0):
+            for gx in self._cell_range(x0, x1, 1):
+                ids.update(self.cells.get((gy, gx), ()))
+        return np.fromiter(sorted(ids), dtype=np.int64, count=len(ids))
+
+
+class CziSubblockIndex:
+    """
+    Index of subblock pyramid level, channel, scene and bounding box built from
+    the subblock directory alone, no subblock segment is read.
+
+    Bounding boxes are in the global CZI pixel coordinates of the base level,
+    `downsample` is 1 for base level subblocks and the downsampling factor for
+    stored pyramid subblocks.
+
+    Parameters
+    ----------
+    records: list of CziSubblockRecord
+        one record per subblock, `idx` indexes `CziFile.subblock_directory`
+    """
+
+    VERSION = 1
+
+    def __init__(self, records: List[CziSubblockRecord]):
+        self.records = records
+        rec_array = np.asarray(
+            [
+                (r.downsample, r.channel, r.scene, r.y, r.x, r.height, r.width)
+                for r in records
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 7)
+        self._downsample = rec_array[:, 0]
+        self._channel = rec_array[:, 1]
+        self._scene = rec_array[:, 2]
+        self._y0, self._x0 = rec_array[:, 3], rec_array[:, 4]
+        self._y1 = self._y0 + rec_array[:, 5]
+        self._x1 = self._x0 + rec_array[:, 6]
+        self._grids: Dict[int, _SubblockGrid] = dict()
+        self._grid_lock = threading.Lock()
+
+    @classmethod
+    def from_directory(cls, subblock_directory: Sequence) -> "CziSubblockIndex":
+        records = []
+        for idx, de in enumerate(subblock_directory):
+            dims = {dim.dimension: dim for dim in de.dimension_entries}
+            y_dim, x_dim = dims["Y"], dims["X"]
+            if de.pyramid_type == 0:
+                downsample = 1
+            else:
+                # edge tiles can be cropped on one axis, use the larger factor
+                downsample = int(
+                    round(
+                        max(
+                            y_dim.size / y_dim.stored_size,
+                            x_dim.size / x_dim.stored_size,
+                        )
+                    )
+                )
+            records.append(
+                CziSubblockRecord(
+                    idx=idx,
+                    downsample=max(downsample, 1),
+                    pyramid_type=int(de.pyramid_type),
+                    channel=dims["C"].start if "C" in dims else 0,
+                    scene=dims["S"].start if "S" in dims else 0,
+                    mosaic_index=dims["M"].start if "M" in dims else -1,
+                    y=y_dim.start,
+                    x=x_dim.start,
+                    height=y_dim.size,
+                    width=x_dim.size,
+                    stored_height=y_dim.stored_size,
+                    stored_width=x_dim.stored_size,
+                )
+            )
+        return cls(records)
+
+    @property
+    def levels(self) -> List[int]:
+        """Downsampling factors of all levels stored in the file, base first"""
+        return sorted(np.unique(self._downsample).tolist())
+
+    @property
+    def channels(self) -> List[int]:
+        return sorted(np.unique(self._channel).tolist())
+
+    @property
+    def scenes(self) -> List[int]:
+        return sorted(np.unique(self._scene).tolist())
+
+    def _mask(
+        self,
+        downsample: Optional[int] = None,
+        channels: Optional[Sequence[int]] = None,
+        scenes: Optional[Sequence[int]] = None,
+    ) -> np.ndarray:
+        mask = np.ones(len(self.records), dtype=bool)
+        if downsample is not None:
+            mask &= self._downsample == downsample
+        if channels is not None:
+            mask &= np.isin(self._channel, channels)
+        if scenes is not None:
+            mask &= np.isin(self._scene, scenes)
+        return mask
+
+    def level(
+        self,
+        downsample: int = 1,
+        channels: Optional[Sequence[int]] = None,
+        scenes: Optional[Sequence[int]] = None,
+    ) -> List[CziSubblockRecord]:
+        """All subblocks of a pyramid level"""
+        mask = self._mask(downsample, channels, scenes)
+        return [self.records[i] for i in np.flatnonzero(mask)]
+
+    def query(
+        self,
+        bbox: Tuple[int, int, int, int],
+        downsample: int = 1,
+        channels: Optional[Sequence[int]] = None,
+        scenes: Optional[Sequence[int]] = None,
+    ) -> List[CziSubblockRecord]:
+        """
+        Subblocks of a pyramid level intersecting a region
+
+        Parameters
+        ----------
+        bbox: tuple of int
+            (y0, x0, y1, x1) of the region in base level pixel coordinates,
+            end exclusive
+        downsample: int
+            downsampling factor of the pyramid level
+        channels: sequence of int
+            only return subblocks of these channels
+        scenes: sequence of int
+            only return subblocks of these scenes
+
+        Returns
+        -------
+        records: list of CziSubblockRecord
+            intersecting subblocks in directory order
+        """
+        if bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            return []
+
+        ids = self._grid(downsample).candidates(bbox)
+        y0, x0, y1, x1 = bbox
+        keep = (self._y0[ids] < y1) & (self._y1[ids] > y0)
+        keep &= (self._x0[ids] < x1) & (self._x1[ids] > x0)
+        if channels is not None:
+            keep &= np.isin(self._channel[ids], channels)
+        if scenes is not None:
+            keep &= np.isin(self._scene[ids], scenes)
+        return [self.records[i] for i in ids[keep]]
+
+    def _grid(self, downsample: int) -> _SubblockGrid:
+        grid = self._grids.get(downsample)
+        if grid is None:
+            with self._grid_lock:
+                grid = self._grids.get(downsample)
+                if grid is None:
+                    ids = np.flatnonzero(self._downsample == downsample)
+                    grid = _SubblockGrid(
+                        ids, self._y0[ids], self._x0[ids], self._y1[ids], self._x1[ids]
+                    )
+                    self._grids[downsample] = grid
+        return grid
+
+    def bounds(
+        self,
+        downsample: int = 1,
+        scenes: Optional[Sequence[int]] = None,
+    ) -> Tuple[int, int, int, int]:
+        """(y0, x0, y1, x1) extent of a pyramid level in base level coordinates"""
+        mask = self._mask(downsample, None, scenes)
+        return (
+            int(self._y0[mask].min()),
+            int(self._x0[mask].min()),
+            int(self._y1[mask].max()),
+            int(self._x1[mask].max()),
+        )
+
+    def save(self, index_fp: Union[str, Path], file_size: int, mtime: float) -> None:
+        """Write the index as JSON, keyed by the size and mtime of the CZI"""
+        index_data = {
+            "version": self.VERSION,
+            "file_size": file_size,
+            "mtime": mtime,
+            "fields": list(CziSubblockRecord._fields),
+            "records": [list(r) for r in self.records],
+        }
+        tmp_fp = Path(f"{index_fp}.{os.getpid()}.tmp")
+        with open(tmp_fp, "w") as f:
+            json.dump(index_data, f)
+        os.replace(tmp_fp, index_fp)
+
+    @classmethod
+    def load(
+        cls, index_fp: Union[str, Path], file_size: int, mtime: float
+    ) -> Optional["CziSubblockIndex"]:
+        """Read a JSON index, returns None if missing or stale"""
+        try:
+            with open(index_fp, "r") as f:
+                index_data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (
+            index_data.get("version") != cls.VERSION
+            or index_data.get("file_size") != file_size
+            or index_data.get("mtime") != mtime
+            or index_data.get("fields") != list(CziSubblockRecord._fields)
+        ):
+            return None
+
+        return cls([CziSubblockRecord(*r) for r in index_data["records"]])
+
+
+def czi_index_sidecar_path(czi_fp: Union[str, Path]) -> Path:
+    return Path(f"{czi_fp}.subblock-index.json")
+
+
+def get_czi_subblock_index(czi: CziFile, sidecar: bool = False) -> CziSubblockIndex:
+    """
+    Build the subblock index of a CZI from its subblock directory
+
+    Parameters
+    ----------
+    czi: CziFile
+        opened CZI
+    sidecar: bool
+        read the index from a JSON sidecar next to the CZI if it matches the
+        file size and modification time, otherwise write it there for next time
+
+    Returns
+    -------
+    index: CziSubblockIndex
+        subblock index of the CZI
+    """
+    if not sidecar:
+        return CziSubblockIndex.from_directory(czi.subblock_directory)
+
+    czi_fp = Path(czi._fh.dirname) / czi._fh.name
+    czi_stat = os.stat(czi_fp)
+    index_fp = czi_index_sidecar_path(czi_fp)
+
+    index = CziSubblockIndex.load(index_fp, czi_stat.st_size, czi_stat.st_mtime)
+    if index is None:
+        index = CziSubblockIndex.from_directory(czi.subblock_directory)
+        try:
+            index.save(index_fp, czi_stat.st_size, czi_stat.st_mtime)
+        except OSError:
+            # read-only location, the index is simply rebuilt next time
+            pass
+    return index
+
+
+def _select(
+    values: List[int], indices: Optional[Sequence[int]], ignore: bool = False
+) -> List[int]:
+    """values at indices, all values if indices is None"""
+    if indices is None or ignore:
+        return values
+    return [values[i] for i in indices]
+
+
+class CziPyramidLevel:
+    """
+    Array-like view of one pyramid level of a CZI.
+
+    Indexing decodes only the subblocks of the level that intersect the
+    requested region, so wrapping it with `dask.array.from_array` gives a lazy
+    array without any scratch copy. Levels are (C, Y, X), or (Y, X, S) for
+    RGB data, in level pixel coordinates with the base level origin at 0.
+    Scenes are placed at their position in the global CZI coordinates, the
+    level is cropped to the bounds of the selected scenes.
+
+    Parameters
+    ----------
+    czi: CziRegImageReader
+        opened CZI, its file handle must be thread safe if indexed concurrently
+    downsample: int
+        downsampling factor of the level, 1 for the base level
+    channel_indices: list of int
+        indices of the channels to read, all channels by default,
+        ignored for RGB data
+    scene_indices: list of int
+        indices of the scenes to read, all scenes by default
+    """
+
+    def __init__(
+        self,
+        czi: "CziRegImageReader",
+        downsample: int = 1,
+        channel_indices: Optional[Sequence[int]] = None,
+        scene_indices: Optional[Sequence[int]] = None,
+    ):
+        self.czi = czi
+        self.downsample = downsample
+        index = czi.subblock_index
+        self._is_rgb = czi.shape[-1] > 1
+        self._channels = _select(index.channels, channel_indices, self._is_rgb)
+        self._scenes = _select(index.scenes, scene_indices)
+        self._records = index.level(
+            downsample,
+            channels=None if self._is_rgb else self._channels,
+            scenes=self._scenes,
+        )
+        self._origin = index.bounds(1, scenes=self._scenes)[:2]
+
+        level_y, level_x = 0, 0
+        for r in self._records:
+            ty, tx = self._tile_origin(r)
+            level_y = max(level_y, ty + self._tile_shape(r)[0])
+            level_x = max(level_x, tx + self._tile_shape(r)[1])
+
+        self.dtype = np.dtype(czi.dtype)
+        if self._is_rgb:
+            self.shape = (level_y, level_x, czi.shape[-1])
+        else:
+            self.shape = (len(self._channels), level_y, level_x)
+        self.ndim = len(self.shape)
+
+    def _tile_origin(self, record: CziSubblockRecord) -> Tuple[int, int]:
+        return (
+            (record.y - self._origin[0]) // self.downsample,
+            (record.x - self._origin[1]) // self.downsample,
+        )
+
+    def _tile_shape(self, record: CziSubblockRecord) -> Tuple[int, int]:
+        # base level subblocks are resized to their logical size on decode
+        if self.downsample == 1:
+            return record.height, record.width
+        return record.stored_height, record.stored_width
+
+    def _decode(self, record: CziSubblockRecord) -> np.ndarray:
+        subblock = self.czi.subblock_directory[record.idx].data_segment()
+        tile = subblock.data(resize=self.downsample == 1)
+        return tile.reshape(*self._tile_shape(record), -1)
+
+    def read_region(
+        self,
+        y_range: Tuple[int, int],
+        x_range: Tuple[int, int],
+        ch_range: Optional[Tuple[int, int]] = None,
+    ) -> np.ndarray:
+        """Decode a region of the level, ranges are end exclusive"""
+        y0, y1 = y_range
+        x0, x1 = x_range
+        if ch_range is None:
+            ch_range = (0, 1 if self._is_rgb else self.shape[0])
+        channels = self._channels[ch_range[0] : ch_range[1]]
+
+        if self._is_rgb:
+            out = np.zeros((y1 - y0, x1 - x0, self.shape[-1]), dtype=self.dtype)
+        else:
+            out = np.zeros((len(channels), y1 - y0, x1 - x0), dtype=self.dtype)
+
+        if out.size == 0:
+            return out
+
+        f = self.downsample
+        bbox = (
+            self._origin[0] + y0 * f,
+            self._origin[1] + x0 * f,
+            self._origin[0] + y1 * f,
+            self._origin[1] + x1 * f,
+        )
+        records = self.czi.subblock_index.query(
+            bbox,
+            downsample=f,
+            channels=None if self._is_rgb else channels,
+            scenes=self._scenes,
+        )
+        # overlapping mosaic tiles are drawn in mosaic order like czifile
+        records = sorted(records, key=lambda r: (r.mosaic_index, r.idx))
+
+        for record in records:
+            ty, tx = self._tile_origin(record)
+            th, tw = self._tile_shape(record)
+            oy0, oy1 = max(ty, y0), min(ty + th, y1)
+            ox0, ox1 = max(tx, x0), min(tx + tw, x1)
+            if oy0 >= oy1 or ox0 >= ox1:
+                continue
+
+            tile = self._decode(record)[oy0 - ty : oy1 - ty, ox0 - tx : ox1 - tx]
+            if self._is_rgb:
+                out[oy0 - y0 : oy1 - y0, ox0 - x0 : ox1 - x0] = tile
+            else:
+                ch_pos = channels.index(record.channel)
+                out[ch_pos, oy0 - y0 : oy1 - y0, ox0 - x0 : ox1 - x0] = tile[..., 0]
+
+        return out
+
+    def __getitem__(self, key) -> np.ndarray:
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        ranges = []
+        steps = []
+        for k, dim_size in zip(key, self.shape):
+            if isinstance(k, int):
+                k = slice(k, k + 1)
+            start, stop, step = k.indices(dim_size)
+            ranges.append((start, max(start, stop)))
+            steps.append(slice(None, None, step))
+
+        if self._is_rgb:
+            region = self.read_region(ranges[0], ranges[1])
+            region = region[:, :, ranges[2][0] : ranges[2][1]]
+        else:
+            region = self.read_region(ranges[1], ranges[2], ch_range=ranges[0])
+
+        return region[tuple(steps)]
+
+
+def _ordered_map(
+    func: Callable, items: Sequence, max_workers: int, prefetch: int = 4
+) -> Iterator:
+    """
+    Map func over items with a thread pool, yielding results in item order and
+    keeping at most prefetch * max_workers results in flight
+    """
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        pending = deque()
+        items_iter = iter(items)
+        for item in items_iter:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= prefetch * max_workers:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for item in items_iter:
+                pending.append(executor.submit(func, item))
+                break
+            yield result
+
+
+class _ChunkAggregator:
+    """
+    Buffer tiles per destination chunk of a zarr array and write every chunk
+    once, when all tiles covering it have been placed
+
+    Parameters
+    ----------
+    out: zarr.core.Array
+        destination array, chunks not covered by any tile are left empty
+    regions: list of tuple of slice
+        output region of every tile that will be placed, in placement order
+    max_workers: int
+        threads used to compress and write chunks
+    """
+
+    def __init__(
+        self, out: zarr.core.Array, regions: List[Tuple[slice, ...]], max_workers: int
+    ):
+        self.out = out
+        self._buffers: Dict[Tuple[int, ...], np.ndarray] = dict()
+        self._remaining: Dict[Tuple[int, ...], int] = dict()
+        for region in regions:
+            for chunk_key in self._chunk_keys(region):
+                self._remaining[chunk_key] = self._remaining.get(chunk_key, 0) + 1
+        self._executor = ThreadPoolExecutor(max(max_workers, 1))
+        self._writes = []
+
+    def _chunk_keys(self, region: Tuple[slice, ...]) -> Iterator[Tuple[int, ...]]:
+        if any(r.start >= r.stop for r in region):
+            return iter(())
+        ranges = [
+            range(r.start // c, (r.stop - 1) // c + 1)
+            for r, c in zip(region, self.out.chunks)
+        ]
+        return itertools.product(*ranges)
+
+    def _chunk_region(self, chunk_key: Tuple[int, ...]) -> Tuple[slice, ...]:
+        return tuple(
+            slice(k * c, min((k + 1) * c, n))
+            for k, c, n in zip(chunk_key, self.out.chunks, self.out.shape)
+        )
+
+    def place(self, region: Tuple[slice, ...], tile: np.ndarray) -> None:
+        for chunk_key in self._chunk_keys(region):
+            chunk_region = self._chunk_region(chunk_key)
+            buffer = self._buffers.get(chunk_key)
+            if buffer is None:
+                buffer = np.full(
+                    tuple(r.stop - r.start for r in chunk_region),
+                    self.out.fill_value or 0,
+                    dtype=self.out.dtype,
+                )
+                self._buffers[chunk_key] = buffer
+
+            overlap = [
+                (max(r.start, cr.start), min(r.stop, cr.stop))
+                for r, cr in zip(region, chunk_region)
+            ]
+            buffer[
+                tuple(
+                    slice(o0 - cr.start, o1 - cr.start)
+                    for (o0, o1), cr in zip(overlap, chunk_region)
+                )
+            ] = tile[
+                tuple(
+                    slice(o0 - r.start, o1 - r.start)
+                    for (o0, o1), r in zip(overlap, region)
+                )
+            ]
+
+            self._remaining[chunk_key] -= 1
+            if self._remaining[chunk_key] == 0:
+                self._write(chunk_key)
+
+    def _write(self, chunk_key: Tuple[int, ...]) -> None:
+        buffer = self._buffers.pop(chunk_key)
+        region = self._chunk_region(chunk_key)
+        self._writes.append(self._executor.submit(self.out.__setitem__, region, buffer))
+
+    def finish(self) -> None:
+        for chunk_key in list(self._buffers.keys()):
+            self._write(chunk_key)
+        try:
+            for write in self._writes:
+                write.result()
+        finally:
+            self._executor.shutdown()
 
 
 class CziRegImageReader(CziFile):
     """
     Sub-class of CziFile with added functionality to only read certain channels
+    and scenes, subblocks of unselected channels and scenes are never decoded
+
+    Parameters
+    ----------
+    index_sidecar: bool
+        persist the subblock index as a JSON sidecar next to the file
     """
 
+    def __init__(self, arg, *args, index_sidecar: bool = False, **kwargs):
+        super().__init__(arg, *args, **kwargs)
+        self._index_sidecar = index_sidecar
+        self._subblock_index: Optional[CziSubblockIndex] = None
+
+    @property
+    def subblock_index(self) -> CziSubblockIndex:
+        """Subblock index of the file, built on first access"""
+        if self._subblock_index is None:
+            self._subblock_index = get_czi_subblock_index(
+                self, sidecar=self._index_sidecar
+            )
+        return self._subblock_index
+
+    def stored_pyramid(
+        self,
+        chunk_size: int = 2048,
+        channel_indices: Optional[Sequence[int]] = None,
+        scene_indices: Optional[Sequence[int]] = None,
+    ) -> List[da.Array]:
+        """
+        Lazy pyramid of the levels stored in the file
+
+        Every level maps directly onto its stored subblocks, chunks only decode
+        the subblocks they intersect and nothing is written to disk.
+
+        Parameters
+        ----------
+        chunk_size: int
+            size of the dask chunks along y and x
+        channel_indices: list of int
+            indices of the channels to read, all channels by default
+        scene_indices: list of int
+            indices of the scenes to read, all scenes by default
+
+        Returns
+        -------
+        dask_pyr: list of da.Array
+            stored pyramid, base level first
+        """
+        return [
+            self.level_to_dask(ds, chunk_size, channel_indices, scene_indices)
+            for ds in self.subblock_index.levels
+        ]
+
+    def level_to_dask(
+        self,
+        downsample: int = 1,
+        chunk_size: int = 2048,
+        channel_indices: Optional[Sequence[int]] = None,
+        scene_indices: Optional[Sequence[int]] = None,
+    ) -> da.Array:
+        """
+        Lazy dask array of one stored level, chunks are decoded on demand from
+        the subblocks they intersect
+
+        Parameters
+        ----------
+        downsample: int
+            downsampling factor of the level, 1 for the base level
+        chunk_size: int
+            size of the dask chunks along y and x
+        channel_indices: list of int
+            indices of the channels to read, all channels by default
+        scene_indices: list of int
+            indices of the scenes to read, all scenes by default
+
+        Returns
+        -------
+        level: da.Array
+            (C, Y, X) or (Y, X, S) for RGB data
+        """
+        # subblocks are decoded from dask worker threads
+        self._fh.lock = True
+        level = CziPyramidLevel(self, downsample, channel_indices, scene_indices)
+        if self.shape[-1] > 1:
+            chunks = (chunk_size, chunk_size, level.shape[-1])
+        else:
+            chunks = (1, chunk_size, chunk_size)
+
+        return da.from_array(
+            level,
+            chunks=chunks,
+            lock=False,
+            asarray=False,
+            fancy=False,
+            meta=np.empty((0,) * level.ndim, dtype=level.dtype),
+            name=(
+                f"czi-{self._fh.name}-{downsample}-"
+                f"{tokenize(id(self), channel_indices, scene_indices)}"
+            ),
+        )
+
     def sub_asarray(
         self,
         resize: bool = True,
@@ -23,10 +725,18 @@ class CziRegImageReader(CziFile):
         out: Optional[np.ndarray] = None,
         max_workers: Optional[int] = None,
         zarr_fp: Optional[zarr.TempStore] = None,
+        channel_indices: Optional[Sequence[int]] = None,
+        scene_indices: Optional[Sequence[int]] = None,
     ) -> Union[np.ndarray, zarr.core.Array]:
 
         """Return image data from file(s) as numpy array.
 
+        Subblocks are decoded concurrently but placed in mosaic order, so
+        overlapping tiles give the same result as a sequential read. When
+        writing to zarr, decoded subblocks are buffered per destination chunk
+        and every chunk is written exactly once, as soon as all subblocks
+        covering it have been placed.
+
         Parameters
         ----------
         resize : bool
@@ -41,16 +751,22 @@ class CziRegImageReader(CziFile):
             create a memory-map to an array stored in a binary file on disk.
         max_workers : int
             Maximum number of threads to read and decode subblock data.
-            By default up to half the CPU cores are used.
-        channel_idx : int or list of int
-            The indices of the channels to extract
-        as_uint8 : bool
-            byte-scale image data to np.uint8 data type
-
-        Parameters
-        ----------
-        out:np.ndarray
-            image read with selected parameters as np.ndarray
+            Threads are granted by the resource manager, by default the whole
+            thread budget is asked for and fewer are granted when other work
+            holds part of it.
+        zarr_fp : zarr.TempStore
+            if given, image data is written to array "0" of this store
+        channel_indices : list of int
+            The indices of the channels to extract, only their subblocks are
+            decoded. All channels by default
+        scene_indices : list of int
+            The indices of the scenes to extract, only their subblocks are
+            decoded. All scenes by default
+
+        Returns
+        -------
+        out: np.ndarray or zarr.core.Array
+            image read with selected parameters
         """
 
         out_shape = list(self.shape)
@@ -58,11 +774,26 @@ class CziRegImageReader(CziFile):
 
         out_dtype = self.dtype
 
+        # unselected channels and scenes are dropped from the output, selected
+        # ones are mapped to their position in the selection
+        selection: Dict[int, Dict[int, int]] = dict()
+        for dim, indices in (("C", channel_indices), ("S", scene_indices)):
+            if indices is None or dim not in self.axes:
+                continue
+            dim_idx = self.axes.index(dim)
+            dim_values = sorted(
+                {de.start[dim_idx] for de in self.filtered_subblock_directory}
+            )
+            selection[dim_idx] = {
+                dim_values[i]: start[dim_idx] + pos for pos, i in enumerate(indices)
+            }
+            out_shape[dim_idx] = len(indices)
+
         if zarr_fp is not None:
             rgb_chunk = self.shape[-1] if self.shape[-1] > 2 else 1
             root = zarr.open_group(zarr_fp, mode="a")
             pyramid_seq = str(0)
-            chunking = (1, 1, 1, 2048, 2048, rgb_chunk)
+            chunking = (1,) * (len(out_shape) - 3) + (2048, 2048, rgb_chunk)
             out = root.create_dataset(
                 pyramid_seq,
                 shape=tuple(out_shape),
@@ -74,113 +805,170 @@ class CziRegImageReader(CziFile):
         elif out is None:
             out = create_output(None, tuple(out_shape), out_dtype)
 
-        if max_workers is None:
-            max_workers = multiprocessing.cpu_count() - 1
+        # stored pyramid subblocks would overwrite the base with upsampled data
+        directory_entries = [
+            de
+            for de in self.filtered_subblock_directory
+            if de.pyramid_type == 0
+            and all(de.start[d] in sel for d, sel in selection.items())
+        ]
+
+        def entry_start(directory_entry) -> List[int]:
+            entry_start = list(directory_entry.start)
+            for dim_idx, sel in selection.items():
+                entry_start[dim_idx] = sel[entry_start[dim_idx]]
+            return entry_start
+
+        def out_region(directory_entry) -> Tuple[slice, ...]:
+            """region of the output covered by a subblock, clipped to the output"""
+            return tuple(
+                slice(max(i - j, 0), min(i - j + k, n))
+                for i, j, k, n in zip(
+                    entry_start(directory_entry),
+                    start,
+                    directory_entry.shape,
+                    out_shape,
+                )
+            )
 
-        def func(directory_entry, resize=resize, order=order, start=start, out=out):
-            """Read, decode, and copy subblock data."""
+        def decode(directory_entry) -> np.ndarray:
             subblock = directory_entry.data_segment()
-            dvstart = list(directory_entry.start)
-            tile = subblock.data(resize=resize, order=order)
+            return subblock.data(resize=resize, order=order)
 
-            index = tuple(
-                slice(i - j, i - j + k)
-                for i, j, k in zip(tuple(dvstart), tuple(start), tile.shape)
-            )
+        regions = [out_region(de) for de in directory_entries]
 
-            try:
-                out[index] = tile
-            except ValueError as e:
-                print("error")
-                error = e
-                corr_shape = (
-                    str(error)
-                    .split("shape ")[1]
-                    .split(", got")[0]
-                    .strip("(")
-                    .strip(")")
-                )
-                corr_shape.split(",")
-                cor_shape = tuple(slice(int(t)) for t in corr_shape.split(","))
-                tile = tile[cor_shape]
-                index = tuple(
-                    slice(i - j, i - j + k)
-                    for i, j, k in zip(tuple(dvstart), tuple(start), tile.shape)
+        # decoded tiles in flight are bounded by the prefetch of _ordered_map
+        tile_bytes = (
+            max((int(np.prod(de.stored_shape)) for de in directory_entries), default=0)
+            * np.dtype(self.dtype).itemsize
+        )
+        manager = get_resource_manager()
+        with manager.request(
+            max_workers or manager.n_threads,
+            memory_per_thread=tile_bytes * 4,
+        ) as grant:
+            max_workers = grant.threads
+
+            chunk_writer = None
+            if isinstance(out, zarr.core.Array):
+                chunk_writer = _ChunkAggregator(out, regions, max_workers)
+
+            if max_workers > 1:
+                self._fh.lock = True
+
+            for region, directory_entry, tile in zip(
+                regions,
+                directory_entries,
+                _ordered_map(decode, directory_entries, max_workers),
+            ):
+                if any(r.start >= r.stop for r in region):
+                    continue
+                # edge tiles extending past the image are clipped arithmetically
+                tile_region = tuple(
+                    slice(r.start - (i - j), r.stop - (i - j))
+                    for r, i, j in zip(region, entry_start(directory_entry), start)
                 )
-                out[index] = tile
+                tile = tile[tile_region]
+                if chunk_writer is not None:
+                    chunk_writer.place(region, tile)
+                else:
+                    out[region] = tile
 
-        if max_workers > 1:
-            self._fh.lock = True
-            with ThreadPoolExecutor(max_workers) as executor:
-                executor.map(func, self.filtered_subblock_directory)
-            self._fh.lock = None
-        else:
-
-            for idx, directory_entry in enumerate(self.filtered_subblock_directory):
-                func(directory_entry)
+            if chunk_writer is not None:
+                chunk_writer.finish()
 
         if hasattr(out, "flush"):
             out.flush()
         return out
 
-    def zarr_pyramidalize_czi(self, zarr_fp: zarr.TempStore) -> List[da.Array]:
-        dask_pyr = []
+    def zarr_pyramidalize_czi(
+        self,
+        zarr_fp: zarr.TempStore,
+        channel_indices: Optional[Sequence[int]] = None,
+        scene_indices: Optional[Sequence[int]] = None,
+    ) -> List[da.Array]:
+        """
+        Pyramid with a lazy base level and lower levels computed into a zarr store
+
+        The base level is read tile-on-demand from the subblocks and is not
+        copied, it is decoded once while all sub-resolutions are written.
+
+        Parameters
+        ----------
+        zarr_fp: zarr.TempStore
+            store of the computed pyramid levels
+        channel_indices: list of int
+            indices of the channels to read, all channels by default
+        scene_indices: list of int
+            indices of the scenes to read, all scenes by default
+
+        Returns
+        -------
+        dask_pyr: list of da.Array
+            pyramid, base level first
+        """
         root = zarr.open_group(zarr_fp, mode="a")
 
         root.attrs["axes_names"] = list(self.axes)
         root.attrs["orig_shape"] = list(self.shape)
-        all_axes = list(self.axes)
-        yx_dims = np.where(np.isin(all_axes, ["Y", "X"]) == 1)[0].tolist()
-        yx_shape = np.array(self.shape[slice(yx_dims[0], yx_dims[1] + 1)])
-
-        ds = 1
-        while np.min(yx_shape) // 2**ds >= 512:
-            ds += 1
-
-        self.sub_asarray(zarr_fp=zarr_fp, resize=True, order=0, max_workers=4)
-        zarray = da.squeeze(da.from_zarr(zarr.open(zarr_fp)[0]))
-        dask_pyr.append(da.squeeze(zarray))
-        for ds_factor in range(1, ds):
-            zres = zarr.storage.TempStore()
-            rgb_chunk = self.shape[-1] if self.shape[-1] > 2 else 1
-            is_rgb = True if rgb_chunk > 1 else False
-
-            sub_res_image = compute_sub_res(zarray, ds_factor, 512, is_rgb, self.dtype)
 
-            da.to_zarr(sub_res_image, zres, component="0")
+        is_rgb = self.shape[-1] > 1
+        zarray = self.level_to_dask(
+            1, channel_indices=channel_indices, scene_indices=scene_indices
+        )
+        yx_shape = zarray.shape[:2] if is_rgb else zarray.shape[1:]
+
+        return compute_pyramid(
+            zarray,
+            n_pyramid_levels(yx_shape, 512),
+            512,
+            is_rgb,
+            self.dtype,
+            zarr_store=zarr_fp,
+        )
 
-            dask_pyr.append(da.squeeze(da.from_zarr(zres, component="0")))
 
-        return dask_pyr
+def _czi_subblock_index(czi: CziFile) -> CziSubblockIndex:
+    if isinstance(czi, CziRegImageReader):
+        return czi.subblock_index
+    return get_czi_subblock_index(czi)
 
 
-def get_level_blocks(czi: CziFile) -> dict:
+def get_level_blocks(czi: CziFile) -> Dict[int, List[Tuple[int, CziSubblockRecord]]]:
+    """
+    Group subblocks by pyramid level using only the subblock directory
+
+    Parameters
+    ----------
+    czi: CziFile
+        opened CZI
+
+    Returns
+    -------
+    level_blocks: dict
+        (subblock directory index, record) of every subblock keyed by level,
+        0 is the base level, stored pyramid levels are keyed by their
+        downsampling factor
+    """
+    index = _czi_subblock_index(czi)
     level_blocks = dict()
-    for idx, sb in enumerate(czi.subblocks()):
-        if sb.pyramid_type != 0:
-            level = sb.shape[3] // sb.stored_shape[3]
-        else:
-            level = 0
-
-        try:
-            level_blocks[level]
-        except KeyError:
-            level_blocks[level] = dict()
-            level_blocks[level] = [(idx, sb)]
-            continue
-
-        level_blocks[level].append((idx, sb))
-
+    for downsample in index.levels:
+        level = 0 if downsample == 1 else downsample
+        level_blocks[level] = [(r.idx, r) for r in index.level(downsample)]
     return level_blocks
 
 
 def get_czi_thumbnail(
-    czi: CziFile, pixel_spacing: Union[Tuple[int, int], Tuple[float, float]]
+    czi: CziFile,
+    pixel_spacing: Union[Tuple[int, int], Tuple[float, float]],
+    channel_indices: Optional[Sequence[int]] = None,
+    scene_indices: Optional[Sequence[int]] = None,
 ) -> Optional[Tuple[np.ndarray, Tuple[float, float]]]:
-    ch_idx = czi.axes.index("C")
-    l_blocks = get_level_blocks(czi)
-    lowest_im = np.max(list(l_blocks.keys()))
-    if lowest_im == 0:
+    index = _czi_subblock_index(czi)
+    channels = _select(index.channels, channel_indices)
+    scenes = _select(index.scenes, scene_indices)
+    lowest_im = np.max(index.levels)
+    if lowest_im == 1:
         calc_thumbnail_spacing = np.asarray(pixel_spacing) * 1
     else:
         calc_thumbnail_spacing = np.asarray(pixel_spacing) * lowest_im
@@ -190,28 +978,29 @@ def get_czi_thumbnail(
         float(calc_thumbnail_spacing[1]),
     )
 
-    block_indices = [b[0] for b in l_blocks[lowest_im]]
-    if guess_rgb(czi.shape) and len(block_indices) == 1:
-        data_idx = block_indices[0]
-        image_data = czi.subblock_directory[data_idx].data_segment()
+    if czi.shape[-1] > 1:
+        level_records = index.level(lowest_im, scenes=scenes)
+    else:
+        level_records = index.level(lowest_im, channels=channels, scenes=scenes)
+
+    if czi.shape[-1] > 1 and len(level_records) == 1:
+        image_data = czi.subblock_directory[level_records[0].idx].data_segment()
         thumbnail_array = np.squeeze(image_data.data(resize=False))
         return thumbnail_array, thumbnail_spacing
 
-    elif len(block_indices) == czi.shape[czi.axes.index("C")]:
-        thumbnail_shape = list(
-            czi.subblock_directory[block_indices[0]].data_segment().stored_shape
+    elif czi.shape[-1] == 1 and len(level_records) == len(channels):
+        thumbnail_array = np.empty(
+            (
+                len(channels),
+                level_records[0].stored_height,
+                level_records[0].stored_width,
+            ),
+            dtype=czi.dtype,
         )
-        thumbnail_shape[ch_idx] = czi.shape[ch_idx]
-
-        thumbnail_array = np.empty(thumbnail_shape, dtype=czi.dtype)
-        thumbnail_array = np.squeeze(thumbnail_array)
-        for b_index in block_indices:
-            image_data = czi.subblock_directory[b_index].data_segment()
-            data_ch_index = [
-                de.start for de in image_data.dimension_entries if de.dimension == "C"
-            ][0]
+        for record in level_records:
+            image_data = czi.subblock_directory[record.idx].data_segment()
             data = np.squeeze(image_data.data(resize=False))
-            thumbnail_array[data_ch_index, :, :] = data
+            thumbnail_array[channels.index(record.channel), :, :] = data
 
         return thumbnail_array, thumbnail_spacing
 
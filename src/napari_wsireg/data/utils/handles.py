@@ -0,0 +1,195 @@
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Union
+
+import numpy as np
+import zarr
+from tifffile import TiffFile, ZarrTiffStore, xml2dict
+
+from napari_wsireg.data.utils.tifffile_meta import (
+    OmePixelsMetadata,
+    ome_xml_pixels_metadata,
+)
+
+if TYPE_CHECKING:
+    from ome_types.model import OME
+
+
+class TiffFileHandle:
+    """
+    Shared, lazily populated handle on a single TIFF file.
+
+    The parsed `TiffFile`, the index of the largest series, the OME metadata
+    and the zarr store of that series are created at most once and re-used by
+    metadata probing, series selection and pyramid creation.
+
+    Parameters
+    ----------
+    image_filepath: str or Path
+        path to the image file
+    """
+
+    def __init__(self, image_filepath: Union[str, Path]):
+        self.path = Path(image_filepath)
+        self.tf = TiffFile(self.path)
+        self._largest_series: Optional[int] = None
+        self._zarr_stores: Dict[int, ZarrTiffStore] = dict()
+        self._ome_metadata: Optional["OME"] = None
+        self._ome_pixels: Dict[int, Optional[OmePixelsMetadata]] = dict()
+        self._lock = threading.RLock()
+        self._n_refs = 0
+
+    @property
+    def largest_series(self) -> int:
+        if self._largest_series is None:
+            with self._lock:
+                if self._largest_series is None:
+                    self._largest_series = largest_series_index(self.tf, self.path)
+        return self._largest_series
+
+    @property
+    def is_ome(self) -> bool:
+        return bool(self.tf.is_ome and self.tf.ome_metadata)
+
+    @property
+    def ome_metadata(self) -> Optional["OME"]:
+        """Full OME model, parsed once on first access"""
+        if self._ome_metadata is None and self.is_ome:
+            with self._lock:
+                if self._ome_metadata is None:
+                    # ome_types is slow to import, only full OME models need it
+                    from ome_types import from_xml
+
+                    self._ome_metadata = from_xml(self.tf.ome_metadata)
+        return self._ome_metadata
+
+    def ome_pixels_metadata(
+        self, series_idx: Optional[int] = None
+    ) -> Optional[OmePixelsMetadata]:
+        """Pixels metadata of one OME Image, only partially parsing the OME-XML"""
+        if not self.is_ome:
+            return None
+        if series_idx is None:
+            series_idx = self.largest_series
+
+        with self._lock:
+            if series_idx not in self._ome_pixels:
+                self._ome_pixels[series_idx] = ome_xml_pixels_metadata(
+                    self.tf.ome_metadata, series_idx
+                )
+        return self._ome_pixels[series_idx]
+
+    def zarr_store(self, series_idx: Optional[int] = None) -> ZarrTiffStore:
+        """Zarr store of a series, backed by the already parsed `TiffFile`"""
+        if series_idx is None:
+            series_idx = self.largest_series
+
+        with self._lock:
+            store = self._zarr_stores.get(series_idx)
+            if store is None:
+                store = self.tf.series[series_idx].aszarr()
+                self._zarr_stores[series_idx] = store
+        return store
+
+    def zarr(
+        self, series_idx: Optional[int] = None
+    ) -> Union[zarr.hierarchy.Group, zarr.core.Array]:
+        return zarr.open(self.zarr_store(series_idx), mode="r")
+
+    @property
+    def closed(self) -> bool:
+        return self.tf.filehandle.closed
+
+    def close(self) -> None:
+        with self._lock:
+            for store in self._zarr_stores.values():
+                store.close()
+            self._zarr_stores = dict()
+            self.tf.close()
+
+
+class TiffHandleRegistry:
+    """
+    Reference counted registry of open `TiffFileHandle` keyed by resolved file path.
+
+    Every `acquire` must be paired with a `release`, the file is closed when the
+    last reference is released.
+    """
+
+    def __init__(self):
+        self._handles: Dict[str, TiffFileHandle] = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(image_filepath: Union[str, Path]) -> str:
+        return str(Path(image_filepath).resolve())
+
+    def acquire(self, image_filepath: Union[str, Path]) -> TiffFileHandle:
+        key = self._key(image_filepath)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and not handle.closed:
+                handle._n_refs += 1
+                return handle
+
+        # files are parsed without the registry lock so slow files don't block
+        # other paths, the first handle registered for a path is kept
+        new_handle = TiffFileHandle(image_filepath)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None or handle.closed:
+                handle = new_handle
+                self._handles[key] = handle
+            handle._n_refs += 1
+        if handle is not new_handle:
+            new_handle.close()
+        return handle
+
+    def release(self, image_filepath: Union[str, Path]) -> None:
+        key = self._key(image_filepath)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                return
+            handle._n_refs -= 1
+            if handle._n_refs <= 0:
+                self._handles.pop(key)
+                handle.close()
+
+    def get(self, image_filepath: Union[str, Path]) -> Optional[TiffFileHandle]:
+        """Return an already open handle without taking a reference"""
+        with self._lock:
+            return self._handles.get(self._key(image_filepath))
+
+    def __contains__(self, image_filepath: Union[str, Path]) -> bool:
+        return self.get(image_filepath) is not None
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def close_all(self) -> None:
+        with self._lock:
+            for handle in self._handles.values():
+                handle.close()
+            self._handles = dict()
+
+
+TIFF_HANDLES = TiffHandleRegistry()
+
+
+def largest_series_index(tf: TiffFile, image_filepath: Union[str, Path]) -> int:
+    fp_ext = Path(image_filepath).suffix.lower()
+    if fp_ext == ".scn":
+        scn_meta = xml2dict(tf.scn_metadata)
+        image_meta = scn_meta.get("scn").get("collection").get("image")
+        largest_series = np.argmax(
+            [
+                im.get("scanSettings").get("objectiveSettings").get("objective")
+                for im in image_meta
+            ]
+        )
+    else:
+        largest_series = np.argmax(
+            [np.prod(np.asarray(series.shape), dtype=np.int64) for series in tf.series]
+        )
+    return int(largest_series)
@@ -1,27 +1,106 @@
 from pathlib import Path
-from typing import List, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import zarr
 from dask import array as da
-from tifffile import TiffFile, imread, xml2dict, imwrite
+from tifffile import TiffFile, imread
+
+from napari_wsireg.data.utils.handles import TiffFileHandle, largest_series_index
+from napari_wsireg.data.utils.tiff_tiles import TiffLevelArray, coalesce_chunks
+from napari_wsireg.resources import get_resource_manager
 
 
 def tifffile_to_dask(
-    im_fp: Union[str, Path], largest_series: int
+    im_fp: Union[str, Path],
+    largest_series: int,
+    handle: Optional[TiffFileHandle] = None,
+    chunk_bytes: Optional[int] = None,
 ) -> Union[da.Array, List[da.Array]]:
-    imdata = zarr.open(imread(im_fp, aszarr=True, series=largest_series))
+    """
+    Dask arrays of the levels of a TIFF series
+
+    Chunks of every level group whole tiles, or strips, up to a target size
+    in bytes, which keeps the task graphs of large pyramids small. With an
+    open handle, levels of tiled or stripped pages read the tiles of a chunk
+    in one pass and decode them concurrently, other layouts read them
+    through tifffile's zarr store.
+
+    Parameters
+    ----------
+    im_fp: str or Path
+        TIFF file
+    largest_series: int
+        index of the series to read
+    handle: TiffFileHandle
+        open handle on the file
+    chunk_bytes: int
+        target size in bytes of a chunk, defaults to
+        `tiff_tiles.default_chunk_bytes()`
+
+    Returns
+    -------
+    dask_imdata: da.Array or list of da.Array
+        the level of a single level series, or every level, base first
+    """
+    if handle is not None:
+        imdata = handle.zarr(largest_series)
+    else:
+        imdata = zarr.open(imread(im_fp, aszarr=True, series=largest_series))
+
     if isinstance(imdata, zarr.hierarchy.Group):
-        dask_imdata = []
-        for i in range(128):
-            try:
-                sub_im = da.from_zarr(imdata[i])
-                dask_imdata.append(sub_im)
-            except (KeyError, IndexError):
-                continue
+        level_paths = zarr_level_paths(imdata)
+        zarr_levels = [imdata[p] for p in level_paths]
     else:
-        dask_imdata = da.from_zarr(imdata)
-    return dask_imdata
+        zarr_levels = [imdata]
+
+    dask_imdata = []
+    for level_index, zarr_level in enumerate(zarr_levels):
+        if handle is not None:
+            series = handle.tf.series[largest_series]
+            if level_index < len(series.levels) and TiffLevelArray.is_supported(
+                series, level_index
+            ):
+                dask_imdata.append(
+                    TiffLevelArray(
+                        series, largest_series, level_index, chunk_bytes=chunk_bytes
+                    ).to_dask()
+                )
+                continue
+        # chunks are read region by region from the store, grouping tiles
+        # doesn't read any pixel twice
+        ndim = zarr_level.ndim
+        yx_axes = (
+            (ndim - 3, ndim - 2)
+            if guess_rgb(zarr_level.shape)
+            else (ndim - 2, ndim - 1)
+        )
+        chunks = coalesce_chunks(
+            zarr_level.shape,
+            zarr_level.chunks,
+            zarr_level.dtype.itemsize,
+            yx_axes,
+            chunk_bytes,
+        )
+        dask_imdata.append(da.from_zarr(zarr_level, chunks=chunks))
+
+    if isinstance(imdata, zarr.hierarchy.Group):
+        return dask_imdata
+    return dask_imdata[0]
+
+
+def zarr_level_paths(group: zarr.hierarchy.Group) -> List[str]:
+    """
+    Paths of the pyramid levels of a zarr group, base level first
+
+    Levels are listed by the group's "multiscales" metadata, as written by
+    tifffile and NGFF writers, or are the arrays of the group named by their
+    level index.
+    """
+    multiscales = group.attrs.get("multiscales")
+    if multiscales:
+        return [d["path"] for d in multiscales[0]["datasets"]]
+    return sorted((k for k in group.array_keys() if k.isdigit()), key=int)
 
 
 def guess_rgb(shape: Tuple[int, ...]) -> bool:
@@ -49,7 +128,9 @@ def guess_rgb(shape: Tuple[int, ...]) -> bool:
     return rgb
 
 
-def tf_get_largest_series(image_filepath: Union[str, Path]) -> int:
+def tf_get_largest_series(
+    image_filepath: Union[str, Path], tf: Optional[TiffFile] = None
+) -> int:
     """
     Determine largest series for .scn files by examining metadata
     For other multi-series files, find the one with the most pixels
@@ -58,31 +139,20 @@ def tf_get_largest_series(image_filepath: Union[str, Path]) -> int:
     ----------
     image_filepath: str
         path to the image file
+    tf: TiffFile
+        already opened TiffFile of image_filepath, the file is opened
+        if not provided
 
     Returns
     -------
     largest_series:int
         index of the largest series in the image data
     """
-    fp_ext = Path(image_filepath).suffix.lower()
-    tf_im = TiffFile(image_filepath)
-    if fp_ext == ".scn":
-        scn_meta = xml2dict(tf_im.scn_metadata)
-        image_meta = scn_meta.get("scn").get("collection").get("image")
-        largest_series = np.argmax(
-            [
-                im.get("scanSettings").get("objectiveSettings").get("objective")
-                for im in image_meta
-            ]
-        )
-    else:
-        largest_series = np.argmax(
-            [
-                np.prod(np.asarray(series.shape), dtype=np.int64)
-                for series in tf_im.series
-            ]
-        )
-    return int(largest_series)
+    if tf is not None:
+        return largest_series_index(tf, image_filepath)
+
+    with TiffFile(image_filepath) as tf_im:
+        return largest_series_index(tf_im, image_filepath)
 
 
 def zarr_get_base_pyr_layer(
@@ -109,43 +179,335 @@ def zarr_get_base_pyr_layer(
 
 
 def get_tifffile_info(
-    image_filepath: Union[str, Path]
+    image_filepath: Union[str, Path], handle: Optional[TiffFileHandle] = None
 ) -> Tuple[Tuple[int, int, int], np.dtype, int]:
-    largest_series = tf_get_largest_series(image_filepath)
-    zarr_im = zarr.open(imread(image_filepath, aszarr=True, series=largest_series))
-    zarr_im = zarr_get_base_pyr_layer(zarr_im)
-    im_dims = np.squeeze(zarr_im.shape)
+    """
+    Get base layer dimensions, dtype and largest series of a TIFF file from the
+    TIFF headers alone, no pixel data or zarr store is opened
+
+    Parameters
+    ----------
+    image_filepath: str
+        path to the image file
+    handle: TiffFileHandle
+        already opened handle on image_filepath, the file is opened
+        if not provided
+
+    Returns
+    -------
+    im_dims: np.ndarray
+        base layer dimensions, 2D images are given a leading channel axis
+    im_dtype: np.dtype
+        data type of the image
+    largest_series: int
+        index of the largest series in the image data
+    """
+    if handle is not None:
+        largest_series = handle.largest_series
+        base_series = handle.tf.series[largest_series].levels[0]
+        im_shape, im_dtype = base_series.shape, base_series.dtype
+    else:
+        with TiffFile(image_filepath) as tf:
+            largest_series = largest_series_index(tf, image_filepath)
+            base_series = tf.series[largest_series].levels[0]
+            im_shape, im_dtype = base_series.shape, base_series.dtype
+
+    im_dims = np.squeeze(im_shape)
     if len(im_dims) == 2:
         im_dims = np.concatenate([[1], im_dims])
-    im_dtype = zarr_im.dtype
 
     return im_dims, im_dtype, largest_series
 
 
+# reducers of pyramid downsampling: mean for intensity images, max for
+# masks and mode or nearest for labels, whose values can't be averaged
+REDUCERS = ["mean", "max", "mode", "nearest"]
+
+
+def _sum_dtype(dtype: np.dtype, n_samples: int) -> np.dtype:
+    """Narrowest data type summing `n_samples` values of `dtype` exactly"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return np.promote_types(dtype, np.float32)
+    if dtype.kind == "b":
+        dtype = np.dtype(np.uint8)
+
+    info = np.iinfo(dtype)
+    candidates = (
+        [np.uint16, np.uint32, np.uint64]
+        if dtype.kind == "u"
+        else [np.int16, np.int32, np.int64]
+    )
+    for candidate in candidates:
+        candidate_info = np.iinfo(candidate)
+        if (
+            candidate_info.max >= int(info.max) * n_samples
+            and candidate_info.min <= int(info.min) * n_samples
+        ):
+            return np.dtype(candidate)
+    return np.dtype(np.float64)
+
+
+def _block_sum(
+    x: np.ndarray, axis: Optional[Tuple[int, ...]] = None, dtype: np.dtype = None
+) -> np.ndarray:
+    return np.sum(x, axis=axis, dtype=dtype)
+
+
+def _block_nearest(x: np.ndarray, axis: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+    """Top left sample of every block"""
+    if axis is None:
+        axis = tuple(range(x.ndim))
+    return x[tuple(0 if ax in axis else slice(None) for ax in range(x.ndim))]
+
+
+def _block_mode(x: np.ndarray, axis: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+    """Most frequent sample of every block, ties go to the first in block order"""
+    if axis is None:
+        axis = tuple(range(x.ndim))
+    kept = [ax for ax in range(x.ndim) if ax not in axis]
+    samples = x.transpose(kept + list(axis))
+    samples = samples.reshape(*samples.shape[: len(kept)], -1)
+    counts = np.zeros(samples.shape, dtype=np.uint16)
+    for idx in range(samples.shape[-1]):
+        counts += samples == samples[..., idx : idx + 1]
+    mode_idx = np.argmax(counts, axis=-1)[..., None]
+    return np.take_along_axis(samples, mode_idx, axis=-1)[..., 0]
+
+
+def _sums_to_mean(sums: np.ndarray, n_samples: int, dtype: np.dtype) -> np.ndarray:
+    """Block means from block sums, truncated like casting a float mean"""
+    if sums.dtype.kind == "f":
+        return (sums / n_samples).astype(dtype)
+    means = np.abs(sums) // n_samples
+    if sums.dtype.kind == "i":
+        means = np.where(sums < 0, -means, means)
+    return means.astype(dtype)
+
+
+def _resolve_reducer(reducer: str, dtype: np.dtype) -> str:
+    if reducer not in REDUCERS:
+        raise ValueError(f"reducer must be one of {REDUCERS}, got {reducer}")
+    # the mean of a mask is cast back to True wherever any sample is
+    if reducer == "mean" and np.dtype(dtype).kind == "b":
+        return "max"
+    return reducer
+
+
+def _coarsen(
+    level: da.Array,
+    resampling_axis: Dict[int, int],
+    reducer: str,
+    source_dtype: np.dtype,
+    n_samples: int,
+) -> da.Array:
+    """
+    Block reduction of a level, "mean" returns block sums of `n_samples`
+    source pixels so means can be cascaded through levels without rounding
+    """
+    if reducer == "mean":
+        return da.coarsen(
+            _block_sum,
+            level,
+            resampling_axis,
+            trim_excess=True,
+            dtype=_sum_dtype(source_dtype, n_samples),
+        )
+    kernel = {"max": np.max, "mode": _block_mode, "nearest": _block_nearest}[reducer]
+    return da.coarsen(kernel, level, resampling_axis, trim_excess=True)
+
+
+def _coarsened_to_dtype(
+    level: da.Array, reducer: str, n_samples: int, im_dtype: np.dtype
+) -> da.Array:
+    if reducer == "mean":
+        return level.map_blocks(
+            _sums_to_mean, n_samples, im_dtype, dtype=np.dtype(im_dtype)
+        )
+    return level.astype(im_dtype)
+
+
 def compute_sub_res(
-    zarray: da.Array, ds_factor: int, tile_size: int, is_rgb: bool, im_dtype: np.dtype
+    zarray: da.Array,
+    ds_factor: int,
+    tile_size: int,
+    is_rgb: bool,
+    im_dtype: np.dtype,
+    reducer: str = "mean",
 ) -> da.Array:
+    """
+    Downsample an image by 2**ds_factor along y and x
+
+    Block reductions run on the image's data type, means accumulate in the
+    narrowest integer type that can't overflow instead of float64.
+
+    Parameters
+    ----------
+    zarray: da.Array
+        image as (C, Y, X), or (Y, X, S) for RGB data
+    ds_factor: int
+        power of 2 of the downsampling
+    tile_size: int
+        chunk size of the output along y and x
+    is_rgb: bool
+        whether the image is interleaved RGB
+    im_dtype: np.dtype
+        data type of the output
+    reducer: str
+        one of `REDUCERS`, "mode" is applied in 2x steps
+
+    Returns
+    -------
+    sub_res: da.Array
+        downsampled image
+    """
+    reducer = _resolve_reducer(reducer, zarray.dtype)
     if is_rgb:
-        resampling_axis = {0: 2**ds_factor, 1: 2**ds_factor, 2: 1}
         tiling = (tile_size, tile_size, 3)
     else:
-        resampling_axis = {0: 1, 1: 2**ds_factor, 2: 2**ds_factor}
         tiling = (1, tile_size, tile_size)
 
-    resampled_zarray_subres = da.coarsen(
-        np.mean,
-        zarray,
-        resampling_axis,
-        trim_excess=True,
-    )
-    resampled_zarray_subres = resampled_zarray_subres.astype(im_dtype)
-    resampled_zarray_subres = resampled_zarray_subres.rechunk(tiling)
+    def resampling_axis(factor: int) -> Dict[int, int]:
+        if is_rgb:
+            return {0: factor, 1: factor, 2: 1}
+        return {0: 1, 1: factor, 2: factor}
+
+    if reducer == "mode":
+        sub_res = zarray
+        for _ in range(ds_factor):
+            sub_res = _coarsen(sub_res, resampling_axis(2), reducer, zarray.dtype, 4)
+    else:
+        sub_res = _coarsen(
+            zarray,
+            resampling_axis(2**ds_factor),
+            reducer,
+            zarray.dtype,
+            4**ds_factor,
+        )
+
+    sub_res = _coarsened_to_dtype(sub_res, reducer, 4**ds_factor, im_dtype)
+    return sub_res.rechunk(tiling)
 
-    return resampled_zarray_subres
 
+def n_pyramid_levels(yx_shape: Tuple[int, int], min_size: int = 512) -> int:
+    """Number of levels, base included, halving until the smallest side would go
+    below `min_size`"""
+    n_levels = 1
+    while np.min(yx_shape) // 2**n_levels >= min_size:
+        n_levels += 1
+    return n_levels
+
+
+class _ReportingTarget:
+    """Store target reporting the bytes of every chunk written to it"""
+
+    def __init__(self, target: zarr.Array, on_chunk_stored: Callable[[int], None]):
+        self.target = target
+        self.on_chunk_stored = on_chunk_stored
+        self.shape = target.shape
+        self.dtype = target.dtype
+
+    def __setitem__(self, key, value: np.ndarray) -> None:
+        self.target[key] = value
+        self.on_chunk_stored(value.nbytes)
+
+
+def compute_pyramid(
+    base: da.Array,
+    n_levels: int,
+    tile_size: int,
+    is_rgb: bool,
+    im_dtype: np.dtype,
+    zarr_store: Optional[zarr.storage.BaseStore] = None,
+    store_base: bool = False,
+    on_chunk_stored: Optional[Callable[[int], None]] = None,
+    reducer: str = "mean",
+) -> List[da.Array]:
+    """
+    Build a pyramid where every level is derived from the level above it
+
+    Levels are 2x block reductions of the level above. Means are cascaded as
+    exact integer block sums and only divided on output, so they match
+    coarsening the base directly. When a store is given all levels are written
+    in a single pass, each base chunk is read once and the lower levels are
+    produced as it streams through.
+
+    Parameters
+    ----------
+    base: da.Array
+        base level as (C, Y, X), or (Y, X, S) for RGB data
+    n_levels: int
+        number of levels including the base
+    tile_size: int
+        chunk size of the sub-resolution levels along y and x
+    is_rgb: bool
+        whether the base is interleaved RGB
+    im_dtype: np.dtype
+        data type of the output levels
+    zarr_store: zarr store
+        if given, sub-resolutions are written into arrays "1", "2", ... of the
+        store and returned as dask arrays backed by it
+    store_base: bool
+        also write the base into array "0" of the store, in the same pass
+    on_chunk_stored: callable
+        called with the number of bytes of every chunk written to the store,
+        exceptions it raises abort the write
+    reducer: str
+        one of `REDUCERS`, "mean" for intensity images, "max" for masks,
+        "mode" or "nearest" for labels
+
+    Returns
+    -------
+    dask_pyr: list of da.Array
+        base followed by the sub-resolution levels
+    """
+    if is_rgb:
+        resampling_axis = {0: 2, 1: 2, 2: 1}
+        tiling = (tile_size, tile_size, base.shape[2])
+    else:
+        resampling_axis = {0: 1, 1: 2, 2: 2}
+        tiling = (1, tile_size, tile_size)
+
+    reducer = _resolve_reducer(reducer, base.dtype)
+    sub_res_levels = []
+    level = base
+    for idx in range(1, n_levels):
+        level = _coarsen(level, resampling_axis, reducer, base.dtype, 4**idx)
+        sub_res_levels.append(
+            _coarsened_to_dtype(level, reducer, 4**idx, im_dtype).rechunk(tiling)
+        )
+
+    if zarr_store is None or (len(sub_res_levels) == 0 and not store_base):
+        return [base, *sub_res_levels]
+
+    levels = [base.astype(im_dtype).rechunk(tiling)] if store_base else []
+    levels.extend(sub_res_levels)
+    first_idx = 0 if store_base else 1
+
+    root = zarr.open_group(zarr_store, mode="a")
+    targets = [
+        root.create_dataset(
+            str(idx),
+            shape=level.shape,
+            chunks=tiling,
+            dtype=im_dtype,
+            overwrite=True,
+        )
+        for idx, level in enumerate(levels, start=first_idx)
+    ]
+    store_targets = (
+        [_ReportingTarget(target, on_chunk_stored) for target in targets]
+        if on_chunk_stored
+        else targets
+    )
+    # every thread holds a base chunk and its quarter size block sums
+    memory_per_thread = int(np.prod(base.chunksize)) * (
+        base.dtype.itemsize + _sum_dtype(base.dtype, 4).itemsize
+    )
+    # dask chunks match the zarr chunks, no lock needed
+    get_resource_manager().store(
+        levels, store_targets, memory_per_thread=memory_per_thread, lock=False
+    )
 
-def write_image_from_napari(
-    image_data: Union[np.ndarray, da.Array, zarr.Array], output_fp: str
-) -> str:
-    imwrite(output_fp, image_data, compression="deflate", tile=(2048, 2048))
-    return output_fp
+    stored = [da.from_zarr(target) for target in targets]
+    return stored if store_base else [base, *stored]
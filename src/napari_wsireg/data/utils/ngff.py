@@ -0,0 +1,125 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import zarr
+
+from napari_wsireg.data.utils.tifffile_meta import length_unit_to_um
+
+# axes of NGFF versions before 0.4, which do not describe them
+NGFF_DEFAULT_AXES = ["t", "c", "z", "y", "x"]
+
+
+class NgffMultiscales(NamedTuple):
+    """
+    Multiscale image described by NGFF "multiscales" metadata
+
+    Attributes
+    ----------
+    axes: list of str
+        axis names of every level, e.g. ["c", "y", "x"]
+    paths: list of str
+        path of every level in the group, base level first
+    scales: list of list of float
+        scale of every axis of every level, 1 when not given
+    units: list of str
+        unit of every axis, None when not given
+    """
+
+    axes: List[str]
+    paths: List[str]
+    scales: List[List[float]]
+    units: List[Optional[str]]
+
+
+def _axes(multiscale: Dict[str, Any], ndim: int) -> Tuple[List[str], List[str]]:
+    axes = multiscale.get("axes")
+    if axes is None:
+        return NGFF_DEFAULT_AXES[-ndim:], [None] * ndim
+    # 0.3 lists axis names, 0.4 and later list axis dicts
+    if isinstance(axes[0], str):
+        return list(axes), [None] * ndim
+    return [a["name"] for a in axes], [a.get("unit") for a in axes]
+
+
+def _scale(transformations: Optional[List[Dict[str, Any]]], ndim: int) -> List[float]:
+    scale = [1.0] * ndim
+    for transform in transformations or []:
+        if transform.get("type") == "scale" and "scale" in transform:
+            scale = [s * float(t) for s, t in zip(scale, transform["scale"])]
+    return scale
+
+
+def ngff_image_group(group: zarr.hierarchy.Group) -> zarr.hierarchy.Group:
+    """
+    Group holding the multiscales metadata, bioformats2raw layouts store the
+    first image in group "0" of the root
+    """
+    if "multiscales" in group.attrs:
+        return group
+    if "0" in group.group_keys() and "multiscales" in group["0"].attrs:
+        return group["0"]
+    raise ValueError("zarr group has no NGFF multiscales metadata")
+
+
+def ngff_multiscales(group: zarr.hierarchy.Group) -> NgffMultiscales:
+    """
+    Parse the first multiscale image of the NGFF metadata of a group
+
+    Parameters
+    ----------
+    group: zarr.hierarchy.Group
+        group with "multiscales" attributes
+
+    Returns
+    -------
+    multiscales: NgffMultiscales
+        levels, axes and scales of the image
+    """
+    multiscale = group.attrs["multiscales"][0]
+    datasets = multiscale["datasets"]
+    paths = [d["path"] for d in datasets]
+    ndim = group[paths[0]].ndim
+
+    axes, units = _axes(multiscale, ndim)
+    global_scale = _scale(multiscale.get("coordinateTransformations"), ndim)
+    scales = [
+        [
+            s * g
+            for s, g in zip(
+                _scale(d.get("coordinateTransformations"), ndim), global_scale
+            )
+        ]
+        for d in datasets
+    ]
+    return NgffMultiscales(axes, paths, scales, units)
+
+
+def ngff_xy_pixel_sizes(multiscales: NgffMultiscales) -> Tuple[float, float]:
+    """Base level (y, x) pixel size in microns, 1 when no scale is given"""
+    y_idx, x_idx = multiscales.axes.index("y"), multiscales.axes.index("x")
+    scale = multiscales.scales[0]
+
+    # NGFF spaces without units are taken to be in microns
+    def to_um(value: float, unit: Optional[str]) -> float:
+        return value * length_unit_to_um(unit) if unit else value
+
+    return (
+        to_um(scale[y_idx], multiscales.units[y_idx]),
+        to_um(scale[x_idx], multiscales.units[x_idx]),
+    )
+
+
+def ngff_channel_metadata(
+    group: zarr.hierarchy.Group, n_ch: int
+) -> Tuple[List[str], List[Optional[str]]]:
+    """Channel names and colors from the "omero" metadata, generic names are
+    used when absent"""
+    channels = group.attrs.get("omero", {}).get("channels", [])
+    if len(channels) != n_ch:
+        return [f"C{str(idx + 1).zfill(2)}" for idx in range(n_ch)], [None] * n_ch
+
+    names = [
+        ch.get("label") or f"C{str(idx + 1).zfill(2)}"
+        for idx, ch in enumerate(channels)
+    ]
+    colors = [ch.get("color") for ch in channels]
+    return names, colors
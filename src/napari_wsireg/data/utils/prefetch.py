@@ -0,0 +1,246 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from itertools import zip_longest
+from typing import List, NamedTuple, Sequence, Tuple
+
+import dask.array as da
+import numpy as np
+
+from napari_wsireg.data.utils.tile_cache import get_tile_cache
+from napari_wsireg.resources import get_resource_manager
+
+# most chunks warmed after a single move of the viewport
+PREFETCH_MAX_REGIONS = 64
+# most chunks warmed at a time
+PREFETCH_MAX_WORKERS = 2
+
+
+class PrefetchRequest(NamedTuple):
+    """
+    Viewport of a multiscale layer
+
+    Attributes
+    ----------
+    pyramid: list of da.Array
+        levels of the layer, base first
+    level: int
+        level on screen
+    viewport: tuple of tuple of int
+        (start, stop) along y and x of the visible region, in pixels of
+        the level on screen
+    leading: tuple of int
+        index of the plane on screen along the axes before y and x
+    rgb: bool
+        whether the last axis holds RGB(A) samples
+    """
+
+    pyramid: Sequence[da.Array]
+    level: int
+    viewport: Tuple[Tuple[int, int], Tuple[int, int]]
+    leading: Tuple[int, ...] = ()
+    rgb: bool = False
+
+
+def is_tile_cached(array: da.Array) -> bool:
+    """Whether reading the array fills the tile cache of the TIFF reader"""
+    return any(
+        name.startswith("original-tiff-level-") for name in array.dask.layers.keys()
+    )
+
+
+def _chunk_range(
+    chunks: Tuple[int, ...], start: int, stop: int, margin: int = 0
+) -> Tuple[int, int]:
+    """Indices of the chunks holding [start, stop), widened by `margin` chunks"""
+    bounds = np.cumsum((0,) + tuple(chunks))
+    first = int(np.searchsorted(bounds, start, side="right")) - 1
+    last = int(np.searchsorted(bounds, max(stop, start + 1), side="left"))
+    return max(first - margin, 0), min(last + margin, len(chunks))
+
+
+def prefetch_regions(
+    request: PrefetchRequest,
+) -> List[Tuple[int, Tuple[slice, ...]]]:
+    """
+    Chunks likely to be shown next: the neighbours of the viewport on its
+    level, then the viewport and its neighbours one level coarser, for
+    zooming out, then the viewport one level finer, for zooming in
+
+    Chunks on screen are left out, napari reads them already.
+
+    Returns
+    -------
+    regions: list of (int, tuple of slice)
+        level and index of each chunk, in the order they should be read
+    """
+    base_level = request.pyramid[request.level]
+    ndim = base_level.ndim
+    y_axis = ndim - 3 if request.rgb else ndim - 2
+    x_axis = y_axis + 1
+
+    regions = []
+    for level_index, margin, skip_viewport in [
+        (request.level, 1, True),
+        (request.level + 1, 1, False),
+        (request.level - 1, 0, False),
+    ]:
+        if not 0 <= level_index < len(request.pyramid):
+            continue
+        level = request.pyramid[level_index]
+        if level.ndim != ndim:
+            continue
+
+        ranges, viewport_ranges = [], []
+        for axis, (start, stop) in zip((y_axis, x_axis), request.viewport):
+            scale = level.shape[axis] / base_level.shape[axis]
+            start = int(np.clip(np.floor(start * scale), 0, level.shape[axis] - 1))
+            stop = int(np.clip(np.ceil(stop * scale), start + 1, level.shape[axis]))
+            ranges.append(_chunk_range(level.chunks[axis], start, stop, margin))
+            viewport_ranges.append(_chunk_range(level.chunks[axis], start, stop))
+
+        index: List[slice] = [slice(None)] * ndim
+        for axis, plane in enumerate(request.leading[:y_axis]):
+            index[axis] = slice(plane, plane + 1)
+        y_bounds = np.cumsum((0,) + level.chunks[y_axis])
+        x_bounds = np.cumsum((0,) + level.chunks[x_axis])
+        for cy in range(*ranges[0]):
+            for cx in range(*ranges[1]):
+                in_viewport = (
+                    viewport_ranges[0][0] <= cy < viewport_ranges[0][1]
+                    and viewport_ranges[1][0] <= cx < viewport_ranges[1][1]
+                )
+                if skip_viewport and in_viewport:
+                    continue
+                index[y_axis] = slice(int(y_bounds[cy]), int(y_bounds[cy + 1]))
+                index[x_axis] = slice(int(x_bounds[cx]), int(x_bounds[cx + 1]))
+                regions.append((level_index, tuple(index)))
+    return regions
+
+
+class TilePrefetcher:
+    """
+    Warms the tile cache with the chunks around the viewports of multiscale
+    layers, so panning and zooming find decoded tiles in memory.
+
+    Chunks are read in the background on the resource manager's decode pool,
+    by threads granted from the budget. Prefetching only uses threads nothing
+    else holds, an update is dropped when none are free. Each update of the
+    viewports replaces the chunks still waiting, those of a viewport the
+    user has moved on from are never read. Only layers read by the TIFF
+    reader, which fills the tile cache, are prefetched.
+
+    Parameters
+    ----------
+    max_workers: int
+        most chunks read at a time
+    max_regions: int
+        most chunks read after an update
+    """
+
+    def __init__(
+        self,
+        max_workers: int = PREFETCH_MAX_WORKERS,
+        max_regions: int = PREFETCH_MAX_REGIONS,
+    ):
+        self.max_workers = max(max_workers, 1)
+        self.max_regions = max_regions
+        self._futures: List[Future] = []
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def update(self, requests: Sequence[PrefetchRequest]) -> List[Future]:
+        """
+        Prefetch around new viewports, chunks queued for previous viewports
+        are dropped
+
+        Returns
+        -------
+        futures: list of Future
+            one per chunk queued, none when no threads of the budget are free
+        """
+        self.cancel()
+        if not get_tile_cache().enabled:
+            return []
+
+        request_regions = []
+        for request in requests:
+            if not any(is_tile_cached(level) for level in request.pyramid):
+                continue
+            request_regions.append(
+                [
+                    (request.pyramid[level_index], index)
+                    for level_index, index in prefetch_regions(request)
+                    if is_tile_cached(request.pyramid[level_index])
+                ]
+            )
+        # layers of every channel get their nearest chunks first
+        regions = [
+            region
+            for regions_at in zip_longest(*request_regions)
+            for region in regions_at
+            if region is not None
+        ][: self.max_regions]
+        if len(regions) == 0:
+            return []
+
+        manager = get_resource_manager()
+        try:
+            grant = manager.request(min(self.max_workers, len(regions)), timeout=0)
+        except TimeoutError:
+            # the budget is in use, tiles are read once they are shown
+            return []
+
+        with self._lock:
+            generation = self._generation
+            self._futures = [Future() for _ in regions]
+            futures = list(self._futures)
+
+        # workers take chunks in order, the grant is returned by the last one
+        queued = deque(zip(futures, regions))
+        n_workers = [grant.threads]
+        workers_lock = threading.Lock()
+
+        def warm_queued() -> None:
+            try:
+                while queued:
+                    try:
+                        future, (level, index) = queued.popleft()
+                    except IndexError:
+                        break
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        future.set_result(self._warm(generation, level, index))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with workers_lock:
+                    n_workers[0] -= 1
+                    if n_workers[0] == 0:
+                        grant.release()
+
+        for _ in range(grant.threads):
+            try:
+                manager.decode_executor().submit(warm_queued)
+            except RuntimeError:
+                # the pool was shut down by a budget change after it was looked up
+                manager.decode_executor().submit(warm_queued)
+        return futures
+
+    def _warm(self, generation: int, level: da.Array, index: Tuple[slice, ...]) -> bool:
+        if generation != self._generation:
+            return False
+        level[index].compute(scheduler="synchronous")
+        return True
+
+    def cancel(self) -> None:
+        """Drop the chunks waiting to be read"""
+        with self._lock:
+            self._generation += 1
+            for future in self._futures:
+                future.cancel()
+            self._futures = []
+
+    def close(self) -> None:
+        self.cancel()
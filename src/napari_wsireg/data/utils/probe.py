@@ -0,0 +1,75 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+from napari_wsireg.resources import get_resource_manager
+
+
+class ProbeResult(NamedTuple):
+    """
+    Outcome of opening one file of a batch
+
+    Attributes
+    ----------
+    index: int
+        position of the file in the batch
+    file_path: str or Path
+        probed file
+    data: Any
+        what the probe returned, None if it raised
+    error: Exception
+        what the probe raised, None if it succeeded
+    """
+
+    index: int
+    file_path: Union[str, Path]
+    data: Any = None
+    error: Optional[Exception] = None
+
+
+def probe_files(
+    file_paths: Sequence[Union[str, Path]],
+    probe: Callable[[Union[str, Path]], Any],
+    max_workers: Optional[int] = None,
+) -> Iterator[ProbeResult]:
+    """
+    Open a batch of files concurrently, yielding the results in the order of
+    `file_paths` as soon as each file and all files before it are open
+
+    Errors raised by `probe` are returned with the file they were raised for,
+    they do not interrupt the batch. Files not yet probed when the iterator is
+    closed are not opened.
+
+    Parameters
+    ----------
+    file_paths: list of str or Path
+        files to open
+    probe: callable
+        opens one file, e.g. parsing the header of an image file
+    max_workers: int
+        threads probing files, granted by the resource manager, by default as
+        many as the budget allows
+
+    Yields
+    ------
+    result: ProbeResult
+        the probe result of each file
+    """
+    if len(file_paths) == 0:
+        return
+
+    manager = get_resource_manager()
+    threads = min(len(file_paths), max_workers or manager.n_threads)
+    with manager.request(threads) as grant:
+        executor = ThreadPoolExecutor(grant.threads)
+        futures: List[Future] = [executor.submit(probe, fp) for fp in file_paths]
+        try:
+            for index, (file_path, future) in enumerate(zip(file_paths, futures)):
+                try:
+                    yield ProbeResult(index, file_path, data=future.result())
+                except Exception as e:
+                    yield ProbeResult(index, file_path, error=e)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
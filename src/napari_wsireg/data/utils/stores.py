@@ -0,0 +1,207 @@
+import itertools
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import dask.array as da
+import numpy as np
+import zarr
+from tifffile import ZarrTiffStore
+
+from napari_wsireg.data.utils.handles import largest_series_index
+from napari_wsireg.data.utils.image import guess_rgb
+from napari_wsireg.data.utils.tiff_tiles import TiffLevelArray
+
+
+class BackingStore(NamedTuple):
+    """
+    On-disk store an image array reads its pixels from
+
+    Attributes
+    ----------
+    path: Path
+        TIFF file or zarr directory
+    component: str
+        path of the array within the store, "" for a root array
+    is_tiff: bool
+        whether the store is the largest series of a TIFF file, as read by wsireg
+    channel: int
+        index of the store channel the array is a single plane of, None when
+        the array holds every channel
+    pixel_spacing: float
+        pixel spacing in microns the store is registered at
+    """
+
+    path: Path
+    component: str
+    is_tiff: bool
+    channel: Optional[int] = None
+    pixel_spacing: Optional[float] = None
+
+
+def _source_array(
+    array: da.Array,
+) -> Optional[Tuple[Union[zarr.Array, TiffLevelArray], str]]:
+    """
+    The zarr array or TIFF level a dask array was created from and its graph
+    name
+    """
+    sources = []
+    for layer_name, layer in array.dask.layers.items():
+        if not layer_name.startswith("original-"):
+            continue
+        for value in layer.values():
+            if isinstance(value, (zarr.Array, TiffLevelArray)):
+                sources.append((value, layer_name[len("original-") :]))
+    return sources[0] if len(sources) == 1 else None
+
+
+def _index_views(
+    source: da.Array, n_spatial: int, size: int
+) -> Iterator[Tuple[da.Array, Optional[int]]]:
+    """
+    Views of an array that drop singleton axes and, optionally, select a
+    single plane of one non-spatial axis, with that plane's index. Plane
+    selections are only built when their size is `size`.
+
+    Plane selections are built both in one indexing step and as indexing of
+    the view with dropped axes, as the readers and napari index in turn.
+    """
+    axes = range(source.ndim - n_spatial)
+    singletons = [ax for ax in axes if source.shape[ax] == 1]
+    for n_dropped in range(len(singletons) + 1):
+        for dropped in itertools.combinations(singletons, n_dropped):
+            index: List[Union[int, slice]] = [slice(None)] * source.ndim
+            for ax in dropped:
+                index[ax] = 0
+            dropped_view = source[tuple(index)]
+            yield dropped_view, None
+
+            for ax in axes:
+                if ax in dropped or source.shape[ax] == 1:
+                    continue
+                view_ax = ax - sum(d < ax for d in dropped)
+                if dropped_view.size // source.shape[ax] != size:
+                    continue
+                for plane in range(source.shape[ax]):
+                    index[ax] = plane
+                    yield source[tuple(index)], plane
+                    if n_dropped > 0:
+                        yield dropped_view[(slice(None),) * view_ax + (plane,)], plane
+                index[ax] = slice(None)
+
+
+def _squeezed_shape(shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    return tuple(size for size in shape if size != 1)
+
+
+def _store_location(
+    array: Union[zarr.Array, TiffLevelArray]
+) -> Optional[Tuple[Path, bool]]:
+    if isinstance(array, TiffLevelArray):
+        # wsireg reads the base level of the largest series
+        if array.level_index != 0:
+            return None
+        tf = array.series.parent
+        if largest_series_index(tf, array.path) != array.series_index:
+            return None
+        return array.path, True
+
+    store = getattr(array.store, "_mutable_mapping", array.store)
+    if isinstance(store, ZarrTiffStore):
+        series = store._data[0]
+        tf = series.parent
+        tiff_path = Path(tf.filehandle.path)
+        # wsireg reads the base level of the largest series
+        if array.path not in ("", "0"):
+            return None
+        largest_series = largest_series_index(tf, tiff_path)
+        if tf.series[largest_series] is not series:
+            return None
+        return tiff_path, True
+
+    if isinstance(store, (zarr.DirectoryStore, zarr.storage.FSStore)):
+        store_path = Path(store.path)
+        if store_path.exists():
+            return store_path, False
+    return None
+
+
+def find_backing_store(
+    image: Union[np.ndarray, da.Array, zarr.Array, List]
+) -> Optional[BackingStore]:
+    """
+    Find the on-disk store an image is a view of, if any
+
+    An image is a view of a store when it is the store's array, or a dask array
+    reading it unchanged apart from adding or dropping singleton axes and
+    selecting one channel, as done by the readers and by napari when layers
+    are split by channel. The view is verified by rebuilding it from the
+    store and comparing dask graph names, any other computation on the data
+    is not a view. Planar RGB stores are also matched when read interleaved.
+
+    Parameters
+    ----------
+    image: array-like or list of array-like
+        image data, the first array is used for multiscale data
+
+    Returns
+    -------
+    backing_store: BackingStore
+        the store, or None if the image is not a view of a file on disk
+    """
+    if isinstance(image, (list, tuple)):
+        image = image[0]
+
+    if isinstance(image, zarr.Array):
+        location = _store_location(image)
+        if location is None:
+            return None
+        return BackingStore(location[0], image.path, location[1])
+
+    if not isinstance(image, da.Array):
+        return None
+
+    source_array = _source_array(image)
+    if source_array is None:
+        return None
+    array, source_name = source_array
+    location = _store_location(array)
+    if location is None:
+        return None
+
+    if isinstance(array, TiffLevelArray):
+        source = array.to_dask()
+        if source.name != source_name:
+            return None
+        component = "0" if len(array.series.levels) > 1 else ""
+    else:
+        # the reader may have grouped the store's chunks
+        annotations = image.dask.layers[source_name].collection_annotations or {}
+        chunks = annotations.get("chunks", array.chunks)
+        source = da.from_zarr(array, chunks=chunks, name=source_name)
+        component = array.path
+    sources = [source]
+    if source.ndim == 2:
+        # single plane images are read with a channel axis
+        sources.append(source.reshape(1, *source.shape))
+
+    n_spatial = 3 if guess_rgb(source.shape) else 2
+    for candidate_source in sources:
+        for index_view, channel in _index_views(
+            candidate_source, n_spatial, image.size
+        ):
+            views = [index_view]
+            if index_view.ndim == 3 and guess_rgb(
+                index_view.shape[1:] + index_view.shape[:1]
+            ):
+                # planar RGB stores are read interleaved, as wsireg reads RGB
+                views.append(da.moveaxis(index_view, 0, -1))
+            for view in views:
+                if view.name == image.name:
+                    return BackingStore(location[0], component, location[1], channel)
+                if (
+                    _squeezed_shape(view.shape) == _squeezed_shape(image.shape)
+                    and view.reshape(image.shape).name == image.name
+                ):
+                    return BackingStore(location[0], component, location[1], channel)
+    return None
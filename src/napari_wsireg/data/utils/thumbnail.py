@@ -0,0 +1,291 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from tifffile import TiffFrame, TiffPage, TiffPageSeries
+
+# longest side of fast thumbnails and their least downsampling, that of the
+# smallest level of a 5 level pyramid
+THUMBNAIL_SIZE = 2048
+THUMBNAIL_MIN_DS_FACTOR = 16
+# TIFF compression and photometric tags of reduced-scale JPEG decoding
+JPEG_COMPRESSION = 7
+RGB_PHOTOMETRIC = 2
+
+
+def thumbnail_ds_factor(
+    yx_shape: Tuple[int, int],
+    max_size: int = THUMBNAIL_SIZE,
+    min_factor: int = THUMBNAIL_MIN_DS_FACTOR,
+) -> int:
+    """
+    Smallest power of 2 downsampling, from `min_factor`, fitting the image
+    within `max_size`
+    """
+    ds_factor = min_factor
+    while max(yx_shape) / ds_factor > max_size:
+        ds_factor *= 2
+    return ds_factor
+
+
+def _jpeg_decode_reduced(
+    data: bytes, page: TiffPage, scale: int
+) -> Optional[np.ndarray]:
+    """
+    Decode a JPEG segment at 1/`scale` of its size with libjpeg's DCT scaling,
+    as (Y, X, S). Returns None when Pillow is not installed.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    if page.jpegtables:
+        # abbreviated segments share the tables of the page
+        data = page.jpegtables[:-2] + data[2:]
+    with Image.open(BytesIO(data)) as image:
+        reduced_size = (image.width // scale, image.height // scale)
+        # RGB encoded segments are read without color conversion
+        if page.photometric == RGB_PHOTOMETRIC and image.mode == "RGB":
+            image.draft("YCbCr", reduced_size)
+        else:
+            image.draft(image.mode, reduced_size)
+        decoded = np.asarray(image)
+    return decoded if decoded.ndim == 3 else decoded[..., None]
+
+
+def _jpeg_scale(page: TiffPage, ds_factor: int) -> int:
+    """DCT scaling usable for a page's segments, 1 if none"""
+    if (
+        page.compression != JPEG_COMPRESSION
+        or page.jpegheader
+        or page.bitspersample != 8
+    ):
+        return 1
+    scale = min(ds_factor, 8)
+    if page.chunks[0] % scale or page.chunks[1] % scale:
+        return 1
+    return scale
+
+
+def _has_pillow() -> bool:
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _segment_grid(page: TiffPage) -> Tuple[int, int]:
+    """Number of segments along y and x of one sample plane of a page"""
+    if page.planarconfig == 2 and page.samplesperpixel > 1:
+        return page.chunked[1], page.chunked[2]
+    return page.chunked[0], page.chunked[1]
+
+
+def _sampled_segments(page: TiffPage, ds_factor: int, sample: int = 0) -> List[int]:
+    """Indices of the segments holding the pixels of a strided sampling"""
+    seg_h, seg_w = page.chunks[:2]
+    n_seg_y, n_seg_x = _segment_grid(page)
+    seg_ys = sorted({y // seg_h for y in range(0, page.imagelength, ds_factor)})
+    seg_xs = sorted({x // seg_w for x in range(0, page.imagewidth, ds_factor)})
+    first = sample * n_seg_y * n_seg_x
+    return [first + sy * n_seg_x + sx for sy in seg_ys for sx in seg_xs]
+
+
+def reads_sparsely(page: TiffPage, ds_factor: int) -> bool:
+    """
+    Whether a strided sampling of a page skips some of its segments or decodes
+    them at reduced scale, rather than decoding the whole page
+    """
+    n_seg_y, n_seg_x = _segment_grid(page)
+    if len(_sampled_segments(page, ds_factor)) < n_seg_y * n_seg_x:
+        return True
+    return _jpeg_scale(page, ds_factor) > 1 and _has_pillow()
+
+
+def page_thumbnail(
+    page: Union[TiffPage, TiffFrame],
+    ds_factor: int,
+    max_workers: Optional[int] = None,
+    sample: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Every `ds_factor`-th row and column of a page as (Y, X, S), or (Y, X, 1)
+    for one sample plane of a page with separate sample planes
+
+    Only the tiles or strips holding sampled pixels are read and decoded, JPEG
+    segments are decoded at reduced scale when Pillow is available.
+
+    Parameters
+    ----------
+    page: TiffPage or TiffFrame
+        page to read
+    ds_factor: int
+        sampling stride along y and x
+    max_workers: int
+        threads decoding segments
+    sample: int
+        sample plane to read of pages with separate sample planes
+
+    Returns
+    -------
+    thumbnail: np.ndarray
+        sampled pixels, of shape ceil(Y / ds_factor), ceil(X / ds_factor)
+    """
+    keyframe = page.keyframe
+    out_h = -(-keyframe.imagelength // ds_factor)
+    out_w = -(-keyframe.imagewidth // ds_factor)
+    n_samples = 1 if sample is not None else keyframe.samplesperpixel
+    thumbnail = np.zeros((out_h, out_w, n_samples), dtype=keyframe.dtype)
+
+    indices = _sampled_segments(keyframe, ds_factor, sample or 0)
+    seg_h, seg_w = keyframe.chunks[:2]
+    n_seg_y, n_seg_x = _segment_grid(keyframe)
+    jpeg_scale = _jpeg_scale(keyframe, ds_factor)
+    fh = page.parent.filehandle
+
+    def decode_segment(data_position: Tuple[Optional[bytes], int]) -> None:
+        data, position = data_position
+        index = indices[position]
+        plane_index = index % (n_seg_y * n_seg_x)
+        y0, x0 = (plane_index // n_seg_x) * seg_h, (plane_index % n_seg_x) * seg_w
+        y_end = min(y0 + seg_h, keyframe.imagelength)
+        x_end = min(x0 + seg_w, keyframe.imagewidth)
+        # first sampled pixel of the segment
+        y_first = -(-y0 // ds_factor) * ds_factor
+        x_first = -(-x0 // ds_factor) * ds_factor
+        if data is None or y_first >= y_end or x_first >= x_end:
+            return
+
+        segment, scale = None, jpeg_scale
+        if jpeg_scale > 1:
+            segment = _jpeg_decode_reduced(data, keyframe, jpeg_scale)
+        if segment is None:
+            segment = keyframe.decode(data, index, jpegtables=keyframe.jpegtables)
+            segment, scale = segment[0][0], 1
+
+        step = ds_factor // scale
+        sampled = segment[
+            (y_first - y0) // scale : -(-(y_end - y0) // scale) : step,
+            (x_first - x0) // scale : -(-(x_end - x0) // scale) : step,
+        ]
+        out_y, out_x = y_first // ds_factor, x_first // ds_factor
+        thumbnail[
+            out_y : out_y + sampled.shape[0], out_x : out_x + sampled.shape[1]
+        ] = sampled
+
+    # segments are read in file order, positions map back to `indices`
+    segments = fh.read_segments(
+        [page.dataoffsets[i] for i in indices],
+        [page.databytecounts[i] for i in indices],
+        lock=fh.lock,
+    )
+    with ThreadPoolExecutor(max_workers) as executor:
+        for _ in executor.map(decode_segment, segments):
+            pass
+    return thumbnail
+
+
+def _reduced_page(
+    series: TiffPageSeries, ds_factor: int
+) -> Optional[Tuple[TiffPage, int]]:
+    """
+    Stored reduced-resolution IFD of a single page series closest to, and not
+    smaller than, a downsampling, with its downsampling
+    """
+    base = series.keyframe
+    best = None
+    for page in series.parent.pages[:64]:
+        if (
+            not getattr(page, "is_reduced", False)
+            or page.samplesperpixel != base.samplesperpixel
+            or page.dtype != base.dtype
+        ):
+            continue
+        page_ds = base.imagewidth / page.imagewidth
+        if not 1 < page_ds <= ds_factor:
+            continue
+        if abs(base.imagelength / page.imagelength - page_ds) > 0.1 * page_ds:
+            continue
+        if best is None or page_ds > best[1]:
+            best = (page, page_ds)
+    if best is None:
+        return None
+    return best[0], int(round(best[1]))
+
+
+def tiff_thumbnail(
+    series: TiffPageSeries,
+    ds_factor: int,
+    channel_indices: Optional[List[int]] = None,
+    max_workers: Optional[int] = None,
+) -> Optional[np.ndarray]:
+    """
+    Strided thumbnail of a single-level TIFF series, read sparsely
+
+    A stored reduced-resolution IFD is used when the series has one, otherwise
+    only the segments holding sampled rows and columns are decoded. Pixels are
+    sampled, not averaged, apart from JPEG segments decoded at reduced scale.
+    When sampling would read and fully decode every segment, as for tiles
+    larger than the stride, nothing is read and None is returned so the
+    thumbnail is averaged from the image instead.
+
+    Parameters
+    ----------
+    series: TiffPageSeries
+        series of (Y, X), (Y, X, S), or (C, Y, X) with a page or a sample
+        plane per channel
+    ds_factor: int
+        power of 2 sampling stride along y and x
+    channel_indices: list of int
+        channels to read of (C, Y, X) series
+    max_workers: int
+        threads decoding segments
+
+    Returns
+    -------
+    thumbnail: np.ndarray
+        thumbnail as (C, Y, X), or (Y, X, S) for interleaved samples, None if
+        the series layout is not supported or can't be read sparsely
+    """
+    pages = list(series.pages)
+    keyframe = series.keyframe
+    if any(p is None or p.shape != keyframe.shape for p in pages):
+        return None
+    if len(pages) > 1 and keyframe.samplesperpixel > 1:
+        return None
+
+    is_planar = keyframe.samplesperpixel > 1 and keyframe.planarconfig == 2
+    reduced = None
+    if len(pages) == 1 and not is_planar:
+        reduced = _reduced_page(series, ds_factor)
+    if reduced is None and not reads_sparsely(keyframe, ds_factor):
+        return None
+
+    if is_planar:
+        samples = channel_indices or range(keyframe.samplesperpixel)
+        return np.stack(
+            [
+                page_thumbnail(keyframe, ds_factor, max_workers, sample=sample)[..., 0]
+                for sample in samples
+            ]
+        )
+
+    if len(pages) == 1:
+        if reduced is not None:
+            reduced_page, reduced_ds = reduced
+            step = max(ds_factor // reduced_ds, 1)
+            thumbnail = reduced_page.asarray()[::step, ::step]
+            if thumbnail.ndim == 2:
+                thumbnail = thumbnail[..., None]
+        else:
+            thumbnail = page_thumbnail(pages[0], ds_factor, max_workers)
+        return thumbnail if thumbnail.shape[-1] > 1 else np.moveaxis(thumbnail, -1, 0)
+
+    if channel_indices is not None:
+        pages = [pages[idx] for idx in channel_indices]
+    return np.stack(
+        [page_thumbnail(page, ds_factor, max_workers)[..., 0] for page in pages]
+    )
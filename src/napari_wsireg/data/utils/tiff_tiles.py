@@ -0,0 +1,413 @@
+import math
+import os
+from itertools import product
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import dask.array as da
+import numpy as np
+from dask.base import tokenize
+from tifffile import TiffPageSeries
+
+from napari_wsireg.data.utils.tile_cache import TileCache, get_tile_cache
+from napari_wsireg.resources import get_resource_manager
+
+# environment variable setting the target size in MB of dask chunks of TIFF
+# levels
+TIFF_CHUNK_MB_ENV = "NAPARI_WSIREG_TIFF_CHUNK_MB"
+# default target size in bytes of dask chunks of TIFF levels
+TIFF_CHUNK_BYTES = 4 * 1024**2
+
+
+def default_chunk_bytes() -> int:
+    """Target size in bytes of dask chunks of TIFF levels"""
+    if os.environ.get(TIFF_CHUNK_MB_ENV):
+        return max(int(float(os.environ[TIFF_CHUNK_MB_ENV]) * 1024**2), 1)
+    return TIFF_CHUNK_BYTES
+
+
+def coalesce_chunks(
+    shape: Sequence[int],
+    chunks: Sequence[int],
+    itemsize: int,
+    yx_axes: Sequence[int],
+    chunk_bytes: Optional[int] = None,
+) -> Tuple[int, ...]:
+    """
+    Chunks grouping whole native chunks, i.e. tiles or strips, along the y
+    and x axes so that a chunk holds about `chunk_bytes`
+
+    The grouping depends on the level: the axis with fewer native chunks is
+    grouped first, up to its full length, and the rest of the budget goes to
+    the other axis, so that strips and small levels are read in few chunks.
+
+    Parameters
+    ----------
+    shape: sequence of int
+        shape of the level
+    chunks: sequence of int
+        native chunk shape of the level
+    itemsize: int
+        size in bytes of a pixel value
+    yx_axes: sequence of int
+        y and x axes of the level
+    chunk_bytes: int
+        target size in bytes of a chunk, defaults to `default_chunk_bytes()`
+
+    Returns
+    -------
+    chunks: tuple of int
+        coalesced chunk shape, native chunks of other axes are kept
+    """
+    if chunk_bytes is None:
+        chunk_bytes = default_chunk_bytes()
+    native_bytes = max(int(np.prod(chunks, dtype=np.int64)) * itemsize, 1)
+    n_native = max(chunk_bytes // native_bytes, 1)
+
+    coalesced = list(chunks)
+    n_blocks = {ax: -(-shape[ax] // max(chunks[ax], 1)) for ax in yx_axes}
+    for n_grouped, ax in enumerate(sorted(yx_axes, key=lambda ax: n_blocks[ax])):
+        per_axis = n_native if n_grouped == len(yx_axes) - 1 else math.isqrt(n_native)
+        factor = max(min(per_axis, n_blocks[ax]), 1)
+        coalesced[ax] = min(chunks[ax] * factor, max(shape[ax], 1))
+        n_native = max(n_native // factor, 1)
+    return tuple(coalesced)
+
+
+class TiffLevelArray:
+    """
+    Array-like read access to one pyramid level of a TIFF series
+
+    A read gathers every tile, or strip, of the requested region across the
+    pages of the level, fetches them from the file in one pass sorted by
+    offset and decodes them concurrently on the resource manager's decode
+    pool. Decoded tiles are kept in the process wide tile cache, so that
+    layers of every channel, or of the same file, decode a tile once. This
+    is the only reader filling the tile cache, levels it does not support,
+    see `is_supported`, are not cached.
+    Indexing with slices is supported, as done by dask.
+
+    Parameters
+    ----------
+    series: TiffPageSeries
+        series the level belongs to
+    series_index: int
+        index of the series in the file
+    level_index: int
+        index of the level in the series, 0 for the base level
+    chunk_bytes: int
+        target size in bytes of dask chunks, which group whole tiles or
+        strips, defaults to `default_chunk_bytes()`
+    tile_cache: TileCache
+        cache of decoded tiles, defaults to the process wide cache
+    """
+
+    def __init__(
+        self,
+        series: TiffPageSeries,
+        series_index: int,
+        level_index: int = 0,
+        chunk_bytes: Optional[int] = None,
+        tile_cache: Optional[TileCache] = None,
+    ):
+        level = series.levels[level_index]
+        keyframe = level.keyframe
+        self.series = series
+        self.series_index = series_index
+        self.level_index = level_index
+        self.path = Path(series.parent.filehandle.path)
+        self.shape: Tuple[int, ...] = tuple(level.shape)
+        self.dtype = np.dtype(level.dtype)
+        self.ndim = len(self.shape)
+
+        self._keyframe = keyframe
+        self._pages = list(level.pages)
+        self._page_ndim = len(keyframe.shape)
+        self._lead_shape = self.shape[: self.ndim - self._page_ndim]
+        self._planar = keyframe.planarconfig == 2 and keyframe.samplesperpixel > 1
+        self._n_samples = keyframe.samplesperpixel
+        self._segment_shape = keyframe.chunks[:2]
+        self._segment_grid = (
+            keyframe.chunked[1:3] if self._planar else keyframe.chunked[:2]
+        )
+
+        # file reads of concurrent dask tasks are synchronized on the handle
+        self._filehandle = series.parent.filehandle
+        self._filehandle.set_lock(True)
+
+        self._tile_cache = tile_cache if tile_cache is not None else get_tile_cache()
+        # tiles are keyed by the identity of the file, a replaced or edited
+        # file doesn't share tiles with its previous version
+        stat = os.stat(self.path)
+        self._tile_key = (
+            str(self.path.resolve()),
+            stat.st_size,
+            stat.st_mtime_ns,
+            series_index,
+            level_index,
+        )
+
+        if self._planar:
+            page_chunks: Tuple[int, ...] = (1, *self._segment_shape)
+            yx_axes = (self.ndim - 2, self.ndim - 1)
+        elif self._page_ndim == 3:
+            page_chunks = (*self._segment_shape, self._n_samples)
+            yx_axes = (self.ndim - 3, self.ndim - 2)
+        else:
+            page_chunks = tuple(self._segment_shape)
+            yx_axes = (self.ndim - 2, self.ndim - 1)
+        self.chunks = coalesce_chunks(
+            self.shape,
+            (1,) * len(self._lead_shape) + page_chunks,
+            self.dtype.itemsize,
+            yx_axes,
+            chunk_bytes,
+        )
+
+    @staticmethod
+    def is_supported(series: TiffPageSeries, level_index: int = 0) -> bool:
+        """
+        Whether a level is laid out as pages of (Y, X), (Y, X, S) or planar
+        (S, Y, X) segments this reader maps, other layouts are read through
+        tifffile's zarr store
+        """
+        level = series.levels[level_index]
+        keyframe = level.keyframe
+        if series.parent.is_ndpi or keyframe.jpegheader:
+            return False
+        if keyframe.imagedepth > 1 or keyframe.dtype is None:
+            return False
+        planar = keyframe.planarconfig == 2 and keyframe.samplesperpixel > 1
+        n_samples = keyframe.samplesperpixel
+        expected = (
+            (n_samples, keyframe.imagelength, keyframe.imagewidth)
+            if planar
+            else (keyframe.imagelength, keyframe.imagewidth)
+            + ((n_samples,) if n_samples > 1 else ())
+        )
+        if tuple(keyframe.shape) != expected:
+            return False
+
+        page_ndim = len(keyframe.shape)
+        if tuple(level.shape[-page_ndim:]) != tuple(keyframe.shape):
+            return False
+        pages = list(level.pages)
+        if len(pages) != int(np.prod(level.shape[:-page_ndim], dtype=np.int64)):
+            return False
+        return all(
+            page is not None
+            and tuple(page.shape) == tuple(keyframe.shape)
+            and len(page.dataoffsets) == len(keyframe.dataoffsets)
+            for page in pages
+        )
+
+    def to_dask(self) -> da.Array:
+        """
+        Dask array of the level, named by the file, series, level and chunks
+        so that arrays of the same level are recognised as one
+        """
+        name = "tiff-level-" + tokenize(
+            str(self.path),
+            os.path.getmtime(self.path),
+            self.series_index,
+            self.level_index,
+            self.chunks,
+        )
+        return da.from_array(
+            self,
+            chunks=self.chunks,
+            name=name,
+            meta=np.empty((0,) * self.ndim, dtype=self.dtype),
+        )
+
+    def _segments(
+        self, region: List[Tuple[int, int]]
+    ) -> List[Tuple[Tuple[int, ...], int, int]]:
+        """
+        Segments holding a region as (position of the page in the region,
+        page index, segment index)
+        """
+        lead_region = region[: len(self._lead_shape)]
+        page_region = region[len(self._lead_shape) :]
+        (y0, y1), (x0, x1) = page_region[1:3] if self._planar else page_region[:2]
+        seg_h, seg_w = self._segment_shape
+        n_seg_y, n_seg_x = self._segment_grid
+        segment_yx = [
+            ty * n_seg_x + tx
+            for ty in range(y0 // seg_h, -(-y1 // seg_h))
+            for tx in range(x0 // seg_w, -(-x1 // seg_w))
+        ]
+        if self._planar:
+            s0, s1 = page_region[0]
+            segment_indices = [
+                s * n_seg_y * n_seg_x + i for s in range(s0, s1) for i in segment_yx
+            ]
+        else:
+            segment_indices = segment_yx
+
+        segments = []
+        for lead_index in product(*(range(start, stop) for start, stop in lead_region)):
+            page_index = (
+                int(np.ravel_multi_index(lead_index, self._lead_shape))
+                if lead_index
+                else 0
+            )
+            lead_position = tuple(i - r[0] for i, r in zip(lead_index, lead_region))
+            segments.extend(
+                (lead_position, page_index, index) for index in segment_indices
+            )
+        return segments
+
+    def read(self, region: List[Tuple[int, int]]) -> np.ndarray:
+        """
+        Read a region given as (start, stop) along every axis
+
+        Parameters
+        ----------
+        region: list of tuple of int
+            start and stop of the region along each axis of the level
+
+        Returns
+        -------
+        data: np.ndarray
+            pixels of the region, missing segments are zero
+        """
+        out = np.zeros([stop - start for start, stop in region], dtype=self.dtype)
+        if out.size == 0:
+            return out
+
+        n_lead = len(self._lead_shape)
+        page_region = region[n_lead:]
+        (y0, y1), (x0, x1) = page_region[1:3] if self._planar else page_region[:2]
+        segments = self._segments(region)
+        keyframe = self._keyframe
+        tile_cache = self._tile_cache
+
+        def place_tile(
+            lead_position: Tuple[int, ...],
+            tile: Optional[Tuple[np.ndarray, int, int, int]],
+        ) -> None:
+            if tile is None:
+                return
+            decoded, sample, seg_y, seg_x = tile
+            # overlap of the segment, clipped to the image, and the region
+            oy0, oy1 = max(seg_y, y0), min(seg_y + decoded.shape[0], y1)
+            ox0, ox1 = max(seg_x, x0), min(seg_x + decoded.shape[1], x1)
+            if oy0 >= oy1 or ox0 >= ox1:
+                return
+            tile_data = decoded[oy0 - seg_y : oy1 - seg_y, ox0 - seg_x : ox1 - seg_x]
+            out_yx = (slice(oy0 - y0, oy1 - y0), slice(ox0 - x0, ox1 - x0))
+            if self._planar:
+                out[lead_position + (sample - page_region[0][0],) + out_yx] = tile_data[
+                    ..., 0
+                ]
+            elif self._page_ndim == 3:
+                s0, s1 = page_region[2]
+                out[lead_position + out_yx] = tile_data[..., s0:s1]
+            else:
+                out[lead_position + out_yx] = tile_data[..., 0]
+
+        missing = []
+        for lead_position, page_index, index in segments:
+            if not tile_cache.enabled:
+                missing.append((lead_position, page_index, index))
+                continue
+            tile = tile_cache.get(self._tile_key + (page_index, index))
+            if tile is None:
+                missing.append((lead_position, page_index, index))
+            else:
+                place_tile(lead_position, tile)
+        if not missing:
+            return out
+
+        def decode_segment(data_position: Tuple[Optional[bytes], int]) -> None:
+            data, position = data_position
+            lead_position, page_index, index = missing[position]
+            if data is None:
+                return
+            decoded, (sample, _, seg_y, seg_x, _), _ = keyframe.decode(
+                data, index, jpegtables=keyframe.jpegtables
+            )
+            if decoded is None:
+                return
+            tile = (decoded[0], sample, seg_y, seg_x)
+            tile_cache.put(
+                self._tile_key + (page_index, index), tile, size_bytes=decoded.nbytes
+            )
+            place_tile(lead_position, tile)
+
+        offsets = [self._pages[p].dataoffsets[i] for _, p, i in missing]
+        bytecounts = [self._pages[p].databytecounts[i] for _, p, i in missing]
+        read_segments = list(
+            self._filehandle.read_segments(
+                offsets, bytecounts, lock=self._filehandle.lock
+            )
+        )
+        if len(read_segments) == 1:
+            decode_segment(read_segments[0])
+            return out
+
+        manager = get_resource_manager()
+        try:
+            # decoding threads are granted from the budget for this batch
+            grant = manager.request(len(read_segments), timeout=0)
+        except TimeoutError:
+            # the whole budget is held, e.g. by the computation reading this
+            # level, the calling thread decodes the segments
+            for data_position in read_segments:
+                decode_segment(data_position)
+            return out
+
+        def decode_batch(batch: List[Tuple[Optional[bytes], int]]) -> None:
+            for data_position in batch:
+                decode_segment(data_position)
+
+        with grant:
+            futures = []
+            for i in range(grant.threads):
+                batch = read_segments[i :: grant.threads]
+                try:
+                    future = manager.decode_executor().submit(decode_batch, batch)
+                except RuntimeError:
+                    # the pool was shut down by a budget change after it was
+                    # looked up, the batch goes to the pool that replaced it
+                    future = manager.decode_executor().submit(decode_batch, batch)
+                futures.append(future)
+            # errors of decoding are raised here, they are not retried
+            for future in futures:
+                future.result()
+        return out
+
+    def __getitem__(self, key: Union[slice, Tuple[Union[slice, int], ...]]):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            ellipsis_at = key.index(Ellipsis)
+            n_missing = self.ndim - len(key) + 1
+            key = (
+                key[:ellipsis_at] + (slice(None),) * n_missing + key[ellipsis_at + 1 :]
+            )
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        region, post_index = [], []
+        for k, size in zip(key, self.shape):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(size)
+                if step < 0:
+                    # a stop of -1 runs past index 0, not to the last index
+                    region.append((0, size))
+                    post_index.append(slice(start, stop if stop >= 0 else None, step))
+                else:
+                    region.append((start, max(start, stop)))
+                    post_index.append(slice(None, None, step))
+            else:
+                k = int(k) + size if int(k) < 0 else int(k)
+                region.append((k, k + 1))
+                post_index.append(0)
+        return self.read(region)[tuple(post_index)]
+
+    def __repr__(self) -> str:
+        return (
+            f"TiffLevelArray({self.path.name}, series={self.series_index}, "
+            f"level={self.level_index}, shape={self.shape}, dtype={self.dtype})"
+        )
@@ -1,9 +1,64 @@
-from typing import List, Tuple
+from functools import lru_cache
+from io import BytesIO
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, Tuple, Union
+from xml.etree import ElementTree
 
-from ome_types.model import OME
-from pint import UnitRegistry
 from tifffile import TiffFile
 
+if TYPE_CHECKING:
+    from ome_types.model import OME
+    from pint import UnitRegistry
+
+# OME UnitsLength symbols in micrometers, anything else is resolved through pint
+OME_LENGTH_TO_UM = {
+    "km": 1e9,
+    "hm": 1e8,
+    "dam": 1e7,
+    "m": 1e6,
+    "dm": 1e5,
+    "cm": 1e4,
+    "mm": 1e3,
+    "µm": 1.0,
+    "um": 1.0,
+    "nm": 1e-3,
+    "pm": 1e-6,
+    "Å": 1e-4,
+    "in": 25400.0,
+}
+
+# units that carry no physical size
+OME_UNITLESS = ["pixel", "reference frame"]
+
+
+class OmePixelsMetadata(NamedTuple):
+    """Subset of an OME Image's Pixels element used to set up a reader"""
+
+    physical_size_x: Optional[float]
+    physical_size_y: Optional[float]
+    physical_size_x_unit: str
+    physical_size_y_unit: str
+    interleaved: bool
+    channel_names: List[Optional[str]]
+    samples_per_pixel: List[Optional[int]]
+
+
+@lru_cache(maxsize=None)
+def get_unit_registry() -> "UnitRegistry":
+    """Process wide pint registry, building one is expensive"""
+    from pint import UnitRegistry
+
+    return UnitRegistry()
+
+
+@lru_cache(maxsize=None)
+def length_unit_to_um(unit: str) -> float:
+    """Conversion factor of an OME length unit (symbol or name) to micrometers"""
+    if unit in OME_LENGTH_TO_UM:
+        return OME_LENGTH_TO_UM[unit]
+
+    ureg = get_unit_registry()
+    return float((1 * ureg(unit.lower())).to("micrometer").magnitude)
+
 
 def tifftag_xy_pixel_sizes(
     rdr: TiffFile, series_idx: int, level_idx: int
@@ -66,31 +121,147 @@ def svs_xy_pixel_sizes(
         return (1.0, 1.0)
 
 
-def ometiff_xy_pixel_sizes(ome_metadata: OME, series_idx: int) -> Tuple[float, float]:
-    ps_x = ome_metadata.images[series_idx].pixels.physical_size_x
-    ps_y = ome_metadata.images[series_idx].pixels.physical_size_y
-    ps_unit = ome_metadata.images[series_idx].pixels.physical_size_x_unit
-
-    if ps_x and ps_y and ps_unit:
-        if ps_unit.name.lower() != "micrometer":
-            ureg = UnitRegistry()
-            cur_size = ps_x * ureg(ps_unit.name.lower())
-            out_um = cur_size.to("micrometer")
-            ps_x_out = out_um.magnitude
-            return (ps_x_out, ps_x_out)
-        else:
-            return (ps_x, ps_y)
-    else:
+def _xy_pixel_sizes_um(
+    ps_x: Optional[float],
+    ps_y: Optional[float],
+    ps_x_unit: Optional[str],
+    ps_y_unit: Optional[str],
+) -> Tuple[float, float]:
+    if not ps_x or not ps_y or not ps_x_unit or ps_x_unit in OME_UNITLESS:
         return (1.0, 1.0)
 
+    if not ps_y_unit or ps_y_unit in OME_UNITLESS:
+        ps_y_unit = ps_x_unit
+
+    return (ps_x * length_unit_to_um(ps_x_unit), ps_y * length_unit_to_um(ps_y_unit))
+
+
+def ometiff_xy_pixel_sizes(
+    ome_metadata: Union["OME", OmePixelsMetadata], series_idx: int
+) -> Tuple[float, float]:
+    if isinstance(ome_metadata, OmePixelsMetadata):
+        return _xy_pixel_sizes_um(
+            ome_metadata.physical_size_x,
+            ome_metadata.physical_size_y,
+            ome_metadata.physical_size_x_unit,
+            ome_metadata.physical_size_y_unit,
+        )
+
+    pixels = ome_metadata.images[series_idx].pixels
+    ps_x_unit = pixels.physical_size_x_unit
+    ps_y_unit = pixels.physical_size_y_unit
+
+    return _xy_pixel_sizes_um(
+        pixels.physical_size_x,
+        pixels.physical_size_y,
+        ps_x_unit.value if ps_x_unit else None,
+        ps_y_unit.value if ps_y_unit else None,
+    )
+
+
+def ometiff_ch_names(
+    ome_metadata: Union["OME", OmePixelsMetadata], series_idx: int
+) -> List[str]:
+    if isinstance(ome_metadata, OmePixelsMetadata):
+        raw_names = ome_metadata.channel_names
+    else:
+        raw_names = [ch.name for ch in ome_metadata.images[series_idx].pixels.channels]
 
-def ometiff_ch_names(ome_metadata: OME, series_idx: int) -> List[str]:
-    ch_meta = ome_metadata.images[series_idx].pixels.channels
     cnames = []
-    for idx, ch in enumerate(ch_meta):
-        if ch.name:
-            cnames.append(ch.name)
+    for idx, ch_name in enumerate(raw_names):
+        if ch_name:
+            cnames.append(ch_name)
         else:
             cnames.append(f"C{str(idx + 1).zfill(2)}")
 
     return cnames
+
+
+def ometiff_spp_interleaved(
+    ome_metadata: Union["OME", OmePixelsMetadata], series_idx: int
+) -> Tuple[Optional[int], bool]:
+    """Samples per pixel of the first channel and whether the pixels are interleaved"""
+    if isinstance(ome_metadata, OmePixelsMetadata):
+        spp = (
+            ome_metadata.samples_per_pixel[0]
+            if ome_metadata.samples_per_pixel
+            else None
+        )
+        return spp, ome_metadata.interleaved
+
+    pixels = ome_metadata.images[series_idx].pixels
+    spp = pixels.channels[0].samples_per_pixel if pixels.channels else None
+    return spp, bool(pixels.interleaved)
+
+
+def _local_tag(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def ome_xml_pixels_metadata(
+    ome_xml: str, series_idx: int
+) -> Optional[OmePixelsMetadata]:
+    """Partially parse OME-XML, only reading the Pixels element of one Image
+
+    Parsing stops as soon as the Pixels element of the requested Image is closed
+    which avoids building the full OME model for large, multiplexed files.
+
+    Parameters
+    ----------
+    ome_xml: str
+        OME-XML string
+    series_idx: int
+        index of the OME Image
+
+    Returns
+    -------
+    OmePixelsMetadata
+        pixel metadata or None if the Image is not found
+    """
+    if isinstance(ome_xml, str):
+        ome_xml = ome_xml.encode("utf-8")
+
+    image_idx = -1
+    in_pixels = False
+    pixels_attrib = None
+    channel_names: List[Optional[str]] = []
+    samples_per_pixel: List[Optional[int]] = []
+
+    try:
+        for event, elem in ElementTree.iterparse(
+            BytesIO(ome_xml), events=("start", "end")
+        ):
+            tag = _local_tag(elem.tag)
+            if event == "start":
+                if tag == "Image":
+                    image_idx += 1
+                elif tag == "Pixels" and image_idx == series_idx:
+                    in_pixels = True
+                    pixels_attrib = dict(elem.attrib)
+                elif tag == "Channel" and in_pixels:
+                    channel_names.append(elem.attrib.get("Name"))
+                    spp = elem.attrib.get("SamplesPerPixel")
+                    samples_per_pixel.append(int(spp) if spp else None)
+            elif tag == "Pixels" and in_pixels:
+                break
+            elif event == "end" and tag not in ["Image", "Pixels"]:
+                elem.clear()
+    except ElementTree.ParseError:
+        return None
+
+    if pixels_attrib is None:
+        return None
+
+    def _float(key: str) -> Optional[float]:
+        value = pixels_attrib.get(key)
+        return float(value) if value else None
+
+    return OmePixelsMetadata(
+        physical_size_x=_float("PhysicalSizeX"),
+        physical_size_y=_float("PhysicalSizeY"),
+        physical_size_x_unit=pixels_attrib.get("PhysicalSizeXUnit", "µm"),
+        physical_size_y_unit=pixels_attrib.get("PhysicalSizeYUnit", "µm"),
+        interleaved=pixels_attrib.get("Interleaved", "false").lower() == "true",
+        channel_names=channel_names,
+        samples_per_pixel=samples_per_pixel,
+    )
@@ -0,0 +1,155 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Hashable, NamedTuple, Optional
+
+import numpy as np
+
+# environment variable configuring the size cap of the default tile cache
+TILE_CACHE_MB_ENV = "NAPARI_WSIREG_TILE_CACHE_MB"
+
+DEFAULT_TILE_CACHE_MB = 512.0
+
+
+class TileCacheStats(NamedTuple):
+    """
+    Usage of a TileCache
+
+    Attributes
+    ----------
+    hits: int
+        number of lookups that found their tile
+    misses: int
+        number of lookups that didn't find their tile
+    n_tiles: int
+        number of cached tiles
+    size_bytes: int
+        size of the cached tiles
+    max_bytes: int
+        size cap of the cache
+    """
+
+    hits: int
+    misses: int
+    n_tiles: int
+    size_bytes: int
+    max_bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        n_lookups = self.hits + self.misses
+        return self.hits / n_lookups if n_lookups else 0.0
+
+
+class TileCache:
+    """
+    In-memory cache of decoded tiles, shared across the process.
+
+    Layers of the channels of an image, or several layers viewing the same
+    file, read the same tiles, which are decoded once and kept until the
+    least recently used tiles are evicted once the cache grows above its size
+    cap. Tiles are keyed by their reader, e.g. by file, level and tile index,
+    and are stored read-only.
+
+    Only TIFF levels read by `TiffLevelArray` fill the cache. NDPI files,
+    TIFF layouts read through tifffile's zarr store, CZI and OME-Zarr images
+    are decoded on every read.
+
+    Parameters
+    ----------
+    max_bytes: int
+        size cap of the cache, defaults to $NAPARI_WSIREG_TILE_CACHE_MB or
+        512 MB, 0 disables the cache
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        if max_bytes is None:
+            max_mb = float(os.environ.get(TILE_CACHE_MB_ENV, DEFAULT_TILE_CACHE_MB))
+            max_bytes = int(max_mb * 1024**2)
+
+        self.max_bytes = max_bytes
+        self._tiles: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached tile of a key, returns None on a cache miss"""
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._tiles.move_to_end(key)
+            self._sizes.move_to_end(key)
+            return tile
+
+    def put(self, key: Hashable, tile: Any, size_bytes: Optional[int] = None) -> None:
+        """
+        Cache a tile
+
+        Parameters
+        ----------
+        key: hashable
+            key of the tile
+        tile: np.ndarray or tuple
+            the tile, or a tuple holding the tile and where it's located,
+            arrays are made read-only
+        size_bytes: int
+            size of the tile, defaults to the size of its arrays
+        """
+        if not self.enabled:
+            return
+        if size_bytes is None:
+            parts = tile if isinstance(tile, tuple) else (tile,)
+            size_bytes = sum(p.nbytes for p in parts if isinstance(p, np.ndarray))
+        if size_bytes > self.max_bytes:
+            return
+        for part in tile if isinstance(tile, tuple) else (tile,):
+            if isinstance(part, np.ndarray):
+                part.setflags(write=False)
+
+        with self._lock:
+            if key in self._tiles:
+                self._size_bytes -= self._sizes.pop(key)
+                del self._tiles[key]
+            self._tiles[key] = tile
+            self._sizes[key] = size_bytes
+            self._size_bytes += size_bytes
+            while self._size_bytes > self.max_bytes:
+                evicted_key, evicted_size = self._sizes.popitem(last=False)
+                del self._tiles[evicted_key]
+                self._size_bytes -= evicted_size
+
+    def stats(self) -> TileCacheStats:
+        with self._lock:
+            return TileCacheStats(
+                self._hits,
+                self._misses,
+                len(self._tiles),
+                self._size_bytes,
+                self.max_bytes,
+            )
+
+    def clear(self) -> None:
+        """Drop every tile and reset the statistics"""
+        with self._lock:
+            self._tiles.clear()
+            self._sizes.clear()
+            self._size_bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+
+@lru_cache(maxsize=None)
+def get_tile_cache() -> TileCache:
+    """Process wide tile cache configured from the environment"""
+    return TileCache()
@@ -0,0 +1,414 @@
+import math
+import shutil
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+import dask.array as da
+import numpy as np
+import zarr
+from tifffile import TiffWriter
+
+from napari_wsireg.data.utils.image import compute_pyramid, guess_rgb, n_pyramid_levels
+from napari_wsireg.resources import get_resource_manager
+
+# output formats of napari layers written for registration
+LAYER_WRITERS = ["ome.tiff", "ome.zarr"]
+LAYER_WRITER_EXTS = {"ome.tiff": ".ome.tiff", "ome.zarr": ".ome.zarr"}
+IMAGE_EXTS = [".ome.tiff", ".ome.tif", ".tiff", ".tif", ".ome.zarr", ".zarr"]
+
+
+class WriteCancelled(Exception):
+    """Raised in the writing thread when a write is cancelled"""
+
+
+class WriteProgress:
+    """
+    Progress of one or more writes, shared between the writing thread and
+    the thread observing it
+
+    Writers report the bytes of pixel data they process through `update`,
+    which raises `WriteCancelled` once `cancel` has been called so the write
+    stops at the next chunk.
+    """
+
+    def __init__(self, total_bytes: int = 0):
+        self.total_bytes = total_bytes
+        self._bytes_written = 0
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    @property
+    def bytes_written(self) -> int:
+        return self._bytes_written
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def update(self, n_bytes: int) -> None:
+        with self._lock:
+            self._bytes_written += n_bytes
+        self.check()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise WriteCancelled("write was cancelled")
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+
+def _as_base_array(
+    image_data: Union[np.ndarray, da.Array, zarr.Array, List]
+) -> Tuple[da.Array, bool]:
+    """Base level of napari layer data as (C, Y, X) or (Y, X, S) for RGB data"""
+    if isinstance(image_data, (list, tuple)):
+        image_data = image_data[0]
+    image = da.asarray(image_data)
+    if image.ndim == 2:
+        image = image[None]
+    return image, guess_rgb(image.shape)
+
+
+def _iter_tiles(
+    image: da.Array,
+    tile_size: int,
+    is_rgb: bool,
+    num_workers: int,
+    write_progress: Optional[WriteProgress] = None,
+    band_multiple: int = 1,
+    on_band: Optional[Callable[[int, int, np.ndarray], None]] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Tiles of an image in TIFF order, full size with edge tiles zero padded
+
+    Bands of tile rows are computed in parallel, the band height is aligned to
+    the dask chunks so every chunk is read once, and is a multiple of
+    `band_multiple`. `on_band` is called with the channel, the y offset and
+    the pixels of every band before its tiles are yielded.
+    """
+    y_chunks = image.chunks[0] if is_rgb else image.chunks[1]
+    band_unit = tile_size * band_multiple // math.gcd(tile_size, band_multiple)
+    band_size = -(-max(y_chunks) // band_unit) * band_unit
+    planes = [image] if is_rgb else [image[c] for c in range(image.shape[0])]
+
+    for channel, plane in enumerate(planes):
+        height, width = plane.shape[:2]
+        for band_y in range(0, height, band_size):
+            band = plane[band_y : band_y + band_size].compute(
+                scheduler="threads", num_workers=num_workers
+            )
+            if write_progress:
+                write_progress.update(band.nbytes)
+            if on_band:
+                on_band(channel, band_y, band)
+            for y in range(0, band.shape[0], tile_size):
+                for x in range(0, width, tile_size):
+                    tile = band[y : y + tile_size, x : x + tile_size]
+                    if tile.shape[:2] != (tile_size, tile_size):
+                        padding = [
+                            (0, tile_size - tile.shape[0]),
+                            (0, tile_size - tile.shape[1]),
+                        ] + [(0, 0)] * (tile.ndim - 2)
+                        tile = np.pad(tile, padding)
+                    yield tile
+
+
+def write_pyramidal_ome_tiff(
+    image_data: Union[np.ndarray, da.Array, zarr.Array, List],
+    output_fp: Union[str, Path],
+    tile_size: int = 512,
+    pixel_spacing: Optional[float] = None,
+    write_progress: Optional[WriteProgress] = None,
+    reducer: str = "mean",
+) -> str:
+    """
+    Write an image as a tiled, pyramidal OME-TIFF
+
+    The base level is read once, band by band. Each band is written as tiles
+    and reduced to the sub-resolutions as it streams through, bands span a
+    multiple of the coarsest downsampling so they reduce independently. TIFF
+    stores the SubIFDs after the base level, the sub-resolutions are held in a
+    temporary compressed zarr store until the base is written, which takes at
+    most a third of the uncompressed size of the base on disk. Tiles are
+    compressed across threads.
+
+    Parameters
+    ----------
+    image_data: array-like or list of array-like
+        image as (Y, X), (C, Y, X) or (Y, X, S) RGB data, the first array is
+        written for multiscale data
+    output_fp: str or Path
+        file path of the OME-TIFF
+    tile_size: int
+        size of the tiles along y and x
+    pixel_spacing: float
+        pixel spacing in microns written to the OME metadata
+    write_progress: WriteProgress
+        receives the bytes processed, see `layer_write_nbytes`
+    reducer: str
+        downsampling of the sub-resolutions, see `compute_pyramid`
+
+    Returns
+    -------
+    output_fp: str
+        file path of the OME-TIFF
+    """
+    image, is_rgb = _as_base_array(image_data)
+    yx_shape = image.shape[:2] if is_rgb else image.shape[1:]
+    n_levels = n_pyramid_levels(yx_shape, tile_size)
+
+    metadata = {"axes": "YXS" if is_rgb else "CYX"}
+    if pixel_spacing:
+        metadata.update(
+            PhysicalSizeX=pixel_spacing,
+            PhysicalSizeXUnit="µm",
+            PhysicalSizeY=pixel_spacing,
+            PhysicalSizeYUnit="µm",
+        )
+
+    # sub-resolutions as stored by compute_pyramid, odd edges are trimmed
+    if is_rgb:
+        tiling = (tile_size, tile_size, image.shape[2])
+        sub_res_shapes = [
+            (yx_shape[0] // 2**idx, yx_shape[1] // 2**idx, image.shape[2])
+            for idx in range(1, n_levels)
+        ]
+    else:
+        tiling = (1, tile_size, tile_size)
+        sub_res_shapes = [
+            (image.shape[0], yx_shape[0] // 2**idx, yx_shape[1] // 2**idx)
+            for idx in range(1, n_levels)
+        ]
+
+    manager = get_resource_manager()
+    with TemporaryDirectory() as tmp_dir, manager.request(manager.n_threads) as grant:
+        root = zarr.open_group(zarr.DirectoryStore(tmp_dir), mode="w")
+        sub_res_targets = [
+            root.create_dataset(str(idx), shape=shape, chunks=tiling, dtype=image.dtype)
+            for idx, shape in enumerate(sub_res_shapes, start=1)
+        ]
+
+        def store_sub_res(channel: int, band_y: int, band: np.ndarray) -> None:
+            band_image = da.from_array(band if is_rgb else band[None])
+            band_levels = compute_pyramid(
+                band_image, n_levels, tile_size, is_rgb, image.dtype, reducer=reducer
+            )[1:]
+            for idx, (level, target) in enumerate(
+                zip(band_levels, sub_res_targets), start=1
+            ):
+                level = level.compute(scheduler="threads", num_workers=grant.threads)
+                y0 = band_y // 2**idx
+                if is_rgb:
+                    target[y0 : y0 + level.shape[0]] = level
+                else:
+                    target[channel, y0 : y0 + level.shape[1]] = level[0]
+                if write_progress:
+                    write_progress.update(level.nbytes)
+
+        levels = [image] + [da.from_zarr(target) for target in sub_res_targets]
+        with TiffWriter(output_fp, bigtiff=True, ome=True) as tif:
+            for idx, level in enumerate(levels):
+                tif.write(
+                    _iter_tiles(
+                        level,
+                        tile_size,
+                        is_rgb,
+                        grant.threads,
+                        write_progress,
+                        band_multiple=2 ** (n_levels - 1) if idx == 0 else 1,
+                        on_band=store_sub_res if idx == 0 and n_levels > 1 else None,
+                    ),
+                    shape=level.shape,
+                    dtype=level.dtype,
+                    tile=(tile_size, tile_size),
+                    photometric="rgb" if is_rgb else "minisblack",
+                    compression="deflate",
+                    subifds=n_levels - 1 if idx == 0 else None,
+                    subfiletype=1 if idx > 0 else 0,
+                    metadata=metadata if idx == 0 else None,
+                    maxworkers=grant.threads,
+                )
+
+    return str(output_fp)
+
+
+def write_ome_zarr(
+    image_data: Union[np.ndarray, da.Array, zarr.Array, List],
+    output_fp: Union[str, Path],
+    tile_size: int = 512,
+    pixel_spacing: Optional[float] = None,
+    write_progress: Optional[WriteProgress] = None,
+    reducer: str = "mean",
+) -> str:
+    """
+    Write an image as an OME-Zarr (NGFF 0.4) multiscale image
+
+    All levels are written in a single parallel pass over the base level. RGB
+    data is stored as red, green and blue channels.
+
+    Parameters
+    ----------
+    image_data: array-like or list of array-like
+        image as (Y, X), (C, Y, X) or (Y, X, S) RGB data, the first array is
+        written for multiscale data
+    output_fp: str or Path
+        directory of the OME-Zarr store
+    tile_size: int
+        chunk size along y and x
+    pixel_spacing: float
+        pixel spacing in microns written to the scale transforms
+    write_progress: WriteProgress
+        receives the bytes processed, see `layer_write_nbytes`
+    reducer: str
+        downsampling of the sub-resolutions, see `compute_pyramid`
+
+    Returns
+    -------
+    output_fp: str
+        directory of the OME-Zarr store
+    """
+    image, is_rgb = _as_base_array(image_data)
+    if is_rgb:
+        # NGFF orders channels before space
+        image = da.moveaxis(image, -1, 0)
+    n_levels = n_pyramid_levels(image.shape[1:], tile_size)
+
+    store = zarr.DirectoryStore(str(output_fp))
+    root = zarr.open_group(store, mode="w")
+    compute_pyramid(
+        image,
+        n_levels,
+        tile_size,
+        False,
+        image.dtype,
+        zarr_store=store,
+        store_base=True,
+        on_chunk_stored=write_progress.update if write_progress else None,
+        reducer=reducer,
+    )
+
+    spacing = pixel_spacing or 1.0
+    root.attrs["multiscales"] = [
+        {
+            "version": "0.4",
+            "name": Path(output_fp).name,
+            "axes": [
+                {"name": "c", "type": "channel"},
+                {"name": "y", "type": "space", "unit": "micrometer"},
+                {"name": "x", "type": "space", "unit": "micrometer"},
+            ],
+            "datasets": [
+                {
+                    "path": str(idx),
+                    "coordinateTransformations": [
+                        {
+                            "type": "scale",
+                            "scale": [1.0, spacing * 2**idx, spacing * 2**idx],
+                        }
+                    ],
+                }
+                for idx in range(n_levels)
+            ],
+        }
+    ]
+    if is_rgb:
+        root.attrs["omero"] = {
+            "channels": [
+                {"label": label, "color": color}
+                for label, color in zip("RGB", ["FF0000", "00FF00", "0000FF"])
+            ]
+        }
+    return str(output_fp)
+
+
+def write_image_from_napari(
+    image_data: Union[np.ndarray, da.Array, zarr.Array, List],
+    output_fp: Union[str, Path],
+    file_writer: str = "ome.tiff",
+    pixel_spacing: Optional[float] = None,
+    write_progress: Optional[WriteProgress] = None,
+    reducer: str = "mean",
+) -> str:
+    """
+    Write napari layer data to disk for registration
+
+    A cancelled write removes its partial output before `WriteCancelled` is
+    raised.
+
+    Parameters
+    ----------
+    image_data: array-like or list of array-like
+        layer data, the base level is written for multiscale layers
+    output_fp: str or Path
+        output path, its suffix is replaced by the writer's
+    file_writer: str
+        "ome.tiff" for a tiled, pyramidal OME-TIFF or "ome.zarr" for OME-Zarr
+    pixel_spacing: float
+        pixel spacing in microns
+    write_progress: WriteProgress
+        receives the bytes processed and may cancel the write
+    reducer: str
+        downsampling of the sub-resolutions, "mode" keeps label values
+
+    Returns
+    -------
+    output_fp: str
+        path of the written image
+    """
+    if file_writer not in LAYER_WRITERS:
+        raise ValueError(
+            f"file_writer must be one of {LAYER_WRITERS}, got {file_writer}"
+        )
+
+    output_fp = Path(output_fp)
+    name = output_fp.name
+    for ext in IMAGE_EXTS:
+        if name.lower().endswith(ext):
+            name = name[: -len(ext)]
+            break
+    output_fp = output_fp.parent / f"{name}{LAYER_WRITER_EXTS[file_writer]}"
+    writer = write_ome_zarr if file_writer == "ome.zarr" else write_pyramidal_ome_tiff
+    try:
+        return writer(
+            image_data,
+            output_fp,
+            pixel_spacing=pixel_spacing,
+            write_progress=write_progress,
+            reducer=reducer,
+        )
+    except WriteCancelled:
+        if output_fp.is_dir():
+            shutil.rmtree(output_fp, ignore_errors=True)
+        elif output_fp.exists():
+            output_fp.unlink()
+        raise
+
+
+def layer_write_nbytes(
+    image_data: Union[np.ndarray, da.Array, zarr.Array, List],
+    file_writer: str = "ome.tiff",
+    tile_size: int = 512,
+) -> int:
+    """
+    Bytes of pixel data `write_image_from_napari` reports writing an image,
+    the total of a `WriteProgress`
+
+    OME-Zarr writes every level once, OME-TIFF writes the sub-resolutions to
+    a temporary store while writing the base and then writes them to the file.
+    """
+    image, is_rgb = _as_base_array(image_data)
+    yx_shape = image.shape[:2] if is_rgb else image.shape[1:]
+    n_levels = n_pyramid_levels(yx_shape, tile_size)
+
+    pixel_nbytes = image.nbytes // int(np.prod(yx_shape))
+    level_nbytes = [
+        pixel_nbytes * (yx_shape[0] // 2**idx) * (yx_shape[1] // 2**idx)
+        for idx in range(n_levels)
+    ]
+
+    if file_writer == "ome.zarr":
+        return sum(level_nbytes)
+    return sum(level_nbytes) + sum(level_nbytes[1:])
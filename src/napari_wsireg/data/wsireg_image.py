@@ -29,6 +29,23 @@ class WsiRegImage(ABC):
     _pixel_spacing: Union[Tuple[int, int], Tuple[float, float]]
     _thumbnail_spacing: Optional[Union[Tuple[int, int], Tuple[float, float]]] = None
 
+    # only file headers have been read, pixel data is read by prepare_image_data
+    _header_only: bool = False
+
+    # indices of the channels read from the file, None when all are read
+    _channel_indices: Optional[List[int]] = None
+    _file_channels: Optional[Tuple[int, List[str], Optional[List[str]]]] = None
+
+    @property
+    def header_only(self) -> bool:
+        """Whether the reader has only parsed file headers and not read pixel data"""
+        return self._header_only
+
+    @property
+    def channel_indices(self) -> Optional[List[int]]:
+        """Indices of the channels of the file that are read, None when all are"""
+        return self._channel_indices
+
     @property
     def path(self) -> Union[str, Path]:
         return self._path
@@ -81,11 +98,58 @@ class WsiRegImage(ABC):
     def _get_dask_pyr(self) -> List[da.Array]:
         pass
 
+    def close(self) -> None:
+        """Release any file handles held by the reader"""
+        pass
+
     @abstractmethod
     def _get_thumbnail(self) -> da.Array:
         pass
 
-    def prepare_image_data(self):
+    def _set_channel_indices(self, channel_indices: Optional[List[int]]) -> None:
+        """Select the channels that are read, channel metadata follows the
+        selection. RGB images always read all their samples."""
+        if self._file_channels is None:
+            self._file_channels = (
+                self._n_ch,
+                self._channel_names,
+                getattr(self, "_channel_colors", None),
+            )
+        n_ch, channel_names, channel_colors = self._file_channels
+
+        if self._is_rgb or channel_indices is None:
+            channel_indices = None
+            selected = list(range(n_ch))
+        else:
+            selected = [int(i) for i in channel_indices]
+            if len(selected) == 0 or not all(0 <= i < n_ch for i in selected):
+                raise ValueError(
+                    f"channel_indices must select channels in [0, {n_ch}), "
+                    f"got {channel_indices}"
+                )
+
+        self._channel_indices = selected if channel_indices is not None else None
+        self._n_ch = len(selected)
+        if not self._is_rgb:
+            shape = list(self._shape)
+            shape[self._channel_axis] = self._n_ch
+            self._shape = tuple(shape)
+        if len(channel_names) == n_ch:
+            self._channel_names = [channel_names[i] for i in selected]
+        if channel_colors is not None and len(channel_colors) == n_ch:
+            self._channel_colors = [channel_colors[i] for i in selected]
+
+    def prepare_image_data(self, channel_indices: Optional[List[int]] = None):
+        """
+        Read the image pyramid and thumbnail
+
+        Parameters
+        ----------
+        channel_indices: list of int
+            indices of the channels to read, all channels by default,
+            ignored for RGB images
+        """
+        self._set_channel_indices(channel_indices)
         self._dask_pyr = self._get_dask_pyr()
         self._thumbnail = self._get_thumbnail()
 
@@ -94,6 +158,7 @@ class WsiRegImage(ABC):
             self._thumbnail = np.rollaxis(self._thumbnail, 0, 3)
 
         self._get_thumbnail_spacing()
+        self._header_only = False
 
     def _get_thumbnail_spacing(self) -> None:
         if self._thumbnail is not None and self._dask_pyr is not None:
@@ -0,0 +1,106 @@
+from pathlib import Path
+from typing import List
+
+import dask.array as da
+import zarr
+
+from napari_wsireg.data.readers import zarr_store_path
+from napari_wsireg.data.utils.image import compute_pyramid
+from napari_wsireg.data.utils.ngff import (
+    ngff_channel_metadata,
+    ngff_image_group,
+    ngff_multiscales,
+    ngff_xy_pixel_sizes,
+)
+from napari_wsireg.data.wsireg_image import WsiRegImage
+
+# OME-Zarr has no RGB notion, 8-bit red, green and blue channels are shown as RGB
+NGFF_RGB_COLORS = ["FF0000", "00FF00", "0000FF"]
+
+
+class ZarrWsiRegImage(WsiRegImage):
+    """
+    OME-Zarr (NGFF) multiscale image. Every level of the store is mapped lazily
+    to a dask array, no pixel data is copied. Time and z axes are read at their
+    first index.
+    """
+
+    def __init__(self, image_filepath: [str, Path], header_only: bool = False):
+        self._path = zarr_store_path(image_filepath)
+        self._header_only = header_only
+
+        # only JSON metadata is read until levels are indexed
+        self.root = zarr.open_group(str(self._path), mode="r")
+        self.group = ngff_image_group(self.root)
+        self.multiscales = ngff_multiscales(self.group)
+
+        self._get_dim_info()
+        self._pixel_spacing = ngff_xy_pixel_sizes(self.multiscales)
+        self._channel_names, self._channel_colors = ngff_channel_metadata(
+            self.group, self._n_ch
+        )
+        self._get_rgb_info()
+
+    def _get_dim_info(self) -> None:
+        base_shape = self.base_level.shape
+        self._shape = (int(base_shape[0]), int(base_shape[1]), int(base_shape[2]))
+        self._n_ch = self._shape[0]
+        self._channel_axis = 0
+        self._is_rgb = False
+        self._is_interleaved = False
+
+    def _get_rgb_info(self) -> None:
+        colors = [str(c).lstrip("#").upper()[:6] for c in self._channel_colors]
+        if self.base_level.dtype == "uint8" and colors == NGFF_RGB_COLORS:
+            # channels are stored planar, prepare_image_data interleaves them
+            self._is_rgb = True
+            self._channel_names = ["C01 - RGB"]
+
+    def _level_to_dask(self, path: str) -> da.Array:
+        """Lazy (C, Y, X) view of a level"""
+        axes = self.multiscales.axes
+        level = da.from_zarr(self.group[path])
+        level = level[tuple(slice(None) if a in "cyx" else 0 for a in axes)]
+        level_axes = [a for a in axes if a in "cyx"]
+        if "c" not in level_axes:
+            level = level[None]
+            level_axes = ["c", *level_axes]
+        order = [level_axes.index(a) for a in "cyx"]
+        # keep plain views of the store recognizable, see `find_backing_store`
+        return level if order == [0, 1, 2] else level.transpose(order)
+
+    @property
+    def base_level(self) -> da.Array:
+        """Lazy (C, Y, X) base level with all channels"""
+        return self._level_to_dask(self.multiscales.paths[0])
+
+    @property
+    def registration_level(self) -> da.Array:
+        """Lazy base level as wsireg reads arrays, (Y, X, 3) for RGB images"""
+        if self._is_rgb:
+            return da.moveaxis(self.base_level, 0, -1)
+        return self.base_level
+
+    @property
+    def thumbnail(self) -> da.Array:
+        # levels are mapped lazily, the thumbnail is taken from them on demand
+        if getattr(self, "_thumbnail", None) is None:
+            self.prepare_image_data(self._channel_indices)
+        return self._thumbnail
+
+    def _get_dask_pyr(self) -> List[da.Array]:
+        dask_pyr = [self._level_to_dask(p) for p in self.multiscales.paths]
+        if self._channel_indices is not None:
+            dask_pyr = [da.take(d, self._channel_indices, axis=0) for d in dask_pyr]
+        return dask_pyr
+
+    def _get_thumbnail(self) -> da.Array:
+        try:
+            if len(self._dask_pyr) > 1:
+                return self._dask_pyr[-1]
+            return compute_pyramid(
+                self._dask_pyr[0], 5, 512, False, self._dask_pyr[0].dtype
+            )[-1]
+        except AttributeError:
+            self.prepare_image_data(self._channel_indices)
+            return self._get_thumbnail()
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 
 from qtpy.QtGui import QDoubleValidator
 from qtpy.QtWidgets import (
@@ -14,11 +14,14 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
     QWidget,
 )
-from wsireg.parameter_maps.preprocessing import ImagePreproParams
 
-from napari_wsireg.data import CziWsiRegImage, TiffFileWsiRegImage
 from napari_wsireg.gui.setup_sub.preprocessing import PreprocessingControl
 
+if TYPE_CHECKING:
+    from wsireg.parameter_maps.preprocessing import ImagePreproParams
+
+    from napari_wsireg.data import CziWsiRegImage, TiffFileWsiRegImage
+
 
 class AddModality(QDialog):
     def __init__(
@@ -30,9 +33,9 @@ class AddModality(QDialog):
         mode: str = "load",
         attachment: bool = False,
         attachment_tags: Optional[List[str]] = None,
-        image_data: Optional[Union[CziWsiRegImage, TiffFileWsiRegImage]] = None,
+        image_data: Optional[Union["CziWsiRegImage", "TiffFileWsiRegImage"]] = None,
         image_spacings: Optional[Dict[str, Union[int, float]]] = None,
-        preprocessing: Optional[ImagePreproParams] = None,
+        preprocessing: Optional["ImagePreproParams"] = None,
         all_entities: List[str] = [],
     ):
         super().__init__(parent=parent)
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import TYPE_CHECKING, Dict
 from qtpy.QtWidgets import (
     QLabel,
     QAbstractItemView,
@@ -12,14 +12,16 @@ from qtpy.QtWidgets import (
 )
 from qtpy.QtGui import QColor
 from qtpy.QtCore import Qt
-from wsireg import WsiReg2D
+
+if TYPE_CHECKING:
+    from wsireg import WsiReg2D
 
 
 class QRegGraphListItem(QListWidgetItem):
     def __init__(
         self,
         queue_tag: str,
-        reg_graph: WsiReg2D,
+        reg_graph: "WsiReg2D",
         reg_options: Dict,
     ):
         super(QRegGraphListItem, self).__init__()
@@ -9,6 +9,7 @@ from napari_wsireg.gui.setup_sub.modality import ModalityControl
 from napari_wsireg.gui.setup_sub.paths import RegistrationPathControl
 from napari_wsireg.gui.setup_sub.preprocessing import PreprocessingControl
 from napari_wsireg.gui.setup_sub.project import ProjectControl
+from napari_wsireg.gui.setup_sub.resources import ResourceControl
 from napari_wsireg.gui.setup_sub.graph import RegGraphViewer
 from napari_wsireg.gui.queue import QueueControl
 
@@ -35,6 +36,7 @@ class SetupTab(QWidget):
         self.graph_view = RegGraphViewer()
         self.proj_ctrl = ProjectControl()
         self.queue_ctrl = QueueControl()
+        self.resource_ctrl = ResourceControl()
 
         self.layout().addWidget(wsireg_logo)
         self.layout().setAlignment(wsireg_logo, Qt.AlignCenter | Qt.AlignTop)
@@ -59,5 +61,10 @@ class SetupTab(QWidget):
 
         self.layout().addWidget(project_tabs)
         self.layout().setAlignment(project_tabs, Qt.AlignTop)
+
+        self.resource_collapse = QCollapsible(title="Resources")
+        self.resource_collapse.addWidget(self.resource_ctrl)
+        self.layout().addWidget(self.resource_collapse)
+        self.layout().setAlignment(self.resource_collapse, Qt.AlignTop)
         setup_layout.addStretch()
         setup_layout.setSpacing(10)
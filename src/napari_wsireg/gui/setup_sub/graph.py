@@ -1,10 +1,9 @@
+from typing import TYPE_CHECKING
+
 from qtpy.QtWidgets import QVBoxLayout, QWidget, QPushButton, QFormLayout, QComboBox
-import networkx as nx
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import matplotlib
-from matplotlib.patches import ArrowStyle
-from wsireg.wsireg2d import WsiReg2D
+
+if TYPE_CHECKING:
+    from wsireg.wsireg2d import WsiReg2D
 
 COLOR_MAP = [
     "#a6cee3",
@@ -21,20 +20,28 @@ COLOR_MAP = [
     "#b15928",
 ]
 
-matplotlib.use("Qt5Agg")
-
 
 # Adapted from https://github.com/BiAPoL/napari-clusters-plotter/blob/main/napari_clusters_plotter/_plotter.py # noqa: E501
 # then Adapted from https://github.com/haesleinhuepf/napari-workflow-inspector/blob/main/src/napari_workflow_inspector/_dock_widget.py # noqa: E501
-class MplCanvas(FigureCanvas):
-    def __init__(self, parent=None, width=3, height=2.25):
-        self.fig = Figure(figsize=(width, height))
-        # changing color of axis background to napari main window color
-        self.fig.patch.set_facecolor("#262930")
-        self.fig.tight_layout(pad=0)
-        self.axes = self.fig.add_subplot(111)
-
-        super(MplCanvas, self).__init__(self.fig)
+def create_mpl_canvas(width: float = 3, height: float = 2.25):
+    """
+    Matplotlib canvas of the graph plot, matplotlib is imported on the first
+    canvas rather than with the plugin
+    """
+    import matplotlib
+
+    matplotlib.use("Qt5Agg")
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(width, height))
+    # changing color of axis background to napari main window color
+    fig.patch.set_facecolor("#262930")
+    fig.tight_layout(pad=0)
+    canvas = FigureCanvas(fig)
+    canvas.fig = fig
+    canvas.axes = fig.add_subplot(111)
+    return canvas
 
 
 class RegGraphViewer(QWidget):
@@ -45,14 +52,10 @@ class RegGraphViewer(QWidget):
         self.refresh_graph = QPushButton("Refresh graph layout")
         main_layout.setSpacing(5)
 
-        self.graph_plot = MplCanvas()
-        self.graph_plot.axes.clear()
-        self.graph_plot.axes.axis("off")
-        self.graph_plot.axes.use_sticky_edges = True
-        self.graph_plot.axes.set_title(None)
-        self.graph_plot.axes.set_xlabel(None)
-        self.graph_plot.axes.set_ylabel(None)
-        # self.graph_plot.axes.margins()
+        # the canvas is created by the first plot, a placeholder holds its place
+        self.graph_plot = None
+        self._graph_placeholder = QWidget()
+        self._graph_placeholder.setMinimumHeight(225)
 
         self.setLayout(main_layout)
         form = QFormLayout()
@@ -68,10 +71,21 @@ class RegGraphViewer(QWidget):
 
         form.addRow(self.layout_box, self.refresh_graph)
 
-        self.layout().addWidget(self.graph_plot)
+        self.layout().addWidget(self._graph_placeholder)
         self.layout().addLayout(form)
 
-    def plot(self, plot_data: WsiReg2D):
+    def _create_graph_plot(self) -> None:
+        self.graph_plot = create_mpl_canvas()
+        self.layout().replaceWidget(self._graph_placeholder, self.graph_plot)
+        self._graph_placeholder.deleteLater()
+
+    def plot(self, plot_data: "WsiReg2D"):
+        if self.graph_plot is None:
+            self._create_graph_plot()
+
+        import networkx as nx
+        from matplotlib.patches import ArrowStyle
+
         self.graph_plot.axes.clear()
         self.graph_plot.axes.axis("off")
         self.graph_plot.axes.use_sticky_edges = True
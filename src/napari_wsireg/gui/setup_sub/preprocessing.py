@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional, List
+from typing import TYPE_CHECKING, Any, Dict, Optional, List
 
 from qtpy.QtWidgets import (
     QCheckBox,
@@ -16,7 +16,9 @@ from qtpy.QtWidgets import (
 )
 from qtpy.QtCore import Qt
 from superqt import QCollapsible
-from wsireg.parameter_maps.preprocessing import ImagePreproParams
+
+if TYPE_CHECKING:
+    from wsireg.parameter_maps.preprocessing import ImagePreproParams
 
 
 class QChannelItem(QListWidgetItem):
@@ -199,7 +201,7 @@ class PreprocessingControl(QGroupBox):
         return status
 
     def _import_data(
-        self, preprocessing_data: ImagePreproParams, channel_names: List[str]
+        self, preprocessing_data: "ImagePreproParams", channel_names: List[str]
     ) -> None:
         # boolean
         self.max_int_proj.setChecked(preprocessing_data.max_int_proj)
@@ -35,6 +35,10 @@ class ProjectControl(QWidget):
         self.image_writer = QComboBox()
         self.image_writer.addItem("OME-TIFF (by plane)")
         self.image_writer.addItem("OME-TIFF (by tile)")
+        # format napari layers are written to before registration
+        self.layer_writer = QComboBox()
+        self.layer_writer.addItem("OME-TIFF (pyramidal)")
+        self.layer_writer.addItem("OME-Zarr")
 
         self.orig_size_check.setChecked(False)
         self.non_reg_image_check.setChecked(True)
@@ -55,6 +59,7 @@ class ProjectControl(QWidget):
             "Write images to pre cropping size", self.orig_size_check
         )
         adv_opts_layout.addRow("Write non-transformed images", self.non_reg_image_check)
+        adv_opts_layout.addRow("napari layer format", self.layer_writer)
         adv_opts_layout.addRow(
             "Write merge and separate individual images",
             self.write_merge_and_indiv_check,
@@ -69,6 +74,9 @@ class ProjectControl(QWidget):
         self.write_config.setMinimumWidth(100)
         self.add_to_queue.setMinimumWidth(100)
         self.run_reg.setMinimumWidth(100)
+        # napari layers are written in the background before a graph runs
+        self.cancel_export = QPushButton("Cancel layer export")
+        self.cancel_export.setEnabled(False)
 
         action_layout.addWidget(self.write_config)
         action_layout.addWidget(self.add_to_queue)
@@ -77,3 +85,4 @@ class ProjectControl(QWidget):
         self.layout().addLayout(proj_entry_layout)
         self.layout().addWidget(adv_opts)
         self.layout().addLayout(action_layout)
+        self.layout().addWidget(self.cancel_export)
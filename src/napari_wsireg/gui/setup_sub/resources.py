@@ -0,0 +1,72 @@
+from typing import Optional
+
+from qtpy.QtCore import QTimer
+from qtpy.QtWidgets import (
+    QDoubleSpinBox,
+    QFormLayout,
+    QLabel,
+    QSpinBox,
+    QVBoxLayout,
+    QWidget,
+)
+
+from napari_wsireg.resources import ResourceManager, get_resource_manager
+
+GB = 1024**3
+
+
+class ResourceControl(QWidget):
+    """Shows and adjusts the thread and memory budget of the resource manager"""
+
+    def __init__(self, parent=None, manager: Optional[ResourceManager] = None):
+        super().__init__()
+        self.manager = manager if manager is not None else get_resource_manager()
+
+        main_layout = QVBoxLayout()
+        self.setLayout(main_layout)
+        budget_layout = QFormLayout()
+
+        self.n_threads = QSpinBox()
+        self.n_threads.setRange(1, 1024)
+        self.n_threads.setValue(self.manager.n_threads)
+
+        # 0 GB disables the memory limit
+        self.memory_gb = QDoubleSpinBox()
+        self.memory_gb.setRange(0, 1024**2)
+        self.memory_gb.setDecimals(1)
+        self.memory_gb.setSuffix(" GB")
+        self.memory_gb.setSpecialValueText("no limit")
+        self.memory_gb.setValue((self.manager.memory_bytes or 0) / GB)
+
+        self.usage_label = QLabel()
+
+        budget_layout.addRow("Threads", self.n_threads)
+        budget_layout.addRow("Memory", self.memory_gb)
+        budget_layout.addRow("In use", self.usage_label)
+        self.layout().addLayout(budget_layout)
+
+        self.n_threads.valueChanged.connect(self._set_budget)
+        self.memory_gb.valueChanged.connect(self._set_budget)
+
+        # grants are taken and released from worker threads, poll from the
+        # GUI thread rather than updating the label from a listener
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._update_usage)
+        self._timer.start(500)
+        self._update_usage()
+
+    def _set_budget(self) -> None:
+        self.manager.set_budget(
+            n_threads=self.n_threads.value(),
+            memory_bytes=int(self.memory_gb.value() * GB),
+        )
+        self._update_usage()
+
+    def _update_usage(self) -> None:
+        text = f"{self.manager.threads_in_use} / {self.manager.n_threads} threads"
+        if self.manager.memory_bytes is not None:
+            text += (
+                f", {self.manager.memory_in_use / GB:.1f} / "
+                f"{self.manager.memory_bytes / GB:.1f} GB"
+            )
+        self.usage_label.setText(text)
@@ -3,9 +3,23 @@ from typing import Optional, Union
 
 from qtpy.QtWidgets import QFileDialog, QWidget
 
+from napari_wsireg.data.readers import registered_readers
+
 PathLike = Union[str, Path]
 
 
+def image_file_types() -> str:
+    """File dialog filters of the image formats of the registered readers"""
+    format_filters, all_patterns = [], []
+    for spec in registered_readers():
+        patterns = [f"*{pattern}" for pattern in (*spec.suffixes, *spec.markers)]
+        format_filters.append(f"{spec.name} ({' '.join(patterns)})")
+        all_patterns.extend(p for p in patterns if p not in all_patterns)
+    return ";;".join(
+        [f"images ({' '.join(all_patterns)})", *format_filters, "All Files (*)"]
+    )
+
+
 def open_file_dialog(
     parent_widg: QWidget,
     single: bool = True,
@@ -16,17 +30,11 @@ def open_file_dialog(
 
     if data_type == "image":
         name = "Open registration image(s)..."
-        file_types = (
-            "images (*.tiff *.tif *.svs *.ndpi *.scn *.czi);;"
-            "Zeiss Czi (*.czi);;All Files (*)"
-        )
+        file_types = image_file_types()
 
     elif data_type == "attachment":
         name = "Open attachment image..."
-        file_types = (
-            "tifffile images (*.tiff *.tif *.svs *.ndpi *.scn *.czi);;"
-            "Zeiss Czi (*.czi);;All Files (*)"
-        )
+        file_types = image_file_types()
 
     elif data_type == "shape":
         name = "Open attachment shape data..."
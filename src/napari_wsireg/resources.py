@@ -0,0 +1,341 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import dask
+import dask.array as da
+
+# environment variables configuring the default budget
+MAX_THREADS_ENV = "NAPARI_WSIREG_MAX_THREADS"
+MAX_MEMORY_GB_ENV = "NAPARI_WSIREG_MAX_MEMORY_GB"
+
+# share of the thread budget a registration job asks for, elastix is
+# multithreaded and the rest is left to readers and writers
+REGISTRATION_THREAD_SHARE = 0.5
+
+
+def _physical_memory() -> Optional[int]:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _default_n_threads() -> int:
+    if os.environ.get(MAX_THREADS_ENV):
+        return max(int(os.environ[MAX_THREADS_ENV]), 1)
+    return multiprocessing.cpu_count()
+
+
+def _default_memory_bytes() -> Optional[int]:
+    if os.environ.get(MAX_MEMORY_GB_ENV):
+        return int(float(os.environ[MAX_MEMORY_GB_ENV]) * 1024**3)
+    physical_memory = _physical_memory()
+    return physical_memory // 2 if physical_memory else None
+
+
+class ResourceGrant:
+    """
+    Threads and memory granted by a ResourceManager, returned to the budget
+    on release or when leaving the context
+
+    Attributes
+    ----------
+    threads: int
+        number of threads the holder may run
+    memory_bytes: int
+        memory the holder may use
+    """
+
+    def __init__(self, manager: "ResourceManager", threads: int, memory_bytes: int):
+        self._manager = manager
+        self.threads = threads
+        self.memory_bytes = memory_bytes
+        self._released = False
+        # threads running work of the grant, their requests are nested
+        self._holder_threads: List[int] = []
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._manager._release(self)
+
+    def __enter__(self) -> "ResourceGrant":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+    def __repr__(self) -> str:
+        return (
+            f"ResourceGrant(threads={self.threads}, memory_bytes={self.memory_bytes})"
+        )
+
+
+class ResourceManager:
+    """
+    Process wide thread and memory budget shared by CZI decode pools, dask
+    computations and registration jobs. It also holds the pool decoding TIFF
+    tiles, sized to the thread budget.
+
+    Work requests a number of threads, and optionally the memory each thread
+    needs, and is granted as many as the remaining budget allows, down to
+    `min_threads`. Requests that cannot get `min_threads` wait for capacity to
+    be released, except when nothing else holds the budget so an oversized
+    request still makes progress. Requests without a timeout from a thread
+    holding a grant, or from the threads of `store`, are nested in work that
+    already holds threads and don't wait: they get what is left of the budget
+    or `min_threads`. Changing the budget does not revoke grants, it applies
+    to the following requests.
+
+    Parameters
+    ----------
+    n_threads: int
+        thread budget, defaults to $NAPARI_WSIREG_MAX_THREADS or the number of
+        CPUs
+    memory_bytes: int
+        memory budget, defaults to $NAPARI_WSIREG_MAX_MEMORY_GB or half of the
+        physical memory, None for no memory limit
+    """
+
+    def __init__(
+        self,
+        n_threads: Optional[int] = None,
+        memory_bytes: Optional[int] = None,
+    ):
+        self._configure_dask = False
+        self._condition = threading.Condition()
+        self._grants: List[ResourceGrant] = []
+        self._holders: Dict[int, int] = dict()
+        self._listeners: List[Callable[["ResourceManager"], None]] = []
+        self._n_threads = 1
+        self._memory_bytes: Optional[int] = None
+        self._decode_executor: Optional[ThreadPoolExecutor] = None
+        self._decode_executor_threads = 0
+        self.set_budget(
+            n_threads if n_threads is not None else _default_n_threads(),
+            memory_bytes if memory_bytes is not None else _default_memory_bytes(),
+        )
+
+    @property
+    def n_threads(self) -> int:
+        return self._n_threads
+
+    @property
+    def memory_bytes(self) -> Optional[int]:
+        return self._memory_bytes
+
+    @property
+    def threads_in_use(self) -> int:
+        with self._condition:
+            return sum(g.threads for g in self._grants)
+
+    @property
+    def memory_in_use(self) -> int:
+        with self._condition:
+            return sum(g.memory_bytes for g in self._grants)
+
+    @property
+    def n_grants(self) -> int:
+        with self._condition:
+            return len(self._grants)
+
+    def set_budget(
+        self, n_threads: Optional[int] = None, memory_bytes: Optional[int] = None
+    ) -> None:
+        """Change the budget, arguments left as None are unchanged"""
+        with self._condition:
+            if n_threads is not None:
+                self._n_threads = max(int(n_threads), 1)
+            if memory_bytes is not None:
+                self._memory_bytes = int(memory_bytes) if memory_bytes > 0 else None
+            if self._configure_dask:
+                dask.config.set(num_workers=self._n_threads)
+            self._condition.notify_all()
+        self._notify()
+
+    def configure_dask(self) -> None:
+        """
+        Cap the pool of dask's default threaded scheduler, used by napari to
+        read dask backed layers, to the thread budget, now and when the budget
+        changes. This sets dask's global config and is left to the plugin's
+        entry point.
+        """
+        with self._condition:
+            self._configure_dask = True
+            dask.config.set(num_workers=self._n_threads)
+
+    def add_listener(self, callback: Callable[["ResourceManager"], None]) -> None:
+        """Call `callback` with the manager when the budget or its use changes,
+        it may be called from any thread"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[["ResourceManager"], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self) -> None:
+        for callback in list(self._listeners):
+            callback(self)
+
+    def _n_grantable(self, threads: int, memory_per_thread: int) -> int:
+        free_threads = self._n_threads - sum(g.threads for g in self._grants)
+        n = min(threads, free_threads)
+        if memory_per_thread > 0 and self._memory_bytes is not None:
+            free_memory = self._memory_bytes - sum(g.memory_bytes for g in self._grants)
+            n = min(n, free_memory // memory_per_thread)
+        return max(n, 0)
+
+    def request(
+        self,
+        threads: int = 1,
+        memory_per_thread: int = 0,
+        min_threads: int = 1,
+        timeout: Optional[float] = None,
+    ) -> ResourceGrant:
+        """
+        Request threads from the budget
+
+        Parameters
+        ----------
+        threads: int
+            number of threads wanted
+        memory_per_thread: int
+            memory in bytes each granted thread needs
+        min_threads: int
+            smallest grant that is useful, fewer threads are granted when
+            the budget is partly held by other work
+        timeout: float
+            seconds to wait for `min_threads` to become available,
+            waits indefinitely by default, or not at all for nested requests
+
+        Returns
+        -------
+        grant: ResourceGrant
+            granted capacity, to be released once the work is done
+
+        Raises
+        ------
+        TimeoutError
+            if `min_threads` did not become available within `timeout`
+        """
+        threads = max(int(threads), 1)
+        min_threads = min(max(int(min_threads), 1), threads)
+
+        with self._condition:
+            # waiting in work holding the budget would wait for itself
+            nested = timeout is None and self._holders.get(threading.get_ident(), 0) > 0
+
+            def available() -> bool:
+                return (
+                    nested
+                    or len(self._grants) == 0
+                    or self._n_grantable(threads, memory_per_thread) >= min_threads
+                )
+
+            if not self._condition.wait_for(available, timeout=timeout):
+                raise TimeoutError(
+                    f"{min_threads} thread(s) did not become available "
+                    f"within {timeout} s"
+                )
+
+            n = max(self._n_grantable(threads, memory_per_thread), min_threads)
+            grant = ResourceGrant(self, n, n * memory_per_thread)
+            self._grants.append(grant)
+            self._hold(grant, threading.get_ident())
+
+        self._notify()
+        return grant
+
+    def _hold(self, grant: ResourceGrant, thread_id: int) -> None:
+        with self._condition:
+            grant._holder_threads.append(thread_id)
+            self._holders[thread_id] = self._holders.get(thread_id, 0) + 1
+
+    def _release(self, grant: ResourceGrant) -> None:
+        with self._condition:
+            self._grants.remove(grant)
+            for thread_id in grant._holder_threads:
+                self._holders[thread_id] -= 1
+                if self._holders[thread_id] == 0:
+                    self._holders.pop(thread_id)
+            self._condition.notify_all()
+        self._notify()
+
+    def store(
+        self,
+        sources: Sequence[da.Array],
+        targets: Sequence[Any],
+        threads: Optional[int] = None,
+        memory_per_thread: int = 0,
+        **kwargs,
+    ) -> None:
+        """
+        da.store using threads granted from the budget
+
+        Parameters
+        ----------
+        sources: list of da.Array
+            arrays to store
+        targets: list of array-like
+            arrays to store into
+        threads: int
+            number of threads wanted, the whole budget by default
+        memory_per_thread: int
+            memory in bytes each thread needs, e.g. the size of the chunks
+            it holds
+        kwargs
+            passed to da.store
+        """
+        if threads is None:
+            threads = self._n_threads
+        with self.request(threads, memory_per_thread) as grant:
+            # the store's threads work for the grant, their requests are nested
+            with ThreadPoolExecutor(
+                grant.threads,
+                thread_name_prefix="napari-wsireg-store",
+                initializer=lambda: self._hold(grant, threading.get_ident()),
+            ) as pool:
+                da.store(sources, targets, scheduler="threads", pool=pool, **kwargs)
+
+    def decode_executor(self) -> ThreadPoolExecutor:
+        """
+        Shared pool decoding compressed image segments, with as many threads
+        as the budget. The pool does not hold threads of the budget, work is
+        submitted with a grant and keeps to its granted threads. A pool of the
+        previous size finishes its queued work when the budget changes.
+        """
+        with self._condition:
+            if self._decode_executor_threads != self._n_threads:
+                previous_executor = self._decode_executor
+                self._decode_executor = ThreadPoolExecutor(
+                    self._n_threads, thread_name_prefix="napari-wsireg-decode"
+                )
+                self._decode_executor_threads = self._n_threads
+                if previous_executor is not None:
+                    previous_executor.shutdown(wait=False)
+            return self._decode_executor
+
+    def registration_grant(self) -> ResourceGrant:
+        """
+        Grant for a registration job, native ITK threads of SimpleITK are limited
+        to the granted threads
+        """
+        threads = max(int(self._n_threads * REGISTRATION_THREAD_SHARE), 1)
+        grant = self.request(threads)
+        try:
+            import SimpleITK as sitk
+
+            sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(grant.threads)
+        except ImportError:
+            pass
+        return grant
+
+
+@lru_cache(maxsize=None)
+def get_resource_manager() -> ResourceManager:
+    """Process wide resource manager configured from the environment"""
+    return ResourceManager()